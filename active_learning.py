@@ -0,0 +1,333 @@
+"""
+Active Learning for AI Handwriting Recognition System
+Streams low-confidence / high-entropy production predictions into a bounded,
+deduplicated on-disk labeling queue, and fine-tunes handwriting_model.h5 on
+the relabeled samples plus a replay buffer instead of retraining from scratch
+"""
+
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+import numpy as np
+import cv2
+
+from config import ACTIVE_LEARNING_CONFIG, MODEL_CONFIG, PERFORMANCE_CONFIG
+
+NUM_CLASSES = 10
+
+
+def uncertainty(probs):
+    """(confidence, entropy chuẩn hóa về [0, 1]) của một vector xác suất"""
+    probs = np.clip(np.asarray(probs, dtype=np.float64).ravel(), 1e-12, 1.0)
+    entropy = float(-(probs * np.log(probs)).sum() / np.log(len(probs)))
+    return float(probs.max()), entropy
+
+
+class LabelingQueue:
+    """Hàng đợi gán nhãn: ảnh 28x28 lưu dạng PNG trong queue_dir/images.
+
+    Chỉ mục gồm snapshot queue.json và nhật ký queue.log (mỗi dòng một thao tác thêm / loại mẫu).
+    offer() chỉ ghi thêm một dòng vào nhật ký; snapshot được ghi lại khi gán nhãn, khi consume
+    hoặc khi nhật ký dài hơn hàng đợi, nên chi phí ghi đĩa mỗi mẫu không tăng theo kích thước hàng đợi.
+    Khi đầy, mẫu mới chỉ được nhận nếu không chắc chắn hơn mẫu chưa gán nhãn "dễ" nhất (mẫu đó bị loại).
+    """
+
+    def __init__(self, queue_dir=None, max_size=None):
+        cfg = ACTIVE_LEARNING_CONFIG
+        self.queue_dir = queue_dir or cfg["queue_dir"]
+        self.max_size = max_size or cfg["max_queue_size"]
+        self.images_dir = os.path.join(self.queue_dir, "images")
+        self.done_dir = os.path.join(self.queue_dir, "done")
+        self.index_path = os.path.join(self.queue_dir, "queue.json")
+        self.journal_path = os.path.join(self.queue_dir, "queue.log")
+        self._lock = threading.Lock()
+        self._journal_entries = 0
+
+        self.items = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.items = json.load(f)
+        torn_journal = self._replay_journal()
+
+        # pHash của các mẫu trong một mảng cố định; hàng trống được đánh dấu trong _occupied
+        self._rows = {}
+        self._phashes = None
+        self._occupied = None
+        for item in self.items:
+            self._index_hash(item["key"], np.frombuffer(bytes.fromhex(item["phash"]), dtype=np.uint8))
+        if torn_journal:
+            # Dòng cuối bị ghi dở khi process dừng: ghi lại snapshot để lần ghi thêm sau không nối vào dòng hỏng
+            self._save_index()
+
+    def __len__(self):
+        return len(self.items)
+
+    def _image_path(self, key, directory=None):
+        return os.path.join(directory or self.images_dir, f"{key}.png")
+
+    def _replay_journal(self):
+        """Áp các thao tác trong queue.log lên snapshot; trả về True nếu dòng cuối bị ghi dở"""
+        if not os.path.exists(self.journal_path):
+            return False
+        by_key = {item["key"]: item for item in self.items}
+        torn = False
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    torn = True
+                    continue
+                # Snapshot có thể đã chứa thao tác này (dừng giữa lúc ghi snapshot và xóa nhật ký)
+                op = entry.pop("op")
+                if op == "add" and entry["key"] not in by_key:
+                    self.items.append(entry)
+                    by_key[entry["key"]] = entry
+                elif op == "remove" and entry["key"] in by_key:
+                    self.items.remove(by_key.pop(entry["key"]))
+                self._journal_entries += 1
+                torn = not line.endswith("\n")
+        return torn
+
+    def _index_hash(self, key, phash):
+        if self._phashes is None:
+            capacity = max(self.max_size, len(self.items), 1)
+            self._phashes = np.zeros((capacity, len(phash)), dtype=np.uint8)
+            self._occupied = np.zeros(capacity, dtype=bool)
+        elif self._occupied.all():
+            self._phashes = np.concatenate([self._phashes, np.zeros_like(self._phashes)])
+            self._occupied = np.concatenate([self._occupied, np.zeros_like(self._occupied)])
+        row = int(np.argmin(self._occupied))
+        self._phashes[row] = phash
+        self._occupied[row] = True
+        self._rows[key] = row
+
+    def _is_near_duplicate(self, phash, max_distance):
+        if not self._rows:
+            return False
+        from dedup import hamming
+        return hamming(self._phashes[self._occupied], phash[None]).min() <= max_distance
+
+    def _append_journal(self, entries):
+        """Ghi thêm thao tác vào queue.log; gộp thành snapshot khi nhật ký dài hơn hàng đợi (chi phí trung bình O(1))"""
+        os.makedirs(self.queue_dir, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._journal_entries += len(entries)
+        if self._journal_entries > max(len(self.items), 100):
+            self._save_index()
+
+    def _save_index(self):
+        """Ghi snapshot đầy đủ (file tạm rồi rename) và xóa nhật ký đã được gộp vào"""
+        os.makedirs(self.queue_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_entries = 0
+
+    def offer(self, image, probs):
+        """Đưa một ảnh đã tiền xử lý (28x28, [0, 1]) vào hàng đợi nếu đủ "khó"; trả về True nếu được nhận"""
+        from dedup import perceptual_hashes
+
+        cfg = ACTIVE_LEARNING_CONFIG
+        confidence, entropy = uncertainty(probs)
+        if confidence >= PERFORMANCE_CONFIG["confidence_threshold"] and entropy <= cfg["entropy_threshold"]:
+            return False
+
+        pixels = np.rint(np.asarray(image, dtype=np.float32).reshape(28, 28) * 255).astype(np.uint8)
+        key = hashlib.blake2b(pixels.tobytes(), digest_size=8).hexdigest()
+        phash = perceptual_hashes(pixels[None])[0]
+        score = max(1.0 - confidence, entropy)
+
+        with self._lock:
+            if key in self._rows or self._is_near_duplicate(phash, cfg["near_duplicate_distance"]):
+                return False
+
+            journal = []
+            if len(self.items) >= self.max_size:
+                unlabeled = [item for item in self.items if item["label"] is None]
+                easiest = min(unlabeled, key=lambda item: item["uncertainty"], default=None)
+                if easiest is None or easiest["uncertainty"] >= score:
+                    return False
+                self._remove(easiest, delete=True)
+                journal.append({"op": "remove", "key": easiest["key"]})
+
+            os.makedirs(self.images_dir, exist_ok=True)
+            cv2.imwrite(self._image_path(key), pixels)
+            item = {
+                "key": key,
+                "phash": phash.tobytes().hex(),
+                "predicted": int(np.argmax(probs)),
+                "confidence": confidence,
+                "entropy": entropy,
+                "uncertainty": score,
+                "label": None,
+                "queued_at": time.time()
+            }
+            self.items.append(item)
+            self._index_hash(key, phash)
+            self._append_journal(journal + [dict(item, op="add")])
+        return True
+
+    def _remove(self, item, delete=False):
+        self.items.remove(item)
+        self._occupied[self._rows.pop(item["key"])] = False
+        path = self._image_path(item["key"])
+        if delete:
+            os.remove(path)
+        else:
+            os.makedirs(self.done_dir, exist_ok=True)
+            os.replace(path, self._image_path(item["key"], self.done_dir))
+
+    def export_for_labeling(self, csv_path):
+        """CSV các mẫu chưa có nhãn (khó nhất trước); người gán nhãn điền cột 'label'"""
+        pending = sorted((item for item in self.items if item["label"] is None),
+                         key=lambda item: -item["uncertainty"])
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["key", "image", "predicted", "confidence", "label"])
+            for item in pending:
+                writer.writerow([item["key"], self._image_path(item["key"]), item["predicted"],
+                                 f"{item['confidence']:.4f}", ""])
+        return len(pending)
+
+    def import_labels(self, csv_path):
+        """Đọc lại CSV đã gán nhãn (cột key, label); trả về số mẫu được gán nhãn"""
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            labels = {row["key"]: int(row["label"]) for row in csv.DictReader(f)
+                      if row.get("label", "").strip() != ""}
+        with self._lock:
+            count = 0
+            for item in self.items:
+                if item["key"] in labels and 0 <= labels[item["key"]] < NUM_CLASSES:
+                    item["label"] = labels[item["key"]]
+                    count += 1
+            self._save_index()
+        return count
+
+    def labeled(self):
+        """(items, x (N, 28, 28, 1) float32, y) của các mẫu đã có nhãn"""
+        items = [item for item in self.items if item["label"] is not None]
+        x = np.empty((len(items), 28, 28, 1), dtype=np.float32)
+        for i, item in enumerate(items):
+            x[i, ..., 0] = cv2.imread(self._image_path(item["key"]), cv2.IMREAD_GRAYSCALE) / 255.0
+        y = np.array([item["label"] for item in items], dtype=np.int64)
+        return items, x, y
+
+    def consume(self, items):
+        """Chuyển các mẫu đã dùng để fine-tune sang queue_dir/done"""
+        with self._lock:
+            for item in items:
+                self._remove(item)
+            self._save_index()
+
+
+_queue = None
+
+
+def offer_prediction(image, probs):
+    """Điểm nối cho predict.py / gui.py: lỗi ghi đĩa hay chỉ mục hỏng không được làm hỏng việc dự đoán"""
+    global _queue
+    if not ACTIVE_LEARNING_CONFIG["enabled"]:
+        return False
+    try:
+        if _queue is None:
+            _queue = LabelingQueue()
+        return _queue.offer(image, probs)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not queue sample for labeling: {e}")
+        return False
+
+
+def fine_tune(queue=None, model_path=None, epochs=None, seed=None):
+    """Fine-tune model hiện tại trên các mẫu đã gán nhãn + replay buffer từ MNIST; trả về thông tin vòng"""
+    import tensorflow as tf
+    from dataset_loader import load_mnist_cached
+    from streaming_eval import evaluate_mnist
+
+    cfg = ACTIVE_LEARNING_CONFIG
+    queue = queue or LabelingQueue()
+    model_path = model_path or MODEL_CONFIG["model_file"]
+    epochs = epochs or cfg["fine_tune_epochs"]
+
+    items, x_new, y_new = queue.labeled()
+    if not items:
+        print("ℹ️ No labeled samples in the queue")
+        return None
+
+    start = time.perf_counter()
+    (x_train, y_train), _ = load_mnist_cached()
+    rng = np.random.default_rng(seed)
+    replay = np.sort(rng.choice(len(y_train), min(cfg["replay_size"], len(y_train)), replace=False))
+    x = np.concatenate([x_new, np.asarray(x_train[replay])])
+    y = np.concatenate([y_new, np.asarray(y_train[replay])])
+
+    model = tf.keras.models.load_model(model_path, compile=False)
+    accuracy_before = evaluate_mnist(model).result()["test_accuracy"]
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=cfg["fine_tune_learning_rate"]),
+                  loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+    print(f"🔁 Fine-tuning on {len(items)} new + {len(replay)} replay samples for {epochs} epochs...")
+    model.fit(x, y, epochs=epochs, batch_size=cfg["batch_size"], shuffle=True, verbose=1)
+    accuracy_after = evaluate_mnist(model).result()["test_accuracy"]
+
+    # Ghi file tạm rồi thay thế để tiến trình khác không bao giờ đọc phải model dở dang
+    tmp_path = model_path + ".tmp.h5"
+    model.save(tmp_path)
+    os.replace(tmp_path, model_path)
+    queue.consume(items)
+
+    cycle = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "new_samples": len(items),
+        "replay_samples": len(replay),
+        "epochs": epochs,
+        "fine_tune_seconds": round(time.perf_counter() - start, 2),
+        "cycle_seconds": round(time.time() - min(item["queued_at"] for item in items), 2),
+        "accuracy_before": accuracy_before,
+        "accuracy_after": accuracy_after
+    }
+    log_path = cfg["cycle_log"]
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    write_header = not os.path.exists(log_path)
+    with open(log_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(cycle))
+        if write_header:
+            writer.writeheader()
+        writer.writerow(cycle)
+
+    print(f"✅ Round done in {cycle['fine_tune_seconds']:.1f}s (cycle {cycle['cycle_seconds'] / 3600:.1f}h since "
+          f"first queued sample), accuracy {accuracy_before:.4f} -> {accuracy_after:.4f}")
+    return cycle
+
+
+def main():
+    """Quản lý hàng đợi gán nhãn từ command line"""
+    parser = argparse.ArgumentParser(description="Active-learning labeling queue")
+    parser.add_argument("--export", metavar="CSV", help="Write unlabeled samples to a CSV for labeling")
+    parser.add_argument("--import-labels", metavar="CSV", help="Read labels back from a labeled CSV")
+    parser.add_argument("--fine-tune", action="store_true", help="Fine-tune the model on labeled samples")
+    args = parser.parse_args()
+
+    queue = LabelingQueue()
+    if args.import_labels:
+        print(f"🏷️ {queue.import_labels(args.import_labels)} samples labeled")
+    if args.export:
+        print(f"📝 {queue.export_for_labeling(args.export)} samples written to {args.export}")
+    if args.fine_tune:
+        fine_tune(queue)
+
+    labeled = sum(item["label"] is not None for item in queue.items)
+    print(f"📥 Queue: {len(queue)} samples ({labeled} labeled), capacity {queue.max_size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Inference Artifacts for AI Handwriting Recognition System
+Saves inference-only copies of handwriting_model.h5 (no optimizer state) in
+several formats with a manifest of hashes, shapes and metrics, measures the
+cold-start cost of each format in fresh processes and loads the fastest one
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+from config import ARTIFACTS_CONFIG, MODEL_CONFIG
+
+MANIFEST_FILE = "manifest.json"
+ARTIFACT_PATHS = {
+    "savedmodel": "savedmodel",
+    "keras": "model.keras",
+    "h5": "model_inference.h5",
+    "weights": "model.weights.h5"
+}
+
+
+def file_sha256(path):
+    """SHA-256 của một file hoặc cả thư mục (SavedModel)"""
+    digest = hashlib.sha256()
+    files = ([os.path.join(root, f) for root, _, names in os.walk(path) for f in sorted(names)]
+             if os.path.isdir(path) else [path])
+    for name in sorted(files):
+        digest.update(os.path.relpath(name, path).encode() if os.path.isdir(path) else b"")
+        with open(name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+
+class SavedModelRunner:
+    """Bọc SavedModel đã tải để gọi như model Keras: runner(x, training=False) -> tf.Tensor"""
+
+    def __init__(self, loaded, input_shape):
+        self.loaded = loaded
+        self.input_shape = tuple(input_shape)
+
+    def __call__(self, images, training=False):
+        import tensorflow as tf
+        return self.loaded.serve(tf.convert_to_tensor(images, dtype=tf.float32))
+
+    def predict(self, images, verbose=0):
+        return self(images).numpy()
+
+
+def save_artifacts(model_path=None, artifacts_dir=None, formats=None, evaluate=True):
+    """Lưu model ở các định dạng chỉ dùng cho suy luận và ghi manifest"""
+    import tensorflow as tf
+
+    model_path = model_path or MODEL_CONFIG["model_file"]
+    artifacts_dir = artifacts_dir or ARTIFACTS_CONFIG["artifacts_dir"]
+    formats = formats or ARTIFACTS_CONFIG["formats"]
+    os.makedirs(artifacts_dir, exist_ok=True)
+
+    # compile=False: không dựng lại optimizer / loss, model lưu ra không mang optimizer state
+    model = tf.keras.models.load_model(model_path, compile=False)
+    input_shape = [None] + list(model.input_shape[1:])
+
+    for fmt in formats:
+        path = os.path.join(artifacts_dir, ARTIFACT_PATHS[fmt])
+        if fmt == "savedmodel":
+            module = tf.Module()
+            module.model = model
+            module.serve = tf.function(lambda x: model(x, training=False),
+                                       input_signature=[tf.TensorSpec(input_shape, tf.float32)])
+            tf.saved_model.save(module, path, signatures={"serving_default": module.serve})
+        elif fmt == "keras":
+            model.save(path)
+        elif fmt == "h5":
+            model.save(path, include_optimizer=False)
+        elif fmt == "weights":
+            model.save_weights(path)
+            with open(os.path.join(artifacts_dir, "architecture.json"), "w") as f:
+                f.write(model.to_json())
+        else:
+            raise ValueError(f"Unknown artifact format: {fmt}")
+
+    metrics = {}
+    if evaluate:
+        from streaming_eval import evaluate_mnist
+        result = evaluate_mnist(model).result()
+        metrics = {"test_accuracy": result["test_accuracy"], "test_loss": result["test_loss"]}
+
+    manifest = {
+        "source_model": model_path,
+        "source_sha256": file_sha256(model_path),
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "input_shape": input_shape,
+        "output_shape": [None] + list(model.output_shape[1:]),
+        "parameters": model.count_params(),
+        "metrics": metrics,
+        "artifacts": {fmt: {"path": ARTIFACT_PATHS[fmt],
+                            "sha256": file_sha256(os.path.join(artifacts_dir, ARTIFACT_PATHS[fmt])),
+                            "size_bytes": _path_size(os.path.join(artifacts_dir, ARTIFACT_PATHS[fmt]))}
+                      for fmt in formats}
+    }
+    write_manifest(artifacts_dir, manifest)
+    return manifest
+
+
+def read_manifest(artifacts_dir=None):
+    artifacts_dir = artifacts_dir or ARTIFACTS_CONFIG["artifacts_dir"]
+    with open(os.path.join(artifacts_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(artifacts_dir, manifest):
+    path = os.path.join(artifacts_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def load_artifact(artifacts_dir, fmt, manifest=None):
+    """Tải một định dạng cụ thể; model trả về gọi được như model Keras"""
+    import tensorflow as tf
+
+    manifest = manifest or read_manifest(artifacts_dir)
+    path = os.path.join(artifacts_dir, manifest["artifacts"][fmt]["path"])
+    if fmt == "savedmodel":
+        return SavedModelRunner(tf.saved_model.load(path), manifest["input_shape"])
+    if fmt == "weights":
+        with open(os.path.join(artifacts_dir, "architecture.json")) as f:
+            model = tf.keras.models.model_from_json(f.read())
+        model.load_weights(path)
+        return model
+    return tf.keras.models.load_model(path, compile=False)
+
+
+def load_fastest(artifacts_dir=None):
+    """Tải artifact có cold start nhanh nhất đã đo (hoặc theo thứ tự ưu tiên trong config).
+
+    Trả về (model, format); RuntimeError nếu artifact không khớp SHA-256 của model nguồn.
+    """
+    artifacts_dir = artifacts_dir or ARTIFACTS_CONFIG["artifacts_dir"]
+    manifest = read_manifest(artifacts_dir)
+    source = manifest["source_model"]
+    # So theo nội dung chứ không theo mtime: os.replace / copy2 (ví dụ khi promote model) giữ nguyên mtime cũ
+    if os.path.exists(source) and file_sha256(source) != manifest["source_sha256"]:
+        raise RuntimeError(f"Artifacts in {artifacts_dir} were built from a different {source}; re-run artifacts.py")
+
+    preference = ARTIFACTS_CONFIG["formats"]
+
+    def cold_start(fmt):
+        # Thời gian import TensorFlow như nhau cho mọi định dạng nên chỉ so load + dự đoán đầu tiên
+        measured = manifest["artifacts"][fmt].get("cold_start_ms")
+        return measured["load"] + measured["first_predict"] if measured else float("inf")
+
+    candidates = sorted(manifest["artifacts"], key=lambda fmt: (
+        cold_start(fmt), preference.index(fmt) if fmt in preference else len(preference)))
+    for fmt in candidates:
+        if os.path.exists(os.path.join(artifacts_dir, manifest["artifacts"][fmt]["path"])):
+            return load_artifact(artifacts_dir, fmt, manifest), fmt
+    raise FileNotFoundError(f"No artifact files found in {artifacts_dir}")
+
+
+def load_inference_model(model_path=None):
+    """Model cho suy luận: artifact nhanh nhất nếu có và còn mới, ngược lại đọc file .h5 gốc"""
+    import tensorflow as tf
+
+    model_path = model_path or MODEL_CONFIG["model_file"]
+    artifacts_dir = ARTIFACTS_CONFIG["artifacts_dir"]
+    if model_path == MODEL_CONFIG["model_file"] and os.path.exists(os.path.join(artifacts_dir, MANIFEST_FILE)):
+        try:
+            return load_fastest(artifacts_dir)[0]
+        except (RuntimeError, FileNotFoundError) as e:
+            print(f"⚠️ {e}")
+    return tf.keras.models.load_model(model_path, compile=False)
+
+
+_COLD_START_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repo!r})
+import numpy as np
+import tensorflow as tf
+imported = time.perf_counter()
+from artifacts import load_artifact
+model = load_artifact({artifacts_dir!r}, {fmt!r})
+loaded = time.perf_counter()
+np.asarray(model(np.zeros((1, 28, 28, 1), dtype=np.float32), training=False))
+predicted = time.perf_counter()
+print(json.dumps({{"import": (imported - start) * 1000, "load": (loaded - imported) * 1000,
+                  "first_predict": (predicted - loaded) * 1000, "total": (predicted - start) * 1000}}))
+"""
+
+
+def benchmark_cold_start(artifacts_dir=None, runs=None, include_original=True):
+    """Đo import / load / dự đoán đầu tiên của từng định dạng trong process mới; ghi median vào manifest"""
+    artifacts_dir = artifacts_dir or ARTIFACTS_CONFIG["artifacts_dir"]
+    runs = runs or ARTIFACTS_CONFIG["cold_start_runs"]
+    manifest = read_manifest(artifacts_dir)
+    repo = os.path.dirname(os.path.abspath(__file__))
+
+    def measure(script):
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+            samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        return {key: float(np.median([s[key] for s in samples])) for key in samples[0]}
+
+    results = {}
+    if include_original:
+        # Đường cũ: load_model mặc định (compile=True, dựng lại optimizer)
+        original = _COLD_START_SCRIPT.replace(
+            "from artifacts import load_artifact\nmodel = load_artifact({artifacts_dir!r}, {fmt!r})",
+            "model = tf.keras.models.load_model({source!r})")
+        results["original_h5"] = measure(original.format(repo=repo, source=os.path.abspath(manifest["source_model"])))
+    for fmt in manifest["artifacts"]:
+        results[fmt] = measure(_COLD_START_SCRIPT.format(repo=repo, artifacts_dir=os.path.abspath(artifacts_dir),
+                                                         fmt=fmt))
+        manifest["artifacts"][fmt]["cold_start_ms"] = results[fmt]
+    write_manifest(artifacts_dir, manifest)
+    return results
+
+
+def main():
+    """Tạo artifact, đo cold start và in bảng so sánh"""
+    parser = argparse.ArgumentParser(description="Inference-only model artifacts and cold-start benchmark")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--artifacts-dir", default=None)
+    parser.add_argument("--no-eval", action="store_true", help="Skip test-set metrics in the manifest")
+    parser.add_argument("--runs", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = save_artifacts(args.model, args.artifacts_dir, evaluate=not args.no_eval)
+    print(f"💾 {len(manifest['artifacts'])} artifacts saved in {time.perf_counter() - start:.1f}s")
+
+    results = benchmark_cold_start(args.artifacts_dir, args.runs)
+    print(f"\n{'Format':<12} {'Size MB':>8} {'Import ms':>10} {'Load ms':>9} {'1st pred ms':>12} {'Total ms':>9}")
+    for fmt, r in sorted(results.items(), key=lambda item: item[1]["load"] + item[1]["first_predict"]):
+        size = manifest["artifacts"][fmt]["size_bytes"] / 1024 / 1024 if fmt in manifest["artifacts"] else \
+            os.path.getsize(manifest["source_model"]) / 1024 / 1024
+        print(f"{fmt:<12} {size:>8.2f} {r['import']:>10.0f} {r['load']:>9.0f} {r['first_predict']:>12.0f} "
+              f"{r['total']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Asyncio Prediction API for AI Handwriting Recognition System
+AsyncPredictor keeps a warm model on a dedicated executor thread and
+coalesces concurrent awaiters into batches without blocking the event loop
+"""
+
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config import ASYNC_CONFIG, MODEL_CONFIG
+
+
+class AsyncPredictor:
+    """Dùng trong event loop:
+
+        async with AsyncPredictor() as predictor:
+            result = await predictor.predict(image_bytes)
+    """
+
+    def __init__(self, model_path=None, max_batch_size=None, max_wait_ms=None, max_in_flight=None):
+        cfg = ASYNC_CONFIG
+        self.model_path = model_path or MODEL_CONFIG["model_file"]
+        self.max_batch_size = max_batch_size or cfg["max_batch_size"]
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else cfg["max_wait_ms"]) / 1000
+        self.max_in_flight = max_in_flight or cfg["max_in_flight"]
+        self.model = None
+        # Một thread duy nhất sở hữu model: không tranh chấp, không chặn event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-predictor")
+        self._queue = None
+        self._semaphore = None
+        self._batcher = None
+        self._stats = {"requests": 0, "batches": 0, "cancelled": 0}
+
+    @property
+    def stats(self):
+        """Bộ đếm request / batch; kèm report() của shadow (shadow.py) khi model đang được shadow"""
+        report = getattr(self.model, "report", None)
+        return dict(self._stats, shadow=report()) if report else dict(self._stats)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        """Import TensorFlow, tải model và warm-up trên executor rồi khởi động batcher"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        await loop.run_in_executor(self._executor, self._load_model)
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    def _load_model(self):
+        from artifacts import load_inference_model
+        from compiled_inference import compile_for_inference
+        from shadow import with_shadow
+        # Batch có kích thước thay đổi liên tục: bucket tránh retrace, warm-up chạy ngay khi tải
+        self.model = with_shadow(compile_for_inference(load_inference_model(self.model_path)), self.model_path)
+
+    async def close(self):
+        """Dừng batcher, huỷ các request còn chờ và giải phóng executor"""
+        if self._batcher:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+        while self._queue and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+        self._executor.shutdown(wait=False)
+        # Dừng thread shadow và ghi report cuối cùng
+        close_shadow = getattr(self.model, "close", None)
+        if close_shadow:
+            close_shadow()
+
+    async def predict(self, image, timeout=None):
+        """Dự đoán một ảnh (bytes đã mã hóa, memoryview hoặc mảng 28x28 đã tiền xử lý).
+
+        Trả về {"digit", "confidence", "probabilities"}; raise asyncio.TimeoutError khi quá timeout.
+        """
+        if self._batcher is None:
+            raise RuntimeError("AsyncPredictor.start() must be awaited first")
+        timeout = ASYNC_CONFIG["default_timeout"] if timeout is None else timeout
+
+        async with self._semaphore:
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((image, future))
+            self._stats["requests"] += 1
+            # wait_for huỷ future khi timeout / khi caller bị cancel -> batcher sẽ bỏ qua
+            return await asyncio.wait_for(future, timeout)
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Bỏ các request đã bị huỷ hoặc timeout trước khi tốn compute
+            live = [(image, future) for image, future in batch if not future.done()]
+            self._stats["cancelled"] += len(batch) - len(live)
+            if not live:
+                continue
+
+            images = [image for image, _ in live]
+            try:
+                results = await loop.run_in_executor(self._executor, self._run_batch, images)
+            except Exception as e:
+                for _, future in live:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self._stats["batches"] += 1
+            for (_, future), result in zip(live, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _run_batch(self, images):
+        """Chạy trên executor: decode + một forward pass cho cả batch.
+
+        Ảnh không decode được chỉ làm hỏng request của chính nó, không ảnh hưởng cả batch.
+        """
+        batch = self._batch_buffer(len(images))
+        results, valid = [None] * len(images), []
+        for i, image in enumerate(images):
+            try:
+                self._fill_slot(image, batch[len(valid)])
+                valid.append(i)
+            except Exception as e:
+                results[i] = e
+        if valid:
+            probs = self.model(batch[:len(valid)], training=False).numpy()
+            for i, p in zip(valid, probs):
+                results[i] = {"digit": int(np.argmax(p)), "confidence": float(np.max(p)), "probabilities": p.tolist()}
+        return results
+
+    def _batch_buffer(self, n):
+        """Tensor batch dùng lại giữa các lần gọi (chỉ thread executor truy cập)"""
+        buffer = getattr(self, "_batch", None)
+        if buffer is None or len(buffer) < n:
+            buffer = self._batch = np.empty((max(n, self.max_batch_size), 28, 28, 1), dtype=np.float32)
+        return buffer
+
+    @staticmethod
+    def _fill_slot(image, slot):
+        """Ghi thẳng ảnh vào một slot của batch, không tạo tensor trung gian"""
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            from preprocess import preprocess_into
+            preprocess_into(image, slot)
+        else:
+            np.copyto(slot, np.asarray(image).reshape(28, 28, 1), casting="unsafe")
+
+
+async def _demo(num_requests, concurrency):
+    """Gửi nhiều request đồng thời và đo throughput"""
+    import cv2
+
+    canvas = np.full((28, 28), 255, dtype=np.uint8)
+    cv2.line(canvas, (5, 5), (20, 5), 0, 2)
+    cv2.line(canvas, (20, 5), (15, 20), 0, 2)
+    image_bytes = cv2.imencode(".png", canvas)[1].tobytes()
+
+    async with AsyncPredictor() as predictor:
+        limiter = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with limiter:
+                return await predictor.predict(image_bytes)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(num_requests)))
+        elapsed = time.perf_counter() - start
+
+    print(f"🎯 Prediction: {results[0]['digit']} ({results[0]['confidence']:.2%})")
+    print(f"⚡ {num_requests} requests in {elapsed:.2f}s ({num_requests / elapsed:.0f} req/s), "
+          f"{predictor.stats['batches']} batches (avg {num_requests / max(1, predictor.stats['batches']):.1f}/batch)")
+
+
+def main():
+    """Demo: nhiều coroutine đồng thời dùng chung một AsyncPredictor"""
+    parser = argparse.ArgumentParser(description="AsyncPredictor demo")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(_demo(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
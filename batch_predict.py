@@ -0,0 +1,275 @@
+"""
+Offline Batch Prediction for AI Handwriting Recognition System
+Worker pool for large manifests of digit crops: each process loads the model
+once with a pinned thread count, results come back through shared memory,
+finished chunks are persisted so interrupted runs resume where they stopped
+"""
+
+import os
+import csv
+import glob
+import json
+import time
+import hashlib
+import queue
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import BATCH_PREDICT_CONFIG, MODEL_CONFIG
+from result_store import ResultWriter, labels_and_confidences
+
+NUM_CLASSES = 10
+
+
+def read_manifest(manifest_path):
+    """Danh sách đường dẫn ảnh: file text (mỗi dòng một path) hoặc CSV có cột 'path'"""
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".csv"):
+            return [row["path"] for row in csv.DictReader(f)]
+        return [line.strip() for line in f if line.strip()]
+
+
+def _chunk_file(output_dir, chunk_id):
+    return os.path.join(output_dir, f"chunk_{chunk_id:06d}.npz")
+
+
+def _run_manifest_file(output_dir):
+    return os.path.join(output_dir, "run_manifest.json")
+
+
+def _worker_main(worker_id, manifest_path, model_path, threads, tasks, results, free_slots, slot_names, batch_size):
+    """Process worker: tải model một lần, decode shard được giao và ghi xác suất vào slot shared memory"""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import tensorflow as tf
+    from preprocess import preprocess_into
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    model = tf.keras.models.load_model(model_path, compile=False)
+    model(np.zeros((1, 28, 28, 1), dtype=np.float32), training=False)
+
+    paths = read_manifest(manifest_path)
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    batch = np.zeros((batch_size, 28, 28, 1), dtype=np.float32)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        chunk_id, start, end = task
+        slot_index = free_slots.get()
+        out = np.ndarray((end - start, NUM_CLASSES), dtype=np.float32, buffer=slots[slot_index].buf)
+
+        for batch_start in range(start, end, batch_size):
+            batch_end = min(batch_start + batch_size, end)
+            n = batch_end - batch_start
+            failed = np.zeros(n, dtype=bool)
+            for i, path in enumerate(paths[batch_start:batch_end]):
+                try:
+                    preprocess_into(path, batch[i])
+                except Exception:
+                    batch[i] = 0.0
+                    failed[i] = True
+            probs = model(batch[:n], training=False).numpy()
+            probs[failed] = np.nan
+            out[batch_start - start:batch_end - start] = probs
+
+        # Chỉ gửi metadata nhỏ; mảng kết quả nằm sẵn trong shared memory
+        results.put((worker_id, slot_index, chunk_id, start, end))
+
+    for slot in slots:
+        slot.close()
+
+
+class BatchPredictor:
+    def __init__(self, manifest_path, output_dir=None, model_path=None, num_workers=None):
+        cfg = BATCH_PREDICT_CONFIG
+        self.manifest_path = manifest_path
+        self.output_dir = output_dir or cfg["output_dir"]
+        self.model_path = model_path or MODEL_CONFIG["model_file"]
+        self.num_workers = num_workers or cfg["num_workers"] or os.cpu_count() or 1
+        self.chunk_size = cfg["chunk_size"]
+        self.paths = read_manifest(manifest_path)
+
+    def chunks(self):
+        return [(i, start, min(start + self.chunk_size, len(self.paths)))
+                for i, start in enumerate(range(0, len(self.paths), self.chunk_size))]
+
+    def run_signature(self):
+        """Thông tin xác định nội dung các chunk: hash danh sách ảnh, chunk_size và model đã dùng"""
+        from artifacts import file_sha256
+
+        digest = hashlib.sha256("\n".join(self.paths).encode("utf-8")).hexdigest()
+        return {"inputs_sha256": digest, "num_inputs": len(self.paths), "chunk_size": self.chunk_size,
+                "model_path": self.model_path, "model_sha256": file_sha256(self.model_path)}
+
+    def _stored_signature(self):
+        try:
+            with open(_run_manifest_file(self.output_dir), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def chunks_match(self):
+        """True nếu các file chunk trong output_dir thuộc về đúng danh sách ảnh, chunk_size và model hiện tại"""
+        return self._stored_signature() == self.run_signature()
+
+    def _prepare_output_dir(self):
+        """Xóa chunk của lần chạy khác (danh sách ảnh, chunk_size hoặc model đã đổi) rồi ghi manifest mới"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.chunks_match():
+            return
+        stale = glob.glob(os.path.join(self.output_dir, "chunk_*.npz"))
+        if stale:
+            print(f"⚠️ Input list or chunk size changed, discarding {len(stale)} chunks from a previous run")
+            for path in stale:
+                os.remove(path)
+        manifest_path = _run_manifest_file(self.output_dir)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.run_signature(), f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def pending_chunks(self):
+        """Các chunk chưa có file kết quả (để resume sau khi bị dừng giữa chừng)"""
+        if not self.chunks_match():
+            return self.chunks()
+        return [c for c in self.chunks() if not os.path.exists(_chunk_file(self.output_dir, c[0]))]
+
+    def _check_chunks(self):
+        if not self.chunks_match():
+            raise RuntimeError(f"Chunks in {self.output_dir} were produced for a different input list, "
+                               f"chunk size or model; rerun the prediction first")
+
+    def run(self):
+        """Chạy pool worker trên các chunk còn lại, lưu từng chunk ngay khi xong"""
+        cfg = BATCH_PREDICT_CONFIG
+        self._prepare_output_dir()
+        pending = self.pending_chunks()
+        total = len(self.chunks())
+        print(f"📦 {len(self.paths)} images, {total} chunks ({total - len(pending)} already done), "
+              f"{self.num_workers} workers")
+        if not pending:
+            return self.merge()
+
+        ctx = mp.get_context("spawn")
+        slot_bytes = self.chunk_size * NUM_CLASSES * np.dtype(np.float32).itemsize
+        tasks, results = ctx.Queue(), ctx.Queue()
+        workers, all_slots, free_queues = [], [], []
+        try:
+            for worker_id in range(self.num_workers):
+                slots = [shared_memory.SharedMemory(create=True, size=slot_bytes)
+                         for _ in range(cfg["slots_per_worker"])]
+                free_slots = ctx.Queue()
+                for i in range(len(slots)):
+                    free_slots.put(i)
+                all_slots.append(slots)
+                free_queues.append(free_slots)
+                process = ctx.Process(target=_worker_main, args=(
+                    worker_id, self.manifest_path, self.model_path, cfg["threads_per_worker"],
+                    tasks, results, free_slots, [s.name for s in slots], cfg["batch_size"]))
+                process.start()
+                workers.append(process)
+
+            for task in pending:
+                tasks.put(task)
+            for _ in workers:
+                tasks.put(None)
+
+            start_time = time.perf_counter()
+            done_images = 0
+            for completed in range(1, len(pending) + 1):
+                worker_id, slot_index, chunk_id, start, end = self._next_result(results, workers)
+                view = np.ndarray((end - start, NUM_CLASSES), dtype=np.float32,
+                                  buffer=all_slots[worker_id][slot_index].buf)
+                self._save_chunk(chunk_id, view)
+                free_queues[worker_id].put(slot_index)
+
+                done_images += end - start
+                elapsed = time.perf_counter() - start_time
+                print(f"  ✅ chunk {completed}/{len(pending)} ({done_images / elapsed:.0f} img/s)", end="\r")
+            print()
+
+            for process in workers:
+                process.join()
+        finally:
+            for process in workers:
+                if process.is_alive():
+                    process.terminate()
+            for slots in all_slots:
+                for slot in slots:
+                    slot.close()
+                    slot.unlink()
+        return self.merge()
+
+    @staticmethod
+    def _next_result(results, workers):
+        """Chờ kết quả tiếp theo, báo lỗi nếu có worker chết giữa chừng"""
+        while True:
+            try:
+                return results.get(timeout=5)
+            except queue.Empty:
+                dead = [p for p in workers if p.exitcode not in (None, 0)]
+                if dead:
+                    raise RuntimeError(f"{len(dead)} prediction worker(s) exited unexpectedly")
+
+    def _save_chunk(self, chunk_id, probs):
+        """Ghi kết quả một chunk (ghi file tạm rồi rename để không bao giờ để lại file dở dang)"""
+        labels, confidences = labels_and_confidences(probs)
+        path = _chunk_file(self.output_dir, chunk_id)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, labels=labels.astype(np.int8), confidences=confidences.astype(np.float32),
+                 probabilities=probs.astype(np.float16))
+        os.replace(tmp_path, path)
+
+    def merge(self, output_name="predictions.csv"):
+        """Gộp các chunk theo đúng thứ tự manifest thành một file CSV"""
+        self._check_chunks()
+        output_path = os.path.join(self.output_dir, output_name)
+        with open(output_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path", "digit", "confidence"])
+            for chunk_id, start, end in self.chunks():
+                data = np.load(_chunk_file(self.output_dir, chunk_id))
+                for path, label, confidence in zip(self.paths[start:end], data["labels"], data["confidences"]):
+                    writer.writerow([path, int(label), f"{confidence:.6f}"])
+        return output_path
+
+    def export_store(self, store_dir=None):
+        """Gộp các chunk vào result store dạng cột (id = vị trí ảnh trong manifest)"""
+        self._check_chunks()
+        store_dir = store_dir or os.path.join(self.output_dir, "store")
+        with ResultWriter(store_dir, overwrite=True) as writer:
+            for chunk_id, start, end in self.chunks():
+                data = np.load(_chunk_file(self.output_dir, chunk_id))
+                writer.append(np.arange(start, end), data["probabilities"],
+                              data["labels"], data["confidences"])
+        return store_dir
+
+
+def main():
+    """Chạy dự đoán hàng loạt từ command line"""
+    parser = argparse.ArgumentParser(description="Multi-process batch prediction over an image manifest")
+    parser.add_argument("manifest", help="Text file with one image path per line, or CSV with a 'path' column")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--store", action="store_true", help="Also write a memory-mapped columnar result store")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    predictor = BatchPredictor(args.manifest, args.output_dir, args.model, args.workers)
+    output_path = predictor.run()
+    elapsed = time.perf_counter() - start
+    print(f"✅ {len(predictor.paths)} predictions in {elapsed:.1f}s -> {output_path}")
+    if args.store:
+        print(f"🗄️ Result store -> {predictor.export_store()}")
+
+
+if __name__ == "__main__":
+    main()
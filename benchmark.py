@@ -0,0 +1,101 @@
+"""
+Benchmark utilities for AI Handwriting Recognition System
+Small helpers shared by the model comparison tools
+"""
+
+import os
+import time
+import numpy as np
+
+
+def measure_latency(predict_fn, inputs, runs=50, warmup=5):
+    """Đo latency (ms) của predict_fn trên một batch inputs"""
+    for _ in range(warmup):
+        predict_fn(inputs)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict_fn(inputs)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings = np.array(timings)
+    return {
+        "batch_size": len(inputs),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "mean_ms": float(timings.mean()),
+        "per_sample_ms": float(np.percentile(timings, 50) / len(inputs))
+    }
+
+
+def keras_forward(model):
+    """Forward pass trực tiếp (không qua model.predict) để đo chi phí kernel"""
+    return lambda x: model(x, training=False)
+
+
+def file_size_mb(path):
+    """Kích thước file hoặc thư mục (SavedModel) tính theo MB"""
+    if os.path.isdir(path):
+        total = sum(os.path.getsize(os.path.join(root, f))
+                    for root, _, files in os.walk(path) for f in files)
+    else:
+        total = os.path.getsize(path)
+    return total / (1024 * 1024)
+
+
+def count_macs(model):
+    """Ước lượng số phép nhân-cộng (MAC) mỗi ảnh cho Conv2D / SeparableConv2D / DepthwiseConv2D / Dense"""
+    import tensorflow as tf
+    layers = tf.keras.layers
+
+    total = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            total += count_macs(layer)
+            continue
+        if not isinstance(layer, (layers.Conv2D, layers.DepthwiseConv2D, layers.Dense)):
+            # InputLayer, pooling, BatchNorm...: không tính MAC; layer.input của InputLayer là list trong Keras 3
+            continue
+        # layer.output.shape hoạt động với cả Keras 2 và Keras 3 (không còn output_shape);
+        # số kênh vào lấy từ kernel (kh, kw, in, out) / (in, units) thay vì layer.input
+        out_shape = layer.output.shape
+        kernel = getattr(layer, "depthwise_kernel", None)
+        in_channels = int((kernel if kernel is not None else layer.kernel).shape[-2])
+        if isinstance(layer, layers.SeparableConv2D):
+            kh, kw = layer.kernel_size
+            spatial = out_shape[1] * out_shape[2]
+            total += spatial * kh * kw * in_channels * layer.depth_multiplier
+            total += spatial * in_channels * layer.depth_multiplier * layer.filters
+        elif isinstance(layer, layers.DepthwiseConv2D):
+            kh, kw = layer.kernel_size
+            total += out_shape[1] * out_shape[2] * kh * kw * in_channels * layer.depth_multiplier
+        elif isinstance(layer, layers.Conv2D):
+            kh, kw = layer.kernel_size
+            total += out_shape[1] * out_shape[2] * kh * kw * in_channels * layer.filters
+        elif isinstance(layer, layers.Dense):
+            total += in_channels * layer.units
+    return int(total)
+
+
+def measure_allocations(fn, runs=100, warmup=3):
+    """Bộ nhớ cấp phát tạm thời (peak, bytes) trung bình mỗi lần gọi fn, đo bằng tracemalloc.
+
+    NumPy / OpenCV đăng ký buffer dữ liệu với tracemalloc nên con số này phản ánh cả các mảng trung gian.
+    """
+    import tracemalloc
+
+    for _ in range(warmup):
+        fn()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(runs):
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+    return {"mean_bytes": float(np.mean(peaks)), "max_bytes": int(np.max(peaks))}
@@ -0,0 +1,146 @@
+"""
+Confidence-gated Cascade Predictor for AI Handwriting Recognition System
+Runs a small model first and escalates to handwriting_model.h5 only for the
+images whose top-1 probability or top-1/top-2 margin is too low
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from config import CASCADE_CONFIG
+from compiled_inference import compile_for_inference
+
+
+def _first_existing(paths):
+    return next((p for p in paths if os.path.exists(p)), None)
+
+
+class CascadePredictor:
+    """Model nhỏ trước, model lớn cho ảnh không chắc chắn.
+
+    Với shadow=True model lớn được bọc bằng shadow.with_shadow (self.shadow): mọi batch cùng output
+    cuối cùng của cascade được gửi cho candidate, self.shadow.promote() thay model lớn.
+    """
+
+    def __init__(self, small_model=None, large_model=None, confidence_threshold=None, margin_threshold=None,
+                 shadow=False):
+        cfg = CASCADE_CONFIG
+        self.confidence_threshold = cfg["confidence_threshold"] if confidence_threshold is None else confidence_threshold
+        self.margin_threshold = cfg["margin_threshold"] if margin_threshold is None else margin_threshold
+
+        # large_model có thể là đường dẫn hoặc model đã tải sẵn (vd. trong GUI)
+        if large_model is None:
+            large_model = cfg["large_model"]
+        large_path = large_model if isinstance(large_model, str) else cfg["large_model"]
+        if isinstance(large_model, str):
+            large_model = tf.keras.models.load_model(large_model, compile=False)
+        self.large = compile_for_inference(large_model)
+        self.shadow = None
+        if shadow:
+            from shadow import with_shadow
+            shadowed = with_shadow(self.large, large_path)
+            self.shadow = shadowed if shadowed is not self.large else None
+
+        # Không có model nhỏ thì cascade suy biến thành chỉ chạy model lớn
+        small_path = small_model or _first_existing(cfg["small_models"])
+        self.small = (compile_for_inference(tf.keras.models.load_model(small_path, compile=False))
+                      if small_path else None)
+        self.small_path = small_path
+        self.stats = {"images": 0, "escalated": 0}
+
+    def needs_escalation(self, probs):
+        """Ảnh nào có top-1 hoặc khoảng cách top-1/top-2 dưới ngưỡng"""
+        top2 = np.sort(probs, axis=1)[:, -2:]
+        margin = top2[:, 1] - top2[:, 0]
+        return (top2[:, 1] < self.confidence_threshold) | (margin < self.margin_threshold)
+
+    def predict_proba(self, images):
+        """Trả về (probs, escalated_mask) cho một batch đã tiền xử lý"""
+        images = np.asarray(images, dtype=np.float32)
+        # Có shadow: chỉ chạy primary ở đây, cả batch được gửi cho shadow một lần ở cuối
+        large = self.shadow.serve if self.shadow is not None else self.large
+        start = time.perf_counter()
+        if self.small is None:
+            probs = large(images, training=False).numpy()
+            escalated = np.ones(len(images), dtype=bool)
+        else:
+            probs = self.small(images, training=False).numpy()
+            escalated = self.needs_escalation(probs)
+            if escalated.any():
+                probs[escalated] = large(images[escalated], training=False).numpy()
+        if self.shadow is not None:
+            self.shadow.observe(images, probs, (time.perf_counter() - start) * 1000)
+
+        self.stats["images"] += len(images)
+        self.stats["escalated"] += int(escalated.sum())
+        return probs, escalated
+
+    def predict(self, images):
+        """Nhãn dự đoán và confidence cho một batch"""
+        probs, _ = self.predict_proba(images)
+        return np.argmax(probs, axis=1), np.max(probs, axis=1)
+
+    @property
+    def escalation_rate(self):
+        return self.stats["escalated"] / max(1, self.stats["images"])
+
+
+def evaluate_tradeoff(cascade, thresholds=None, batch_size=None):
+    """Đo accuracy / tỉ lệ escalate / latency thực tế trên tập test MNIST cho từng ngưỡng"""
+    from dataset_loader import load_mnist_cached
+
+    thresholds = thresholds or CASCADE_CONFIG["sweep_thresholds"]
+    batch_size = batch_size or CASCADE_CONFIG["batch_size"]
+    _, (x_test, y_test) = load_mnist_cached()
+    x_test, y_test = np.asarray(x_test), np.asarray(y_test)
+
+    def timed_run(predict_batch):
+        start = time.perf_counter()
+        predictions, escalated = [], 0
+        for i in range(0, len(x_test), batch_size):
+            probs, mask = predict_batch(x_test[i:i + batch_size])
+            predictions.append(np.argmax(probs, axis=1))
+            escalated += int(mask.sum())
+        elapsed = time.perf_counter() - start
+        return {
+            "accuracy": float(np.mean(np.concatenate(predictions) == y_test)),
+            "escalation_rate": escalated / len(x_test),
+            "ms_per_image": elapsed * 1000 / len(x_test)
+        }
+
+    rows = []
+    large_only = timed_run(lambda b: (cascade.large(b, training=False).numpy(), np.ones(len(b), dtype=bool)))
+    rows.append(dict(large_only, threshold="large only"))
+    if cascade.small is not None:
+        small_only = timed_run(lambda b: (cascade.small(b, training=False).numpy(), np.zeros(len(b), dtype=bool)))
+        rows.append(dict(small_only, threshold="small only"))
+
+        original = cascade.confidence_threshold
+        for threshold in thresholds:
+            cascade.confidence_threshold = threshold
+            rows.append(dict(timed_run(cascade.predict_proba), threshold=threshold))
+        cascade.confidence_threshold = original
+    return rows
+
+
+def main():
+    """Đánh giá cascade từ command line"""
+    parser = argparse.ArgumentParser(description="Small-model-first cascade predictor")
+    parser.add_argument("--small", default=None, help="Small model path (default: first existing in config)")
+    parser.add_argument("--margin", type=float, default=None)
+    args = parser.parse_args()
+
+    cascade = CascadePredictor(small_model=args.small, margin_threshold=args.margin)
+    print(f"🪜 Cascade: {cascade.small_path or 'no small model'} -> {CASCADE_CONFIG['large_model']} "
+          f"(margin < {cascade.margin_threshold})")
+
+    print(f"\n{'Threshold':>11} {'Accuracy':>9} {'Escalated':>10} {'ms/img':>8}")
+    for r in evaluate_tradeoff(cascade):
+        print(f"{str(r['threshold']):>11} {r['accuracy']:>9.4f} {r['escalation_rate']:>9.1%} {r['ms_per_image']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
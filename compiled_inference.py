@@ -0,0 +1,98 @@
+"""
+Compiled Inference for AI Handwriting Recognition System
+Traces the model once per batch-size bucket, pads every call up to the
+nearest bucket and warms all buckets at load time, so inference never goes
+through model.predict and never retraces on a new batch size
+"""
+
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from config import INFERENCE_CONFIG, MODEL_CONFIG
+
+
+class BucketedPredictor:
+    """Gọi như một model Keras: predictor(images, training=False) trả về tf.Tensor xác suất.
+
+    Buffer padding được dùng lại giữa các lần gọi nên mỗi thread nên có predictor riêng.
+    """
+
+    def __init__(self, model, buckets=None, jit_compile=None, warm_up=True):
+        self.model = model
+        self.buckets = sorted(buckets or INFERENCE_CONFIG["buckets"])
+        self.jit_compile = INFERENCE_CONFIG["jit_compile"] if jit_compile is None else jit_compile
+        input_shape = tuple(model.input_shape[1:])
+
+        forward = tf.function(lambda x: model(x, training=False), jit_compile=self.jit_compile)
+        self._functions = {b: forward.get_concrete_function(tf.TensorSpec((b,) + input_shape, tf.float32))
+                           for b in self.buckets}
+        self._padded = {b: np.zeros((b,) + input_shape, dtype=np.float32) for b in self.buckets}
+        self.warm_up_ms = self.warm_up() if warm_up else {}
+
+    def warm_up(self):
+        """Chạy mỗi bucket một lần (XLA biên dịch ở lần gọi đầu); trả về thời gian từng bucket"""
+        timings = {}
+        for b in self.buckets:
+            start = time.perf_counter()
+            self._functions[b](tf.constant(self._padded[b]))
+            timings[b] = (time.perf_counter() - start) * 1000
+        return timings
+
+    def bucket_for(self, n):
+        return next((b for b in self.buckets if b >= n), self.buckets[-1])
+
+    def __call__(self, images, training=False):
+        images = np.asarray(images, dtype=np.float32)
+        n, largest = len(images), self.buckets[-1]
+        if n > largest:
+            return tf.concat([self(images[start:start + largest]) for start in range(0, n, largest)], axis=0)
+
+        bucket = self.bucket_for(n)
+        if n == bucket:
+            batch = images
+        else:
+            # Phần đệm phía sau chỉ làm đầy shape; kết quả của nó bị cắt bỏ
+            batch = self._padded[bucket]
+            batch[:n] = images
+        return self._functions[bucket](tf.constant(batch))[:n]
+
+    def predict_proba(self, images):
+        return self(images).numpy()
+
+
+def compile_for_inference(model):
+    """Bọc model bằng BucketedPredictor nếu được bật trong INFERENCE_CONFIG"""
+    if not INFERENCE_CONFIG["enabled"] or isinstance(model, BucketedPredictor):
+        return model
+    return BucketedPredictor(model)
+
+
+def main():
+    """So sánh model.predict, gọi model trực tiếp và BucketedPredictor theo batch size"""
+    from benchmark import measure_latency, keras_forward
+
+    parser = argparse.ArgumentParser(description="Benchmark bucketed tf.function inference")
+    parser.add_argument("--model", default=MODEL_CONFIG["model_file"])
+    parser.add_argument("--jit", action="store_true", help="Compile buckets with XLA")
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    start = time.perf_counter()
+    predictor = BucketedPredictor(model, jit_compile=args.jit)
+    print(f"🔥 Traced + warmed {len(predictor.buckets)} buckets in {time.perf_counter() - start:.2f}s "
+          f"(jit_compile={predictor.jit_compile})")
+
+    print(f"\n{'Batch':>6} {'predict p50':>12} {'call p50':>10} {'bucketed p50':>13} {'bucketed p95':>13}")
+    for n in [1, 5, 8, 20, 32, 100]:
+        images = np.random.rand(n, 28, 28, 1).astype(np.float32)
+        slow = measure_latency(lambda x: model.predict(x, verbose=0), images, runs=20)
+        direct = measure_latency(keras_forward(model), images)
+        fast = measure_latency(predictor, images)
+        print(f"{n:>6} {slow['p50_ms']:>10.2f}ms {direct['p50_ms']:>8.2f}ms "
+              f"{fast['p50_ms']:>11.2f}ms {fast['p95_ms']:>11.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
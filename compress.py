@@ -0,0 +1,269 @@
+"""
+Model Compression Pipeline for AI Handwriting Recognition System
+Structured neuron pruning of the dense head, magnitude pruning and weight
+clustering with fine-tuning, then re-export and a before/after report
+"""
+
+import os
+import gzip
+import argparse
+import tempfile
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+
+from config import COMPRESSION_CONFIG, MODEL_CONFIG
+from dataset_loader import load_mnist_cached
+from model import build_simple_model
+from benchmark import measure_latency, keras_forward, count_macs, file_size_mb
+
+try:
+    import tensorflow_model_optimization as tfmot
+except ImportError:
+    tfmot = None
+
+
+def load_data():
+    """MNIST từ cache mmap, chuyển về array thường để fit nhanh"""
+    (x_train, y_train), (x_test, y_test) = load_mnist_cached()
+    return (np.asarray(x_train), np.asarray(y_train)), (np.asarray(x_test), np.asarray(y_test))
+
+
+def compile_for_finetune(model, learning_rate=None):
+    """Compile lại với learning rate nhỏ cho fine-tune"""
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate or COMPRESSION_CONFIG["finetune_learning_rate"]),
+        loss='sparse_categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
+
+
+def load_base_models(data):
+    """build_model đã train (handwriting_model.h5) và build_simple_model (train nhanh nếu chưa có)"""
+    cfg = COMPRESSION_CONFIG
+    models = {}
+    if os.path.exists(MODEL_CONFIG["model_file"]):
+        models["build_model"] = tf.keras.models.load_model(MODEL_CONFIG["model_file"], compile=False)
+    else:
+        print(f"⚠️ {MODEL_CONFIG['model_file']} not found, skipping build_model")
+
+    if os.path.exists(cfg["simple_model_file"]):
+        models["build_simple_model"] = tf.keras.models.load_model(cfg["simple_model_file"], compile=False)
+    else:
+        print("🏋️ Training build_simple_model baseline...")
+        (x_train, y_train), (x_test, y_test) = data
+        simple = build_simple_model()
+        simple.fit(x_train, y_train, epochs=cfg["simple_model_epochs"], batch_size=cfg["batch_size"],
+                   validation_data=(x_test, y_test), verbose=1)
+        os.makedirs(os.path.dirname(cfg["simple_model_file"]), exist_ok=True)
+        simple.save(cfg["simple_model_file"])
+        models["build_simple_model"] = simple
+    return models
+
+
+def prune_dense_neurons(model, keep_ratio):
+    """Structured pruning: bỏ các neuron có norm nhỏ của mọi Dense ẩn và dựng lại model nhỏ hơn"""
+    hidden_dense = [l for l in model.layers if isinstance(l, layers.Dense)][:-1]
+    keep = {}
+    for layer in hidden_dense:
+        kernel = layer.get_weights()[0]
+        n_keep = max(1, int(round(kernel.shape[1] * keep_ratio)))
+        norms = np.linalg.norm(kernel, axis=0)
+        keep[layer.name] = np.sort(np.argsort(norms)[-n_keep:])
+
+    config = model.get_config()
+    for layer_config in config["layers"]:
+        # Keras 3 lưu shape đầu vào cũ trong build_config; bỏ đi để model tự build theo kích thước mới
+        layer_config.pop("build_config", None)
+        name = layer_config["config"].get("name")
+        if name in keep:
+            layer_config["config"]["units"] = len(keep[name])
+    pruned = tf.keras.Sequential.from_config(config)
+
+    # Copy trọng số: cắt cột của Dense bị prune, cắt hàng của Dense kế tiếp và tham số BatchNorm ở giữa
+    active = None
+    for old, new in zip(model.layers, pruned.layers):
+        weights = old.get_weights()
+        if isinstance(old, layers.Dense):
+            kernel, bias = weights
+            if active is not None:
+                kernel = kernel[active]
+            if old.name in keep:
+                active = keep[old.name]
+                kernel, bias = kernel[:, active], bias[active]
+            else:
+                active = None
+            weights = [kernel, bias]
+        elif isinstance(old, layers.BatchNormalization) and active is not None:
+            weights = [w[active] for w in weights]
+        new.set_weights(weights)
+    return pruned
+
+
+def structured_prune(model, data):
+    """Giảm dần tỉ lệ giữ lại theo lịch, fine-tune sau mỗi bước, dừng khi accuracy giảm quá ngưỡng"""
+    cfg = COMPRESSION_CONFIG
+    (x_train, y_train), (x_test, y_test) = data
+    base_accuracy = evaluate_accuracy(model, x_test, y_test)
+
+    best = model
+    for keep_ratio in cfg["structured_keep_ratios"]:
+        candidate = compile_for_finetune(prune_dense_neurons(model, keep_ratio))
+        candidate.fit(x_train, y_train, epochs=cfg["finetune_epochs"], batch_size=cfg["batch_size"], verbose=0)
+        accuracy = evaluate_accuracy(candidate, x_test, y_test)
+        print(f"  ✂️ keep={keep_ratio:.2f}: accuracy={accuracy:.4f} (base {base_accuracy:.4f})")
+        if base_accuracy - accuracy > cfg["max_accuracy_drop"]:
+            break
+        best = candidate
+    return best
+
+
+def _prunable(layer):
+    return isinstance(layer, (layers.Conv2D, layers.Dense))
+
+
+def _copy(model):
+    """Bản sao độc lập (cùng trọng số) để các wrapper không sửa model gốc"""
+    clone = tf.keras.models.clone_model(model)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+def magnitude_prune(model, data):
+    """Magnitude pruning (tfmot) với lịch PolynomialDecay, fine-tune rồi strip wrapper"""
+    cfg = COMPRESSION_CONFIG
+    (x_train, y_train), _ = data
+    steps_per_epoch = int(np.ceil(len(x_train) / cfg["batch_size"]))
+    schedule = tfmot.sparsity.keras.PolynomialDecay(
+        initial_sparsity=0.0,
+        final_sparsity=cfg["final_sparsity"],
+        begin_step=0,
+        end_step=steps_per_epoch * max(1, cfg["pruning_epochs"] - 1)
+    )
+
+    def wrap(layer):
+        if _prunable(layer):
+            return tfmot.sparsity.keras.prune_low_magnitude(layer, pruning_schedule=schedule)
+        return layer
+
+    pruned = tf.keras.models.clone_model(_copy(model), clone_function=wrap)
+    compile_for_finetune(pruned)
+    pruned.fit(x_train, y_train, epochs=cfg["pruning_epochs"], batch_size=cfg["batch_size"],
+               callbacks=[tfmot.sparsity.keras.UpdatePruningStep()], verbose=0)
+    return compile_for_finetune(tfmot.sparsity.keras.strip_pruning(pruned))
+
+
+def cluster_weights(model, data):
+    """Weight clustering (tfmot): mỗi lớp chỉ còn num_clusters giá trị khác nhau, giữ nguyên sparsity"""
+    cfg = COMPRESSION_CONFIG
+    (x_train, y_train), _ = data
+    clustering = tfmot.clustering.keras
+    params = {
+        "number_of_clusters": cfg["num_clusters"],
+        "cluster_centroids_init": clustering.CentroidInitialization.KMEANS_PLUS_PLUS,
+        "preserve_sparsity": True
+    }
+
+    def wrap(layer):
+        if _prunable(layer):
+            # Bản experimental hỗ trợ preserve_sparsity để không mất các trọng số 0 đã prune
+            return clustering.experimental.cluster_weights(layer, **params)
+        return layer
+
+    clustered = tf.keras.models.clone_model(_copy(model), clone_function=wrap)
+    compile_for_finetune(clustered, COMPRESSION_CONFIG["finetune_learning_rate"] / 3)
+    clustered.fit(x_train, y_train, epochs=1, batch_size=cfg["batch_size"], verbose=0)
+    return compile_for_finetune(clustering.strip_clustering(clustered))
+
+
+def evaluate_accuracy(model, x_test, y_test):
+    probs = model.predict(x_test, batch_size=512, verbose=0)
+    return float(np.mean(np.argmax(probs, axis=1) == y_test))
+
+
+def gzipped_size_mb(path):
+    """Kích thước sau gzip: phản ánh lợi ích của sparsity / clustering khi phân phối"""
+    with open(path, "rb") as f:
+        return len(gzip.compress(f.read())) / (1024 * 1024)
+
+
+def describe(label, model, path, x_test, y_test):
+    """Một dòng báo cáo: size, params, MACs, accuracy, latency CPU"""
+    weights = model.get_weights()
+    return {
+        "model": label,
+        "size_mb": file_size_mb(path),
+        "gzip_mb": gzipped_size_mb(path),
+        "parameters": model.count_params(),
+        "nonzero_parameters": int(sum(np.count_nonzero(w) for w in weights)),
+        "macs": count_macs(model),
+        "test_accuracy": evaluate_accuracy(model, x_test, y_test),
+        "latency_1_ms": measure_latency(keras_forward(model), x_test[:1])["p50_ms"],
+        "latency_128_per_sample_ms": measure_latency(keras_forward(model), x_test[:128], runs=20)["per_sample_ms"]
+    }
+
+
+def export(model, name):
+    """Lưu model đã nén (không kèm optimizer state)"""
+    os.makedirs(COMPRESSION_CONFIG["output_dir"], exist_ok=True)
+    path = os.path.join(COMPRESSION_CONFIG["output_dir"], f"{name}.h5")
+    model.save(path, include_optimizer=False)
+    return path
+
+
+def compress_all():
+    """Chạy toàn bộ pipeline cho build_model và build_simple_model"""
+    data = load_data()
+    x_test, y_test = data[1]
+    rows = []
+
+    if tfmot is None:
+        print("⚠️ tensorflow-model-optimization not installed: only structured pruning will run")
+
+    for name, base in load_base_models(data).items():
+        print(f"\n🗜️ Compressing {name}...")
+        with tempfile.TemporaryDirectory() as tmp:
+            base_path = os.path.join(tmp, f"{name}.h5")
+            base.save(base_path, include_optimizer=False)
+            rows.append(describe(f"{name} (baseline)", base, base_path, x_test, y_test))
+
+        structured = structured_prune(base, data)
+        rows.append(describe(f"{name} (structured)", structured, export(structured, f"{name}_structured"),
+                             x_test, y_test))
+
+        if tfmot is not None:
+            print("  🔪 Magnitude pruning + clustering...")
+            sparse = cluster_weights(magnitude_prune(structured, data), data)
+            rows.append(describe(f"{name} (+sparse+clustered)", sparse,
+                                 export(sparse, f"{name}_pruned_clustered"), x_test, y_test))
+    return rows
+
+
+def print_report(rows):
+    """In bảng before/after"""
+    print("\n📋 Compression Report")
+    print("-" * 128)
+    print(f"{'Model':<36} {'Size MB':>8} {'Gzip MB':>8} {'Params':>10} {'Non-zero':>10} {'MACs':>12} "
+          f"{'Accuracy':>9} {'Lat@1 ms':>9} {'Lat@128/img':>12}")
+    for r in rows:
+        print(f"{r['model']:<36} {r['size_mb']:>8.2f} {r['gzip_mb']:>8.2f} {r['parameters']:>10,} "
+              f"{r['nonzero_parameters']:>10,} {r['macs']:>12,} {r['test_accuracy']:>9.4f} "
+              f"{r['latency_1_ms']:>9.3f} {r['latency_128_per_sample_ms']:>12.4f}")
+
+
+def main():
+    """Chạy pipeline nén từ command line"""
+    argparse.ArgumentParser(description="Prune, cluster and re-export the CNN models").parse_args()
+    rows = compress_all()
+    print_report(rows)
+
+    import json
+    report_path = os.path.join(COMPRESSION_CONFIG["output_dir"], "compression_report.json")
+    with open(report_path, "w") as f:
+        json.dump(rows, f, indent=2)
+    print(f"📁 Report saved to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
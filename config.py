@@ -71,3 +71,261 @@ LOGGING_CONFIG = {
     "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     "file": "logs/app.log"
 }
+
+# Hyperparameter Sweep Configuration
+SWEEP_CONFIG = {
+    "strategy": "random",
+    "num_trials": 12,
+    "num_workers": 4,
+    "threads_per_worker": 2,
+    "max_epochs": 9,
+    "min_epochs": 2,
+    "halving_rate": 3,
+    "target_accuracy": 0.99,
+    "seed": 42,
+    "cache_dir": "data/mnist_cache",
+    "search_space": {
+        "dense_units": [(512, 256), (256, 128), (128, 64)],
+        "conv_dropout": [0.1, 0.25, 0.4],
+        "dense_dropout": [0.3, 0.5],
+        "learning_rate": [0.0005, 0.001, 0.002],
+        "rotation_range": [0, 10, 15],
+        "shift_range": [0.0, 0.1],
+        "zoom_range": [0.0, 0.1]
+    }
+}
+
+# Distributed (multi-process, single host) Training Configuration
+DISTRIBUTED_CONFIG = {
+    "num_workers": 2,
+    "per_worker_batch_size": 128,
+    "epochs": 5,
+    "host": "localhost",
+    "scaling_worker_counts": [1, 2, 4],
+    "results_dir": "logs/distributed"
+}
+
+# Knowledge Distillation Configuration
+DISTILLATION_CONFIG = {
+    "teacher_model": "handwriting_model.h5",
+    "students": ["ds_tiny", "ds_small", "conv_gap"],
+    "temperature": 4.0,
+    "alpha": 0.1,
+    "epochs": 15,
+    "batch_size": 128,
+    "learning_rate": 0.002,
+    "soft_targets_cache": "data/teacher_soft_targets.npz",
+    "students_dir": "models/students"
+}
+
+# Model Compression (pruning / clustering) Configuration
+COMPRESSION_CONFIG = {
+    "output_dir": "models/compressed",
+    "simple_model_file": "models/simple_model.h5",
+    "simple_model_epochs": 5,
+    "structured_keep_ratios": [0.75, 0.5, 0.35, 0.25],
+    "max_accuracy_drop": 0.003,
+    "finetune_epochs": 2,
+    "finetune_learning_rate": 0.0003,
+    "final_sparsity": 0.8,
+    "pruning_epochs": 3,
+    "num_clusters": 16,
+    "batch_size": 128
+}
+
+# Ensemble / Test-Time Augmentation Configuration
+ENSEMBLE_CONFIG = {
+    "checkpoints": [
+        "handwriting_model.h5",
+        "models/compressed/build_model_structured.h5",
+        "models/students/ds_small.h5"
+    ],
+    "use_tta": True,
+    "tta_shifts": [(1, 0), (-1, 0), (0, 1), (0, -1)],
+    "tta_rotations": [-8, 8],
+    "batch_size": 256
+}
+
+# Cascade (small model first, large model when unsure) Configuration
+CASCADE_CONFIG = {
+    "enabled": True,
+    "small_models": ["models/students/ds_tiny.h5", "models/simple_model.h5"],
+    "large_model": "handwriting_model.h5",
+    "confidence_threshold": 0.9,
+    "margin_threshold": 0.3,
+    "sweep_thresholds": [0.5, 0.7, 0.8, 0.9, 0.95, 0.99],
+    "batch_size": 256
+}
+
+# Async Prediction API Configuration
+ASYNC_CONFIG = {
+    "max_batch_size": 64,
+    "max_wait_ms": 5,
+    "max_in_flight": 4096,
+    "default_timeout": 10.0
+}
+
+# Offline Batch Prediction (multi-process worker pool) Configuration
+BATCH_PREDICT_CONFIG = {
+    "num_workers": None,
+    "threads_per_worker": 1,
+    "chunk_size": 2048,
+    "batch_size": 256,
+    "slots_per_worker": 2,
+    "output_dir": "exports/batch_predictions"
+}
+
+# Result store configuration (columnar, memory-mapped prediction results)
+RESULT_STORE_CONFIG = {
+    "flush_rows": 65536,
+    "query_block_rows": 1000000,
+    "review_threshold": 0.8
+}
+
+# Streaming evaluation configuration
+EVALUATION_CONFIG = {
+    "chunk_size": 8192,
+    "batch_size": 512,
+    "top_k": 5,
+    "calibration_bins": 15
+}
+
+# Dataset ingestion configuration (packed uint8 shards + index)
+INGEST_CONFIG = {
+    "shard_size": 65536,
+    "num_workers": None,
+    "mode": "threshold",
+    "image_extensions": [".png", ".jpg", ".jpeg", ".bmp"],
+    "chunk_size": 8192,
+    "shards_dir": "data/shards"
+}
+
+# Deduplication configuration (perceptual hash + multi-index near-duplicate search)
+DEDUP_CONFIG = {
+    "hash_size": 16,
+    "max_distance": 8,
+    "crop_threshold": 32,
+    "block_pairs": 1 << 20,
+    "chunk_size": 65536,
+    "output_dir": "reports/dedup"
+}
+
+# Embedding / nearest-neighbor configuration (penultimate Dense layer)
+EMBEDDING_CONFIG = {
+    "index_dir": "models/embeddings",
+    "batch_size": 512,
+    "block_rows": 65536,
+    "k": 10,
+    "fallback_weight": 0.5
+}
+
+# Active learning configuration (labeling queue + incremental fine-tuning)
+ACTIVE_LEARNING_CONFIG = {
+    "enabled": True,
+    "queue_dir": "data/active_learning",
+    "max_queue_size": 5000,
+    "entropy_threshold": 0.5,
+    "near_duplicate_distance": 8,
+    "replay_size": 5000,
+    "fine_tune_epochs": 3,
+    "fine_tune_learning_rate": 0.0001,
+    "batch_size": 128,
+    "cycle_log": "logs/active_learning_cycles.csv"
+}
+
+# Compiled inference configuration (pre-traced tf.function per batch-size bucket)
+INFERENCE_CONFIG = {
+    "enabled": True,
+    "buckets": [1, 8, 32, 128, 512],
+    "jit_compile": False
+}
+
+# Serving export configuration (SavedModel with in-graph preprocessing)
+SERVING_CONFIG = {
+    "export_dir": "exports/serving_model",
+    "mode": "threshold"
+}
+
+# Inference artifact configuration (formats, manifest, cold-start benchmark)
+ARTIFACTS_CONFIG = {
+    "artifacts_dir": "models/artifacts",
+    "formats": ["savedmodel", "keras", "h5", "weights"],
+    "cold_start_runs": 3
+}
+
+# Early-exit model configuration
+EARLY_EXIT_CONFIG = {
+    "model_file": "models/early_exit_model.h5",
+    "exit_threshold": 0.95,
+    "sweep_thresholds": [0.8, 0.9, 0.95, 0.98, 0.99, 0.999],
+    "loss_weights": [0.3, 0.3, 1.0],
+    "epochs": 15,
+    "batch_size": 128
+}
+
+# Time-to-accuracy training configuration (LR range test, one-cycle schedule, large batch)
+FAST_TRAINING_CONFIG = {
+    "target_accuracy": 0.99,
+    "batch_size": 512,
+    "base_batch_size": 128,
+    "base_learning_rate": 0.001,
+    "max_epochs": 8,
+    "evals_per_epoch": 2,
+    "pct_start": 0.3,
+    "div_factor": 25.0,
+    "final_div_factor": 1e4,
+    "range_test": {
+        "min_lr": 1e-6,
+        "max_lr": 1.0,
+        "steps": 100
+    },
+    "run_log": "logs/time_to_accuracy.csv"
+}
+
+# Report generation configuration (cached dependency graph, parallel figure rendering)
+REPORT_CONFIG = {
+    "cache_file": ".report_cache.json",
+    "workers": 2,
+    "dpi": 300,
+    "num_samples": 10,
+    "sample_seed": 42
+}
+
+# Profiling configuration (--profile[=MODE] or HANDWRITING_PROFILE on every entry point)
+PROFILING_CONFIG = {
+    "env_var": "HANDWRITING_PROFILE",
+    "default_mode": "sample",
+    "interval_ms": 5,
+    "top_n": 25
+}
+
+# Load testing configuration (open/closed-loop load generator, SLO ramp)
+LOAD_TEST_CONFIG = {
+    "source": "mnist",
+    "images": 500,
+    "image_dir": "data/load_test_images",
+    "duration_s": 10,
+    "window_s": 1.0,
+    "max_workers": 64,
+    "timeout_s": 10,
+    "slo_p99_ms": 100,
+    "max_error_rate": 0.01,
+    "ramp_start_rate": 5,
+    "ramp_factor": 1.5,
+    "ramp_max_steps": 12
+}
+
+# Shadow evaluation configuration (candidate model on a copy of live traffic)
+SHADOW_CONFIG = {
+    "enabled": True,
+    "candidate_model": "models/candidate_model.h5",
+    "archive_dir": "models/archive",
+    "cpu_budget": 0.25,
+    "burst_seconds": 2.0,
+    "max_queue_batches": 32,
+    "min_agreement": 0.99,
+    "report_file": "logs/shadow_report.json",
+    # Report được ghi định kỳ từ thread shadow, sau ngần này batch shadow hoặc ngần này giây (cái nào tới trước)
+    "report_every_batches": 100,
+    "report_interval_s": 60.0
+}
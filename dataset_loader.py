@@ -1,3 +1,4 @@
+import os
 import tensorflow as tf
 import numpy as np
 
@@ -10,3 +11,32 @@ def load_mnist():
     x_test = np.expand_dims(x_test, axis=-1)
 
     return (x_train, y_train), (x_test, y_test)
+
+def cache_mnist(cache_dir="data/mnist_cache"):
+    """Lưu MNIST đã chuẩn hóa thành các file .npy để nhiều process dùng chung qua mmap"""
+    names = ["x_train", "y_train", "x_test", "y_test"]
+    paths = {name: os.path.join(cache_dir, f"{name}.npy") for name in names}
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+
+    os.makedirs(cache_dir, exist_ok=True)
+    (x_train, y_train), (x_test, y_test) = load_mnist()
+    arrays = {
+        "x_train": x_train.astype(np.float32),
+        "y_train": y_train,
+        "x_test": x_test.astype(np.float32),
+        "y_test": y_test
+    }
+    for name, array in arrays.items():
+        np.save(paths[name], array)
+    return paths
+
+def load_mnist_cached(cache_dir="data/mnist_cache", mmap=True):
+    """Đọc MNIST từ cache .npy; với mmap=True các process chia sẻ page cache thay vì tải lại"""
+    paths = cache_mnist(cache_dir)
+    mode = "r" if mmap else None
+    x_train = np.load(paths["x_train"], mmap_mode=mode)
+    y_train = np.load(paths["y_train"], mmap_mode=mode)
+    x_test = np.load(paths["x_test"], mmap_mode=mode)
+    y_test = np.load(paths["y_test"], mmap_mode=mode)
+    return (x_train, y_train), (x_test, y_test)
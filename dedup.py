@@ -0,0 +1,252 @@
+"""
+Deduplication Index for AI Handwriting Recognition System
+Hashes every training / evaluation image with a 256-bit difference hash,
+finds exact and near duplicates within and across splits with a multi-index
+(band) hash search, and writes keep-masks that drop duplicates and leakage
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import cv2
+
+from config import DEDUP_CONFIG
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def centred_crop(image, threshold=None):
+    """Vùng vuông chứa nét chữ, căn giữa và giữ tỉ lệ (nền tối như MNIST); ảnh trống trả về nguyên ảnh.
+
+    Viền trống của ảnh chữ số cho ra các bit dHash toàn 0 giống nhau ở mọi ảnh; cắt sát nét chữ
+    để mọi bit của hash mô tả chữ số.
+    """
+    threshold = DEDUP_CONFIG["crop_threshold"] if threshold is None else threshold
+    x, y, w, h = cv2.boundingRect((image > threshold).astype(np.uint8))
+    if w == 0 or h == 0:
+        return image
+    side = max(w, h)
+    square = np.zeros((side, side), dtype=image.dtype)
+    top, left = (side - h) // 2, (side - w) // 2
+    square[top:top + h, left:left + w] = image[y:y + h, x:x + w]
+    return square
+
+
+def perceptual_hashes(images, hash_size=None):
+    """dHash của ảnh uint8 (N, H, W): so sánh độ sáng các ô liền kề của chữ số đã cắt và thu nhỏ, đóng gói thành bit"""
+    hash_size = hash_size or DEDUP_CONFIG["hash_size"]
+    small = np.empty((len(images), hash_size, hash_size + 1), dtype=np.float32)
+    for i, image in enumerate(images):
+        cv2.resize(centred_crop(image).astype(np.float32), (hash_size + 1, hash_size), dst=small[i],
+                   interpolation=cv2.INTER_AREA)
+    bits = small[:, :, 1:] > small[:, :, :-1]
+    return np.packbits(bits.reshape(len(images), -1), axis=1)
+
+
+def exact_keys(images):
+    """Khóa 64-bit của nội dung pixel để phát hiện bản trùng tuyệt đối"""
+    keys = np.empty(len(images), dtype=np.uint64)
+    for i, image in enumerate(images):
+        keys[i] = int.from_bytes(hashlib.blake2b(np.ascontiguousarray(image).tobytes(), digest_size=8).digest(), "little")
+    return keys
+
+
+def hamming(a, b):
+    """Khoảng cách Hamming giữa từng cặp hàng của hai mảng hash đã đóng gói"""
+    if hasattr(np, "bitwise_count") and a.shape[-1] % 8 == 0:
+        # NumPy >= 2.0: popcount trên từng word 64-bit thay vì tra bảng từng byte
+        words = np.bitwise_xor(np.ascontiguousarray(a).view(np.uint64), np.ascontiguousarray(b).view(np.uint64))
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[np.bitwise_xor(a, b)].sum(axis=1, dtype=np.int32)
+
+
+def _band_keys(hashes, band):
+    """Gộp các byte của một band thành khóa uint64 để sort / group.
+
+    Band rộng hơn 8 byte (max_distance nhỏ) không vừa uint64 nên dùng khóa np.void cùng độ rộng;
+    sort và so sánh trên void là so sánh từng byte nên vẫn nhóm chính xác.
+    """
+    sub = hashes[:, band]
+    if sub.shape[1] > 8:
+        return np.ascontiguousarray(sub).view(np.dtype((np.void, sub.shape[1]))).ravel()
+    padded = np.zeros((len(hashes), 8), dtype=np.uint8)
+    padded[:, :sub.shape[1]] = sub
+    return padded.view(np.uint64).ravel()
+
+
+def _candidate_blocks(order, starts, sizes, block_pairs):
+    """Mọi cặp (i < j) trong từng bucket, sinh theo khối khoảng `block_pairs` cặp.
+
+    Bucket cùng kích thước được ghép chung vào một khối (vector hóa); bucket có nhiều cặp hơn
+    block_pairs được chia theo hàng. Bộ nhớ chỉ phụ thuộc block_pairs, không phụ thuộc bucket lớn nhất.
+    """
+    for size in np.unique(sizes[sizes >= 2]):
+        size_starts = starts[sizes == size]
+        pairs_per_bucket = size * (size - 1) // 2
+        if pairs_per_bucket <= block_pairs:
+            a, b = np.triu_indices(size, 1)
+            step = max(1, block_pairs // pairs_per_bucket)
+            for k in range(0, len(size_starts), step):
+                chunk = size_starts[k:k + step, None]
+                yield order[chunk + a].ravel(), order[chunk + b].ravel()
+            continue
+        rows = max(1, block_pairs // size)
+        for start in size_starts:
+            members = order[start:start + size]
+            for first in range(0, size - 1, rows):
+                a, b = np.meshgrid(np.arange(first, min(first + rows, size - 1)), np.arange(size), indexing="ij")
+                upper = b > a
+                yield members[a[upper]], members[b[upper]]
+
+
+def find_near_duplicates(hashes, max_distance=None, block_pairs=None):
+    """Các cặp (i, j, khoảng cách) với i < j và Hamming <= max_distance.
+
+    Chia hash thành max_distance + 1 band: theo nguyên lý chuồng bồ câu, hai hash cách nhau
+    tối đa max_distance bit phải trùng khớp hoàn toàn ít nhất một band, nên chỉ cần so sánh
+    các ảnh cùng bucket thay vì mọi cặp. Mọi cặp trong bucket đều được so sánh nên kết quả
+    là chính xác, không phải xấp xỉ.
+    """
+    max_distance = DEDUP_CONFIG["max_distance"] if max_distance is None else max_distance
+    block_pairs = block_pairs or DEDUP_CONFIG["block_pairs"]
+    num_bytes = hashes.shape[1]
+    num_bands = max_distance + 1
+    if num_bands > num_bytes:
+        raise ValueError(f"max_distance must be < {num_bytes} for {num_bytes * 8}-bit hashes")
+
+    edges = np.linspace(0, num_bytes, num_bands + 1).astype(int)
+    n = len(hashes)
+    codes = []
+    for b in range(num_bands):
+        keys = _band_keys(hashes, slice(edges[b], edges[b + 1]))
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+
+        for i, j in _candidate_blocks(order, starts, sizes, block_pairs):
+            close = hamming(hashes[i], hashes[j]) <= max_distance
+            i, j = i[close].astype(np.int64), j[close].astype(np.int64)
+            codes.append(np.minimum(i, j) * n + np.maximum(i, j))
+
+    codes = np.unique(np.concatenate(codes)) if codes else np.empty(0, dtype=np.int64)
+    i, j = codes // n, codes % n
+    return i, j, hamming(hashes[i], hashes[j])
+
+
+def _iter_source(source, chunk_size):
+    """Chunk ảnh uint8 (N, 28, 28) từ 'mnist:train' / 'mnist:test' hoặc thư mục shard của ingest.py"""
+    if source.startswith("mnist:"):
+        from dataset_loader import load_mnist_cached
+        (x_train, _), (x_test, _) = load_mnist_cached()
+        x = x_train if source == "mnist:train" else x_test
+        for start in range(0, len(x), chunk_size):
+            yield np.rint(np.asarray(x[start:start + chunk_size])[..., 0] * 255).astype(np.uint8)
+    else:
+        from ingest import ShardedDataset
+        for shard in ShardedDataset(source).x:
+            for start in range(0, len(shard), chunk_size):
+                yield np.asarray(shard[start:start + chunk_size])
+
+
+def build_index(splits, chunk_size=None):
+    """Hash mọi ảnh của các split theo thứ tự ưu tiên; trả về (hashes, exact_keys, split_ids)"""
+    chunk_size = chunk_size or DEDUP_CONFIG["chunk_size"]
+    hashes, keys, split_ids = [], [], []
+    for split_id, (name, source) in enumerate(splits):
+        for images in _iter_source(source, chunk_size):
+            hashes.append(perceptual_hashes(images))
+            keys.append(exact_keys(images))
+            split_ids.append(np.full(len(images), split_id, dtype=np.int16))
+    return np.concatenate(hashes), np.concatenate(keys), np.concatenate(split_ids)
+
+
+def deduplicate(splits, output_dir=None, max_distance=None):
+    """Báo cáo và lọc bản trùng.
+
+    `splits` là list (tên, nguồn) theo thứ tự ưu tiên, vd. [("test", ...), ("train", ...)]:
+    trong mỗi cặp trùng, ảnh đứng sau (split ưu tiên thấp hơn hoặc chỉ số lớn hơn) bị loại.
+    Tập test không mất ảnh nào vì train (ảnh train rò rỉ sang test bị bỏ khỏi train), nhưng
+    các bản trùng bên trong chính tập test vẫn bị loại khỏi keep_test.
+    """
+    output_dir = output_dir or DEDUP_CONFIG["output_dir"]
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    hashes, keys, split_ids = build_index(splits)
+    hash_time = time.perf_counter() - start
+
+    # Trùng tuyệt đối: nối mọi ảnh với ảnh đầu tiên có cùng nội dung
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    exact_j = np.flatnonzero(first[inverse] != np.arange(len(keys)))
+    exact_i = first[inverse][exact_j]
+
+    near_i, near_j, distances = find_near_duplicates(hashes, max_distance)
+    not_exact = keys[near_i] != keys[near_j]
+    near_i, near_j, distances = near_i[not_exact], near_j[not_exact], distances[not_exact]
+    search_time = time.perf_counter() - start - hash_time
+
+    pair_i = np.concatenate([exact_i, near_i])
+    pair_j = np.concatenate([exact_j, near_j])
+    is_exact = np.r_[np.ones(len(exact_i), dtype=bool), np.zeros(len(near_i), dtype=bool)]
+    cross = split_ids[pair_i] != split_ids[pair_j]
+
+    dropped = np.zeros(len(keys), dtype=bool)
+    dropped[pair_j] = True
+    leaked = np.zeros(len(keys), dtype=bool)
+    leaked[pair_j[cross]] = True
+    exact = np.zeros(len(keys), dtype=bool)
+    exact[pair_j[is_exact & ~cross]] = True
+
+    report = {"max_distance": DEDUP_CONFIG["max_distance"] if max_distance is None else max_distance,
+              "images": int(len(keys)), "hash_seconds": hash_time, "search_seconds": search_time,
+              "splits": {}}
+    for split_id, (name, source) in enumerate(splits):
+        in_split = split_ids == split_id
+        keep = ~dropped[in_split]
+        np.save(os.path.join(output_dir, f"keep_{name}.npy"), keep)
+        report["splits"][name] = {
+            "source": source,
+            "images": int(in_split.sum()),
+            "kept": int(keep.sum()),
+            "cross_split_duplicates": int((leaked & in_split).sum()),
+            "exact_duplicates": int((exact & ~leaked & in_split).sum()),
+            "near_duplicates": int((dropped & ~exact & ~leaked & in_split).sum())
+        }
+
+    offsets = np.r_[0, np.cumsum([r["images"] for r in report["splits"].values()])]
+    np.savez(os.path.join(output_dir, "duplicate_pairs.npz"),
+             split_i=split_ids[pair_i], index_i=pair_i - offsets[split_ids[pair_i]],
+             split_j=split_ids[pair_j], index_j=pair_j - offsets[split_ids[pair_j]],
+             distance=np.r_[np.zeros(len(exact_i), dtype=np.int32), distances])
+    with open(os.path.join(output_dir, "dedup_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    """Tìm bản trùng giữa các split từ command line"""
+    parser = argparse.ArgumentParser(description="Exact / near-duplicate detection across dataset splits")
+    parser.add_argument("--split", action="append", metavar="NAME=SOURCE",
+                        help="Split in priority order; SOURCE is mnist:train, mnist:test or a shard directory")
+    parser.add_argument("--max-distance", type=int, default=None)
+    parser.add_argument("--output-dir", default=None)
+    args = parser.parse_args()
+
+    splits = [tuple(s.split("=", 1)) for s in args.split] if args.split else \
+        [("test", "mnist:test"), ("train", "mnist:train")]
+    report = deduplicate(splits, args.output_dir, args.max_distance)
+
+    print(f"🔍 {report['images']:,} images hashed in {report['hash_seconds']:.1f}s, "
+          f"searched in {report['search_seconds']:.1f}s (Hamming <= {report['max_distance']})")
+    print(f"\n{'Split':<10} {'Images':>10} {'Exact':>8} {'Near':>8} {'Leaked':>8} {'Kept':>10}")
+    for name, r in report["splits"].items():
+        print(f"{name:<10} {r['images']:>10,} {r['exact_duplicates']:>8,} {r['near_duplicates']:>8,} "
+              f"{r['cross_split_duplicates']:>8,} {r['kept']:>10,}")
+
+
+if __name__ == "__main__":
+    main()
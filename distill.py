@@ -0,0 +1,165 @@
+"""
+Knowledge Distillation for AI Handwriting Recognition System
+Trains small student CNNs against cached soft targets of handwriting_model.h5
+and reports latency against accuracy for each student
+"""
+
+import os
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from config import DISTILLATION_CONFIG
+from dataset_loader import load_mnist_cached
+from model import STUDENT_ARCHITECTURES, build_student_model
+from benchmark import measure_latency, keras_forward, file_size_mb
+
+
+def _teacher_fingerprint(teacher_path):
+    """Định danh teacher theo kích thước + mtime để biết khi nào cache hết hạn"""
+    stat = os.stat(teacher_path)
+    return f"{os.path.abspath(teacher_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def cache_teacher_outputs(teacher_path=None, cache_path=None, batch_size=1024):
+    """Chạy teacher một lần trên tập train và lưu xác suất; lần sau đọc lại từ cache"""
+    cfg = DISTILLATION_CONFIG
+    teacher_path = teacher_path or cfg["teacher_model"]
+    cache_path = cache_path or cfg["soft_targets_cache"]
+    fingerprint = _teacher_fingerprint(teacher_path)
+
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if str(cached["fingerprint"]) == fingerprint:
+            print("♻️ Using cached teacher soft targets")
+            return cached["probs"]
+
+    print("🧑‍🏫 Computing teacher soft targets...")
+    teacher = tf.keras.models.load_model(teacher_path, compile=False)
+    (x_train, _), _ = load_mnist_cached()
+    probs = teacher.predict(x_train, batch_size=batch_size, verbose=0).astype(np.float32)
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    np.savez(cache_path, probs=probs, fingerprint=fingerprint)
+    return probs
+
+
+def soften(probs, temperature):
+    """Softmax(log p / T): làm mềm phân phối của teacher theo nhiệt độ T"""
+    logits = np.log(np.clip(probs, 1e-8, 1.0)) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return (exp / exp.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def distillation_loss(temperature, alpha):
+    """Loss = alpha * CE(nhãn thật) + (1 - alpha) * T^2 * KL(teacher || student) trên logits"""
+    def loss(y_true, logits):
+        hard, soft = y_true[:, :10], y_true[:, 10:]
+        hard_loss = tf.nn.softmax_cross_entropy_with_logits(hard, logits)
+        student_log_soft = tf.nn.log_softmax(logits / temperature)
+        kl = tf.reduce_sum(soft * (tf.math.log(soft + 1e-8) - student_log_soft), axis=-1)
+        return alpha * hard_loss + (1 - alpha) * kl * temperature ** 2
+    return loss
+
+
+def hard_accuracy(y_true, logits):
+    """Accuracy trên nhãn thật (10 cột đầu của y_true)"""
+    matches = tf.equal(tf.argmax(y_true[:, :10], axis=-1), tf.argmax(logits, axis=-1))
+    return tf.cast(matches, tf.float32)
+
+
+def train_student(name, soft_targets, data):
+    """Huấn luyện một student với soft targets đã cache"""
+    cfg = DISTILLATION_CONFIG
+    (x_train, y_train), (x_test, y_test) = data
+
+    student = build_student_model(**STUDENT_ARCHITECTURES[name])
+    # Huấn luyện trên logits, lớp softmax cuối chỉ dùng khi suy luận
+    logits_model = tf.keras.Model(student.inputs, student.get_layer("logits").output)
+    logits_model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=cfg["learning_rate"]),
+        loss=distillation_loss(cfg["temperature"], cfg["alpha"]),
+        metrics=[hard_accuracy]
+    )
+
+    targets = np.concatenate([np.eye(10, dtype=np.float32)[y_train], soft_targets], axis=1)
+    test_targets = np.concatenate([np.eye(10, dtype=np.float32)[y_test],
+                                   np.eye(10, dtype=np.float32)[y_test]], axis=1)
+    logits_model.fit(
+        x_train, targets,
+        epochs=cfg["epochs"],
+        batch_size=cfg["batch_size"],
+        validation_data=(x_test, test_targets),
+        verbose=1
+    )
+    return student
+
+
+def evaluate_model(name, model, x_test, y_test, path=None):
+    """Accuracy, số tham số và latency (1 ảnh / batch 128) của một mô hình"""
+    probs = model.predict(x_test, batch_size=512, verbose=0)
+    accuracy = float(np.mean(np.argmax(probs, axis=1) == y_test))
+    single = measure_latency(keras_forward(model), x_test[:1])
+    batch = measure_latency(keras_forward(model), x_test[:128], runs=20)
+    return {
+        "model": name,
+        "test_accuracy": accuracy,
+        "parameters": model.count_params(),
+        "size_mb": file_size_mb(path) if path else None,
+        "latency_1_ms": single["p50_ms"],
+        "latency_128_per_sample_ms": batch["per_sample_ms"]
+    }
+
+
+def print_table(rows):
+    """In bảng latency vs accuracy"""
+    print("\n📋 Distillation Results (latency vs accuracy)")
+    print("-" * 84)
+    print(f"{'Model':<14} {'Accuracy':>9} {'Params':>10} {'Size MB':>8} {'Lat@1 ms':>9} {'Lat@128/img ms':>15}")
+    for r in rows:
+        size = f"{r['size_mb']:.2f}" if r["size_mb"] is not None else "-"
+        print(f"{r['model']:<14} {r['test_accuracy']:>9.4f} {r['parameters']:>10,} {size:>8} "
+              f"{r['latency_1_ms']:>9.3f} {r['latency_128_per_sample_ms']:>15.4f}")
+
+
+def distill(students=None):
+    """Distill teacher sang từng student, lưu model và trả về bảng so sánh"""
+    cfg = DISTILLATION_CONFIG
+    students = students or cfg["students"]
+    os.makedirs(cfg["students_dir"], exist_ok=True)
+
+    soft_targets = soften(cache_teacher_outputs(), cfg["temperature"])
+    (x_train, y_train), (x_test, y_test) = load_mnist_cached()
+    data = ((np.asarray(x_train), np.asarray(y_train)), (np.asarray(x_test), np.asarray(y_test)))
+
+    teacher = tf.keras.models.load_model(cfg["teacher_model"], compile=False)
+    rows = [evaluate_model("teacher", teacher, data[1][0], data[1][1], cfg["teacher_model"])]
+
+    for name in students:
+        print(f"\n🎓 Distilling student '{name}'...")
+        student = train_student(name, soft_targets, data)
+        path = os.path.join(cfg["students_dir"], f"{name}.h5")
+        student.save(path)
+        rows.append(evaluate_model(name, student, data[1][0], data[1][1], path))
+
+    print_table(rows)
+    return rows
+
+
+def main():
+    """Chạy distillation từ command line"""
+    parser = argparse.ArgumentParser(description="Distill handwriting_model.h5 into small students")
+    parser.add_argument("--students", nargs="+", choices=list(STUDENT_ARCHITECTURES), default=None)
+    args = parser.parse_args()
+
+    rows = distill(args.students)
+
+    import pandas as pd
+    report_path = os.path.join(DISTILLATION_CONFIG["students_dir"], "distillation_report.csv")
+    pd.DataFrame(rows).to_csv(report_path, index=False)
+    print(f"📁 Report saved to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
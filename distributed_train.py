@@ -0,0 +1,203 @@
+"""
+Data-parallel Training for AI Handwriting Recognition System
+Launches N local worker processes under tf.distribute.MultiWorkerMirroredStrategy
+(all-reduce over localhost) with the dataset sharded across workers
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+
+from config import DISTRIBUTED_CONFIG, MODEL_CONFIG
+
+
+def find_free_ports(count):
+    """Tìm các cổng TCP trống trên localhost cho cluster"""
+    sockets, ports = [], []
+    for _ in range(count):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind((DISTRIBUTED_CONFIG["host"], 0))
+        sockets.append(s)
+        ports.append(s.getsockname()[1])
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def run_worker(worker_index, num_workers, epochs, batch_size, result_path, save_path=None, steps_per_epoch=None):
+    """Chạy trong từng process worker; TF_CONFIG đã được launcher thiết lập"""
+    import numpy as np
+    import tensorflow as tf
+    from dataset_loader import load_mnist_cached
+    from model import build_model
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(
+        communication_options=tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING
+        )
+    )
+
+    (x_train, y_train), (x_test, y_test) = load_mnist_cached(mmap=True)
+
+    # Chia shard thủ công: mỗi worker chỉ đọc phần của mình từ mmap
+    shard_size = len(x_train) // num_workers
+    start = worker_index * shard_size
+    x_shard = np.asarray(x_train[start:start + shard_size])
+    y_shard = np.asarray(y_train[start:start + shard_size])
+
+    # Dataset trả về batch toàn cục; strategy tách thành batch_size cho mỗi worker
+    global_batch = batch_size * num_workers
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    train_ds = (tf.data.Dataset.from_tensor_slices((x_shard, y_shard))
+                .shuffle(10000, seed=worker_index)
+                .repeat()
+                .batch(global_batch, drop_remainder=True)
+                .prefetch(tf.data.AUTOTUNE)
+                .with_options(options))
+    steps = steps_per_epoch or shard_size // batch_size
+
+    with strategy.scope():
+        model = build_model()
+
+    epoch_times = []
+
+    class EpochTimer(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            epoch_times.append(time.perf_counter() - self.start)
+
+    history = model.fit(train_ds, epochs=epochs, steps_per_epoch=steps, callbacks=[EpochTimer()], verbose=0)
+
+    # evaluate là collective dưới strategy nên mọi worker đều phải gọi
+    _, test_accuracy, _ = model.evaluate(x_test, y_test, batch_size=global_batch, verbose=0)
+
+    if worker_index == 0:
+        # Bỏ epoch đầu (khởi tạo collective + tracing) khi tính throughput
+        steady = epoch_times[1:] or epoch_times
+        samples_per_epoch = steps * global_batch
+        result = {
+            "num_workers": num_workers,
+            "global_batch_size": global_batch,
+            "steps_per_epoch": steps,
+            "epoch_times_s": epoch_times,
+            "samples_per_second": samples_per_epoch / (sum(steady) / len(steady)),
+            "final_loss": float(history.history["loss"][-1]),
+            "test_accuracy": float(test_accuracy)
+        }
+        with open(result_path, "w") as f:
+            json.dump(result, f, indent=2)
+        if save_path:
+            model.save(save_path)
+
+
+def launch(num_workers=None, epochs=None, batch_size=None, save_path=None, steps_per_epoch=None):
+    """Khởi động N worker cục bộ và trả về kết quả của chief"""
+    cfg = DISTRIBUTED_CONFIG
+    num_workers = num_workers or cfg["num_workers"]
+    epochs = epochs or cfg["epochs"]
+    batch_size = batch_size or cfg["per_worker_batch_size"]
+
+    from dataset_loader import cache_mnist
+    cache_mnist()
+
+    os.makedirs(cfg["results_dir"], exist_ok=True)
+    result_path = os.path.join(cfg["results_dir"], f"workers_{num_workers}.json")
+    ports = find_free_ports(num_workers)
+    cluster = {"worker": [f"{cfg['host']}:{port}" for port in ports]}
+    threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env["TF_CONFIG"] = json.dumps({"cluster": cluster, "task": {"type": "worker", "index": index}})
+        env["TF_NUM_INTRAOP_THREADS"] = str(threads)
+        env["OMP_NUM_THREADS"] = str(threads)
+        env.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker-index", str(index),
+               "--workers", str(num_workers), "--epochs", str(epochs),
+               "--batch-size", str(batch_size), "--result", result_path]
+        if steps_per_epoch:
+            cmd += ["--steps-per-epoch", str(steps_per_epoch)]
+        if save_path and index == 0:
+            cmd += ["--save", save_path]
+        processes.append(subprocess.Popen(cmd, env=env))
+
+    return_codes = [p.wait() for p in processes]
+    if any(return_codes):
+        raise RuntimeError(f"Distributed training failed, worker exit codes: {return_codes}")
+
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def benchmark_scaling(worker_counts=None, epochs=None, steps_per_epoch=None):
+    """Chạy với nhiều số worker khác nhau và tính scaling efficiency so với 1 worker"""
+    worker_counts = worker_counts or DISTRIBUTED_CONFIG["scaling_worker_counts"]
+    results = [launch(n, epochs, steps_per_epoch=steps_per_epoch) for n in worker_counts]
+    return add_scaling_metrics(results)
+
+
+def add_scaling_metrics(results):
+    """Speedup và efficiency = throughput_N / (N * throughput_1 worker)"""
+    baseline = min(results, key=lambda r: r["num_workers"])
+    base_per_worker = baseline["samples_per_second"] / baseline["num_workers"]
+    for r in results:
+        r["speedup"] = r["samples_per_second"] / baseline["samples_per_second"]
+        r["scaling_efficiency"] = r["samples_per_second"] / (base_per_worker * r["num_workers"])
+    return results
+
+
+def print_scaling_report(results):
+    """In bảng throughput / speedup / efficiency"""
+    print("\n📈 Scaling Report")
+    print("-" * 66)
+    print(f"{'Workers':>8} {'Global batch':>13} {'Samples/s':>12} {'Speedup':>9} {'Efficiency':>11} {'Test acc':>9}")
+    for r in results:
+        print(f"{r['num_workers']:>8} {r['global_batch_size']:>13} {r['samples_per_second']:>12.1f} "
+              f"{r.get('speedup', 1.0):>9.2f} {r.get('scaling_efficiency', 1.0):>10.1%} {r['test_accuracy']:>9.4f}")
+
+
+def main():
+    """Chạy training phân tán từ command line"""
+    parser = argparse.ArgumentParser(description="Data-parallel multi-worker training on one host")
+    parser.add_argument("--workers", type=int, default=DISTRIBUTED_CONFIG["num_workers"])
+    parser.add_argument("--epochs", type=int, default=DISTRIBUTED_CONFIG["epochs"])
+    parser.add_argument("--batch-size", type=int, default=DISTRIBUTED_CONFIG["per_worker_batch_size"])
+    parser.add_argument("--steps-per-epoch", type=int, default=None)
+    parser.add_argument("--scaling", action="store_true", help="Benchmark scaling across worker counts")
+    parser.add_argument("--scaling-report", action="store_true",
+                        help="Also run a 1-worker baseline and report scaling efficiency")
+    parser.add_argument("--save", default=None, help="Save the trained model (chief only)")
+    # Tham số nội bộ khi launcher khởi động worker
+    parser.add_argument("--worker-index", type=int, default=None)
+    parser.add_argument("--result", default=None)
+    args = parser.parse_args()
+
+    if args.worker_index is not None:
+        run_worker(args.worker_index, args.workers, args.epochs, args.batch_size,
+                   args.result, args.save, args.steps_per_epoch)
+        return
+
+    if args.scaling:
+        results = benchmark_scaling(epochs=args.epochs, steps_per_epoch=args.steps_per_epoch)
+    else:
+        print(f"🚀 Launching {args.workers} local workers...")
+        results = [launch(args.workers, args.epochs, args.batch_size, args.save or MODEL_CONFIG["model_file"],
+                          args.steps_per_epoch)]
+        if args.workers > 1 and args.scaling_report:
+            # Cần baseline 1 worker để tính efficiency
+            print("⏱️ Running 1-worker baseline for scaling efficiency...")
+            results.insert(0, launch(1, args.epochs, args.batch_size, steps_per_epoch=args.steps_per_epoch))
+        results = add_scaling_metrics(results)
+    print_scaling_report(results)
+
+
+if __name__ == "__main__":
+    main()
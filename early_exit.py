@@ -0,0 +1,145 @@
+"""
+Early-Exit Inference for AI Handwriting Recognition System
+Runs the multi-exit CNN stage by stage and lets each sample in a batch stop
+at the first classifier head whose confidence passes the exit threshold;
+reports accuracy, exit distribution, compute saved and latency per threshold
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from config import EARLY_EXIT_CONFIG
+from model import build_early_exit_model
+from benchmark import count_macs
+
+
+class EarlyExitPredictor:
+    def __init__(self, model=None, threshold=None):
+        cfg = EARLY_EXIT_CONFIG
+        if model is None or isinstance(model, str):
+            model = tf.keras.models.load_model(model or cfg["model_file"], compile=False)
+        self.model = model
+        self.threshold = cfg["exit_threshold"] if threshold is None else threshold
+        self.stages = [model.get_layer(f"stage_{i}") for i in (1, 2, 3)]
+
+        # Chi phí (MAC) tích lũy khi dừng ở từng exit, gồm cả các head đã chạy trước đó
+        self.stage_macs = [count_macs(stage) for stage in self.stages]
+        self.exit_macs = np.cumsum(self.stage_macs)
+        self.stats = {"images": 0, "exits": np.zeros(3, dtype=np.int64)}
+
+    def predict_proba(self, images, threshold=None):
+        """Trả về (probs, exit_index) với exit_index ∈ {0, 1, 2} cho từng ảnh.
+
+        Chỉ các ảnh chưa đủ tự tin mới được gom lại và chạy tiếp stage sau.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        images = np.asarray(images, dtype=np.float32)
+        n = len(images)
+        probs = np.zeros((n, 10), dtype=np.float32)
+        exits = np.full(n, 2, dtype=np.int64)
+
+        active = np.arange(n)
+        features = images
+        for index, stage in enumerate(self.stages):
+            if index < 2:
+                next_features, stage_probs = stage(features, training=False)
+                stage_probs = stage_probs.numpy()
+                done = stage_probs.max(axis=1) >= threshold
+                probs[active[done]] = stage_probs[done]
+                exits[active[done]] = index
+                if done.all():
+                    break
+                keep = ~done
+                active = active[keep]
+                features = tf.boolean_mask(next_features, keep)
+            else:
+                probs[active] = stage(features, training=False).numpy()
+
+        self.stats["images"] += n
+        self.stats["exits"] += np.bincount(exits, minlength=3)
+        return probs, exits
+
+    def predict(self, images, threshold=None):
+        probs, _ = self.predict_proba(images, threshold)
+        return np.argmax(probs, axis=1), np.max(probs, axis=1)
+
+    def compute_saved(self, exits):
+        """Tỉ lệ MAC tiết kiệm so với chạy đủ cả ba stage"""
+        return 1.0 - float(self.exit_macs[exits].mean() / self.exit_macs[-1])
+
+
+def train_early_exit(epochs=None, save_path=None):
+    """Huấn luyện chung ba đầu ra trên MNIST và lưu model"""
+    from dataset_loader import load_mnist_cached
+
+    cfg = EARLY_EXIT_CONFIG
+    epochs = epochs or cfg["epochs"]
+    save_path = save_path or cfg["model_file"]
+    (x_train, y_train), (x_test, y_test) = load_mnist_cached()
+    x_train, y_train = np.asarray(x_train), np.asarray(y_train)
+    x_test, y_test = np.asarray(x_test), np.asarray(y_test)
+
+    model = build_early_exit_model(loss_weights=cfg["loss_weights"])
+    model.fit(x_train, [y_train] * 3, epochs=epochs, batch_size=cfg["batch_size"],
+              validation_data=(x_test, [y_test] * 3), verbose=1)
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    model.save(save_path)
+    print(f"✅ Early-exit model saved to {save_path}")
+    return model
+
+
+def evaluate_thresholds(predictor, thresholds=None, batch_size=256):
+    """Accuracy / phân bố exit / compute tiết kiệm / latency trên tập test MNIST theo ngưỡng"""
+    from dataset_loader import load_mnist_cached
+
+    thresholds = thresholds or EARLY_EXIT_CONFIG["sweep_thresholds"]
+    _, (x_test, y_test) = load_mnist_cached()
+    x_test, y_test = np.asarray(x_test), np.asarray(y_test)
+
+    rows = []
+    # Ngưỡng > 1: không ảnh nào thoát sớm, tương đương chạy đủ mô hình
+    for threshold in [1.01] + list(thresholds):
+        start = time.perf_counter()
+        predictions, exits = [], []
+        for i in range(0, len(x_test), batch_size):
+            probs, batch_exits = predictor.predict_proba(x_test[i:i + batch_size], threshold)
+            predictions.append(np.argmax(probs, axis=1))
+            exits.append(batch_exits)
+        elapsed = time.perf_counter() - start
+        exits = np.concatenate(exits)
+        distribution = np.bincount(exits, minlength=3) / len(exits)
+        rows.append({
+            "threshold": "full" if threshold > 1 else threshold,
+            "accuracy": float(np.mean(np.concatenate(predictions) == y_test)),
+            "exit_1": float(distribution[0]),
+            "exit_2": float(distribution[1]),
+            "exit_3": float(distribution[2]),
+            "compute_saved": predictor.compute_saved(exits),
+            "ms_per_image": elapsed * 1000 / len(x_test)
+        })
+    return rows
+
+
+def main():
+    """Huấn luyện (nếu cần) và đánh giá early exit từ command line"""
+    parser = argparse.ArgumentParser(description="Multi-exit CNN with per-sample early exit")
+    parser.add_argument("--train", action="store_true", help="Train the early-exit model first")
+    parser.add_argument("--epochs", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.train or not os.path.exists(EARLY_EXIT_CONFIG["model_file"]):
+        train_early_exit(args.epochs)
+
+    predictor = EarlyExitPredictor()
+    print(f"🚪 MACs per stage: {', '.join(f'{m:,}' for m in predictor.stage_macs)}")
+    print(f"\n{'Threshold':>9} {'Accuracy':>9} {'Exit1':>7} {'Exit2':>7} {'Exit3':>7} {'Saved':>7} {'ms/img':>8}")
+    for r in evaluate_thresholds(predictor):
+        print(f"{str(r['threshold']):>9} {r['accuracy']:>9.4f} {r['exit_1']:>7.1%} {r['exit_2']:>7.1%} "
+              f"{r['exit_3']:>7.1%} {r['compute_saved']:>7.1%} {r['ms_per_image']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
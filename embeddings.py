@@ -0,0 +1,177 @@
+"""
+Embedding Extraction & Nearest-Neighbor Lookup for AI Handwriting Recognition System
+Exposes the penultimate Dense layer of the CNN as a digit embedding, stores a
+reference set as a compact float16 matrix and answers k-NN queries with a
+blocked matrix multiply; ambiguous predictions can fall back to a k-NN vote
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from config import EMBEDDING_CONFIG, MODEL_CONFIG, PERFORMANCE_CONFIG
+
+NUM_CLASSES = 10
+
+
+def embedding_model(model):
+    """Model cắt tại lớp Dense cuối cùng trước lớp output (Dense(256) của build_model)"""
+    dense = [layer for layer in model.layers[:-1] if isinstance(layer, tf.keras.layers.Dense)]
+    if not dense:
+        raise ValueError("Model has no hidden Dense layer to use as an embedding")
+    return tf.keras.Model(model.inputs, dense[-1].output)
+
+
+def l2_normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def extract_embeddings(extractor, images, batch_size=None):
+    """Embedding đã chuẩn hóa L2 (float32) cho một mảng hoặc memmap ảnh (N, 28, 28, 1)"""
+    batch_size = batch_size or EMBEDDING_CONFIG["batch_size"]
+    out = []
+    for start in range(0, len(images), batch_size):
+        batch = np.asarray(images[start:start + batch_size], dtype=np.float32)
+        out.append(extractor(batch, training=False).numpy())
+    return l2_normalize(np.concatenate(out)) if out else np.empty((0, extractor.output.shape[-1]), np.float32)
+
+
+class EmbeddingIndex:
+    """Ma trận embedding float16 của tập tham chiếu + nhãn, tìm k-NN theo cosine similarity"""
+
+    def __init__(self, vectors, labels, ids=None):
+        self.vectors = vectors
+        self.labels = np.asarray(labels)
+        self.ids = np.arange(len(labels)) if ids is None else np.asarray(ids)
+
+    @classmethod
+    def build(cls, extractor, images, labels, ids=None, batch_size=None):
+        vectors = extract_embeddings(extractor, images, batch_size).astype(np.float16)
+        return cls(vectors, np.asarray(labels).astype(np.int8), ids)
+
+    def save(self, index_dir=None):
+        index_dir = index_dir or EMBEDDING_CONFIG["index_dir"]
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "vectors.npy"), self.vectors)
+        np.save(os.path.join(index_dir, "labels.npy"), self.labels)
+        np.save(os.path.join(index_dir, "ids.npy"), self.ids)
+        return index_dir
+
+    @classmethod
+    def load(cls, index_dir=None, mmap=True):
+        """Tải index; với mmap=True ma trận được đọc dần theo block khi tìm kiếm"""
+        index_dir = index_dir or EMBEDDING_CONFIG["index_dir"]
+        mode = "r" if mmap else None
+        return cls(np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode=mode),
+                   np.load(os.path.join(index_dir, "labels.npy")),
+                   np.load(os.path.join(index_dir, "ids.npy")))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def search(self, queries, k=None, block_rows=None):
+        """k láng giềng gần nhất của từng query (đã chuẩn hóa L2).
+
+        Duyệt ma trận tham chiếu theo block: mỗi block là một phép nhân ma trận, chỉ giữ top-k
+        tạm thời nên bộ nhớ tỉ lệ với block_rows chứ không với kích thước index.
+        Trả về (indices, similarities) shape (Q, k), sắp xếp giảm dần.
+        """
+        k = min(k or EMBEDDING_CONFIG["k"], len(self))
+        block_rows = block_rows or EMBEDDING_CONFIG["block_rows"]
+        queries = np.asarray(queries, dtype=np.float32)
+
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_sim = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self), block_rows):
+            block = np.asarray(self.vectors[start:start + block_rows], dtype=np.float32)
+            sims = queries @ block.T
+            take = min(k, sims.shape[1])
+            top = np.argpartition(-sims, take - 1, axis=1)[:, :take]
+            best_idx = np.concatenate([best_idx, top + start], axis=1)
+            best_sim = np.concatenate([best_sim, np.take_along_axis(sims, top, axis=1)], axis=1)
+            if best_idx.shape[1] > k:
+                keep = np.argpartition(-best_sim, k - 1, axis=1)[:, :k]
+                best_idx = np.take_along_axis(best_idx, keep, axis=1)
+                best_sim = np.take_along_axis(best_sim, keep, axis=1)
+
+        order = np.argsort(-best_sim, axis=1, kind="stable")
+        return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_sim, order, axis=1)
+
+    def knn_proba(self, queries, k=None):
+        """Phân phối nhãn từ k láng giềng, trọng số theo similarity"""
+        indices, sims = self.search(queries, k)
+        weights = np.maximum(sims, 0.0) + 1e-6
+        probs = np.zeros((len(queries), NUM_CLASSES), dtype=np.float32)
+        np.add.at(probs, (np.arange(len(queries))[:, None], self.labels[indices]), weights)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+
+class KnnFallbackPredictor:
+    """Dự đoán bằng CNN; ảnh có confidence thấp được trộn với phiếu bầu k-NN trên embedding"""
+
+    def __init__(self, model=None, index=None, confidence_threshold=None, weight=None):
+        if model is None or isinstance(model, str):
+            model = tf.keras.models.load_model(model or MODEL_CONFIG["model_file"], compile=False)
+        self.model = model
+        self.extractor = embedding_model(model)
+        # Một forward pass cho cả xác suất lẫn embedding; dùng model.outputs vì trong Keras 3
+        # Sequential chưa được gọi lần nào không có thuộc tính .output
+        self._both = tf.keras.Model(model.inputs, [model.outputs[0], self.extractor.output])
+        self.index = index if index is not None else EmbeddingIndex.load()
+        self.confidence_threshold = (PERFORMANCE_CONFIG["confidence_threshold"]
+                                     if confidence_threshold is None else confidence_threshold)
+        self.weight = EMBEDDING_CONFIG["fallback_weight"] if weight is None else weight
+
+    def predict_proba(self, images):
+        """Trả về (probs, fallback_mask) cho một batch đã tiền xử lý"""
+        probs, vectors = self._both(np.asarray(images, dtype=np.float32), training=False)
+        probs, vectors = probs.numpy(), vectors.numpy()
+        fallback = probs.max(axis=1) < self.confidence_threshold
+        if fallback.any():
+            knn = self.index.knn_proba(l2_normalize(vectors[fallback]))
+            probs[fallback] = (1 - self.weight) * probs[fallback] + self.weight * knn
+        return probs, fallback
+
+    def similar(self, images, k=None):
+        """(indices, similarities) của các mẫu tham chiếu giống nhất, để review"""
+        vectors = l2_normalize(self.extractor(np.asarray(images, dtype=np.float32), training=False).numpy())
+        indices, sims = self.index.search(vectors, k)
+        return self.index.ids[indices], sims
+
+
+def main():
+    """Xây dựng index embedding từ tập train MNIST và đánh giá k-NN trên tập test"""
+    from dataset_loader import load_mnist_cached
+
+    parser = argparse.ArgumentParser(description="Penultimate-layer embeddings and k-NN lookup")
+    parser.add_argument("--model", default=MODEL_CONFIG["model_file"])
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--k", type=int, default=None)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    extractor = embedding_model(model)
+    (x_train, y_train), (x_test, y_test) = load_mnist_cached()
+
+    start = time.perf_counter()
+    index = EmbeddingIndex.build(extractor, x_train, y_train)
+    path = index.save(args.index_dir)
+    print(f"🧭 {len(index):,} x {index.vectors.shape[1]} float16 embeddings "
+          f"({index.vectors.nbytes / 1024 / 1024:.1f} MB) in {time.perf_counter() - start:.1f}s -> {path}")
+
+    queries = extract_embeddings(extractor, x_test)
+    start = time.perf_counter()
+    knn = index.knn_proba(queries, args.k)
+    elapsed = time.perf_counter() - start
+    cnn = model.predict(np.asarray(x_test), batch_size=512, verbose=0)
+    print(f"🔎 k-NN over {len(queries):,} queries in {elapsed:.2f}s "
+          f"({elapsed * 1000 / len(queries):.3f} ms/query)")
+    print(f"   CNN accuracy: {np.mean(np.argmax(cnn, axis=1) == y_test):.4f}  "
+          f"k-NN accuracy: {np.mean(np.argmax(knn, axis=1) == y_test):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Ensemble & Test-Time Augmentation Predictor for AI Handwriting Recognition System
+Easy images stay on a single fast forward pass; only images below the
+confidence threshold go through the ensemble, with every TTA variant of
+the batch stacked into one tensor per model
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import cv2
+import tensorflow as tf
+
+from config import ENSEMBLE_CONFIG, PERFORMANCE_CONFIG
+
+
+def shift_images(images, dx, dy):
+    """Dịch ảnh (N, 28, 28, 1) dx/dy pixel, phần trống điền 0 (nền đen)"""
+    shifted = np.zeros_like(images)
+    h, w = images.shape[1:3]
+    src_y = slice(max(0, -dy), h - max(0, dy))
+    dst_y = slice(max(0, dy), h - max(0, -dy))
+    src_x = slice(max(0, -dx), w - max(0, dx))
+    dst_x = slice(max(0, dx), w - max(0, -dx))
+    shifted[:, dst_y, dst_x] = images[:, src_y, src_x]
+    return shifted
+
+
+def rotate_images(images, angle):
+    """Xoay từng ảnh quanh tâm một góc nhỏ (độ)"""
+    h, w = images.shape[1:3]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    rotated = np.empty_like(images)
+    for i, img in enumerate(images):
+        rotated[i, ..., 0] = cv2.warpAffine(img[..., 0], matrix, (w, h), borderValue=0)
+    return rotated
+
+
+def tta_variants(images, shifts=None, rotations=None, include_identity=True):
+    """Các biến thể TTA của một batch, trả về list các mảng (N, 28, 28, 1)"""
+    shifts = ENSEMBLE_CONFIG["tta_shifts"] if shifts is None else shifts
+    rotations = ENSEMBLE_CONFIG["tta_rotations"] if rotations is None else rotations
+    variants = [images] if include_identity else []
+    variants += [shift_images(images, dx, dy) for dx, dy in shifts]
+    variants += [rotate_images(images, angle) for angle in rotations]
+    return variants
+
+
+class EnsemblePredictor:
+    def __init__(self, checkpoints=None, use_tta=None, confidence_threshold=None):
+        cfg = ENSEMBLE_CONFIG
+        self.use_tta = cfg["use_tta"] if use_tta is None else use_tta
+        self.confidence_threshold = (PERFORMANCE_CONFIG["confidence_threshold"]
+                                     if confidence_threshold is None else confidence_threshold)
+        self.models = []
+        for path in checkpoints or cfg["checkpoints"]:
+            if os.path.exists(path):
+                self.models.append(tf.keras.models.load_model(path, compile=False))
+            else:
+                print(f"⚠️ Ensemble checkpoint not found, skipping: {path}")
+        if not self.models:
+            raise FileNotFoundError("No ensemble checkpoints available")
+        self.stats = {"images": 0, "escalated": 0}
+
+    def _forward(self, model, batch):
+        """Một forward pass duy nhất cho cả tensor đã stack"""
+        return model(batch, training=False).numpy()
+
+    def ensemble_proba(self, images, primary_probs=None):
+        """Trung bình xác suất trên mọi model x biến thể TTA.
+
+        Nếu đã có primary_probs (fast path) thì biến thể gốc của model đầu tiên được tái sử dụng.
+        """
+        n = len(images)
+        variants = tta_variants(images) if self.use_tta else [images]
+        num_variants = len(variants)
+        stacked = np.concatenate(variants, axis=0)
+
+        total = np.zeros((n, 10), dtype=np.float64)
+        for index, model in enumerate(self.models):
+            if index == 0 and primary_probs is not None:
+                total += primary_probs
+                if num_variants > 1:
+                    probs = self._forward(model, stacked[n:])
+                    total += probs.reshape(num_variants - 1, n, -1).sum(axis=0)
+            else:
+                probs = self._forward(model, stacked)
+                total += probs.reshape(num_variants, n, -1).sum(axis=0)
+        return (total / (num_variants * len(self.models))).astype(np.float32)
+
+    def predict_proba(self, images, gated=True):
+        """Fast path bằng model đầu tiên; chỉ các ảnh có confidence thấp mới chạy ensemble.
+
+        Trả về (probs, escalated_mask).
+        """
+        images = np.asarray(images, dtype=np.float32)
+        if gated:
+            probs = self._forward(self.models[0], images)
+            escalated = probs.max(axis=1) < self.confidence_threshold
+            if escalated.any():
+                probs[escalated] = self.ensemble_proba(images[escalated], probs[escalated])
+        else:
+            probs = self.ensemble_proba(images)
+            escalated = np.ones(len(images), dtype=bool)
+
+        self.stats["images"] += len(images)
+        self.stats["escalated"] += int(escalated.sum())
+        return probs, escalated
+
+    def predict(self, images, gated=True):
+        """Nhãn dự đoán và confidence cho một batch"""
+        probs, _ = self.predict_proba(images, gated)
+        return np.argmax(probs, axis=1), np.max(probs, axis=1)
+
+    @property
+    def escalation_rate(self):
+        return self.stats["escalated"] / max(1, self.stats["images"])
+
+
+def evaluate(predictor, batch_size=None):
+    """So sánh fast path, ensemble có gate và ensemble đầy đủ trên tập test MNIST"""
+    from dataset_loader import load_mnist_cached
+
+    batch_size = batch_size or ENSEMBLE_CONFIG["batch_size"]
+    _, (x_test, y_test) = load_mnist_cached()
+    x_test, y_test = np.asarray(x_test), np.asarray(y_test)
+
+    def run(mode):
+        start = time.perf_counter()
+        predictions, escalated = [], 0
+        for i in range(0, len(x_test), batch_size):
+            batch = x_test[i:i + batch_size]
+            if mode == "fast":
+                probs = predictor._forward(predictor.models[0], batch)
+            else:
+                probs, mask = predictor.predict_proba(batch, gated=(mode == "gated"))
+                escalated += int(mask.sum())
+            predictions.append(np.argmax(probs, axis=1))
+        elapsed = time.perf_counter() - start
+        accuracy = float(np.mean(np.concatenate(predictions) == y_test))
+        return {
+            "mode": mode,
+            "accuracy": accuracy,
+            "escalation_rate": escalated / len(x_test),
+            "ms_per_image": elapsed * 1000 / len(x_test)
+        }
+
+    return [run("fast"), run("gated"), run("full")]
+
+
+def main():
+    """Dự đoán ảnh hoặc đánh giá ensemble từ command line"""
+    parser = argparse.ArgumentParser(description="Ensemble + TTA prediction")
+    parser.add_argument("images", nargs="*", help="Image files to recognize")
+    parser.add_argument("--evaluate", action="store_true", help="Evaluate on the MNIST test set")
+    parser.add_argument("--no-tta", action="store_true")
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args()
+
+    predictor = EnsemblePredictor(use_tta=not args.no_tta, confidence_threshold=args.threshold)
+    print(f"🧩 Ensemble of {len(predictor.models)} models, TTA={'on' if predictor.use_tta else 'off'}, "
+          f"threshold={predictor.confidence_threshold}")
+
+    if args.evaluate:
+        print(f"\n{'Mode':<8} {'Accuracy':>9} {'Escalated':>10} {'ms/img':>8}")
+        for r in evaluate(predictor):
+            print(f"{r['mode']:<8} {r['accuracy']:>9.4f} {r['escalation_rate']:>9.1%} {r['ms_per_image']:>8.3f}")
+
+    if args.images:
+        from preprocess import preprocess_image
+        batch = np.concatenate([preprocess_image(path) for path in args.images]).astype(np.float32)
+        probs, escalated = predictor.predict_proba(batch)
+        for path, p, esc in zip(args.images, probs, escalated):
+            print(f"🎯 {path}: {np.argmax(p)} ({np.max(p):.2%}){' [ensemble]' if esc else ''}")
+
+
+if __name__ == "__main__":
+    main()
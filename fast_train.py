@@ -0,0 +1,261 @@
+"""
+Time-to-Accuracy Training for AI Handwriting Recognition System
+Picks the learning rate with a short LR range test, trains with large batches
+and a one-cycle (warm-up + cosine annealing) schedule, checks val_accuracy
+several times per epoch and stops as soon as the target is reached
+"""
+
+import os
+import csv
+import math
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+
+from config import FAST_TRAINING_CONFIG, MODEL_CONFIG
+from model import build_model
+
+
+class OneCycleSchedule(tf.keras.optimizers.schedules.LearningRateSchedule):
+    """Tăng cosine từ max_lr/div_factor lên max_lr trong pct_start đầu, sau đó giảm cosine về max_lr/final_div"""
+
+    def __init__(self, max_lr, total_steps, pct_start=0.3, div_factor=25.0, final_div_factor=1e4):
+        super().__init__()
+        self.max_lr = float(max_lr)
+        self.total_steps = int(total_steps)
+        self.pct_start = float(pct_start)
+        self.div_factor = float(div_factor)
+        self.final_div_factor = float(final_div_factor)
+
+    def __call__(self, step):
+        step = tf.cast(step, tf.float32)
+        warmup = max(1.0, self.pct_start * self.total_steps)
+        anneal = max(1.0, self.total_steps - warmup)
+        initial_lr = self.max_lr / self.div_factor
+        final_lr = initial_lr / self.final_div_factor
+
+        up = tf.minimum(step / warmup, 1.0)
+        down = tf.clip_by_value((step - warmup) / anneal, 0.0, 1.0)
+        warming = initial_lr + (self.max_lr - initial_lr) * (1.0 - tf.cos(math.pi * up)) / 2.0
+        annealing = final_lr + (self.max_lr - final_lr) * (1.0 + tf.cos(math.pi * down)) / 2.0
+        return tf.where(step < warmup, warming, annealing)
+
+    def get_config(self):
+        return {"max_lr": self.max_lr, "total_steps": self.total_steps, "pct_start": self.pct_start,
+                "div_factor": self.div_factor, "final_div_factor": self.final_div_factor}
+
+
+class TargetAccuracyStop(tf.keras.callbacks.Callback):
+    """Dừng ngay khi val_accuracy đạt target; ghi lại thời gian thực và số epoch đã chạy"""
+
+    def __init__(self, target_accuracy, evals_per_epoch=1):
+        super().__init__()
+        self.target_accuracy = target_accuracy
+        self.evals_per_epoch = evals_per_epoch
+        self.start = None
+        self.time_to_target = None
+        self.epochs_to_target = None
+        self.best_val_accuracy = 0.0
+
+    def on_train_begin(self, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        val_accuracy = float((logs or {}).get("val_accuracy", 0.0))
+        self.best_val_accuracy = max(self.best_val_accuracy, val_accuracy)
+        if val_accuracy >= self.target_accuracy and self.time_to_target is None:
+            self.time_to_target = time.perf_counter() - self.start
+            self.epochs_to_target = (epoch + 1) / self.evals_per_epoch
+            self.model.stop_training = True
+
+
+def _mnist_datasets(batch_size, seed=None):
+    """(train, validation, số mẫu train) từ cache MNIST; train lặp vô hạn để một "epoch" Keras ngắn hơn một lượt dữ liệu"""
+    from dataset_loader import load_mnist_cached
+
+    (x_train, y_train), (x_test, y_test) = load_mnist_cached()
+    x_train, y_train = np.asarray(x_train, dtype=np.float32), np.asarray(y_train)
+    train = (tf.data.Dataset.from_tensor_slices((x_train, y_train))
+             .shuffle(len(x_train), seed=seed, reshuffle_each_iteration=True)
+             .repeat()
+             .batch(batch_size, drop_remainder=True)
+             .prefetch(tf.data.AUTOTUNE))
+    validation = (tf.data.Dataset.from_tensor_slices((np.asarray(x_test, dtype=np.float32), np.asarray(y_test)))
+                  .batch(1024)
+                  .prefetch(tf.data.AUTOTUNE))
+    return train, validation, len(x_train)
+
+
+def _shard_datasets(shards_dir, batch_size, seed=None):
+    """Như _mnist_datasets nhưng đọc shard đã ingest (shards_dir/train, tùy chọn shards_dir/test)"""
+    from ingest import ShardedDataset
+
+    train_data = ShardedDataset(os.path.join(shards_dir, "train"))
+    train = train_data.as_tf_dataset(batch_size, seed=seed).repeat()
+    test_dir = os.path.join(shards_dir, "test")
+    if os.path.isdir(test_dir):
+        validation = ShardedDataset(test_dir).as_tf_dataset(1024, shuffle=False)
+    else:
+        from dataset_loader import load_mnist_cached
+        _, (x_test, y_test) = load_mnist_cached()
+        validation = tf.data.Dataset.from_tensor_slices(
+            (np.asarray(x_test, dtype=np.float32), np.asarray(y_test))).batch(1024)
+    return train, validation, len(train_data)
+
+
+def lr_range_test(dataset, min_lr=None, max_lr=None, steps=None, smoothing=0.98):
+    """Tăng LR theo hàm mũ mỗi batch trên một model mới, ghi loss đã làm mượt.
+
+    Dừng khi loss vượt 4 lần mức tốt nhất. Trả về (lr gợi ý, danh sách lr, danh sách loss);
+    lr gợi ý là LR tại loss nhỏ nhất chia 10, điểm còn giảm nhanh nhưng chưa phân kỳ.
+    """
+    cfg = FAST_TRAINING_CONFIG["range_test"]
+    min_lr = min_lr or cfg["min_lr"]
+    max_lr = max_lr or cfg["max_lr"]
+    steps = steps or cfg["steps"]
+
+    model = build_model()
+    # Float thay vì tf.Variable (Keras 3 không nhận Variable); learning_rate vẫn là biến nên assign được
+    optimizer = tf.keras.optimizers.Adam(learning_rate=float(min_lr))
+    loss_fn = tf.keras.losses.SparseCategoricalCrossentropy()
+
+    @tf.function
+    def train_step(x, y):
+        with tf.GradientTape() as tape:
+            loss = loss_fn(y, model(x, training=True))
+        optimizer.apply_gradients(zip(tape.gradient(loss, model.trainable_variables), model.trainable_variables))
+        return loss
+
+    lrs, losses = [], []
+    average, best = 0.0, float("inf")
+    for step, (x, y) in enumerate(dataset.take(steps)):
+        lr = min_lr * (max_lr / min_lr) ** (step / max(1, steps - 1))
+        optimizer.learning_rate.assign(lr)
+        loss = float(train_step(x, y))
+        if not np.isfinite(loss):
+            break
+        average = smoothing * average + (1 - smoothing) * loss
+        smoothed = average / (1 - smoothing ** (step + 1))
+        lrs.append(lr)
+        losses.append(smoothed)
+        best = min(best, smoothed)
+        if step > 10 and smoothed > 4 * best:
+            break
+
+    suggested = lrs[int(np.argmin(losses))] / 10 if losses else FAST_TRAINING_CONFIG["base_learning_rate"]
+    return suggested, lrs, losses
+
+
+def scaled_learning_rate(batch_size):
+    """Quy tắc scale tuyến tính: LR gốc nhân theo tỉ lệ batch size so với batch gốc"""
+    cfg = FAST_TRAINING_CONFIG
+    return cfg["base_learning_rate"] * batch_size / cfg["base_batch_size"]
+
+
+def _log_run(run):
+    log_path = FAST_TRAINING_CONFIG["run_log"]
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    write_header = not os.path.exists(log_path)
+    with open(log_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(run))
+        if write_header:
+            writer.writeheader()
+        writer.writerow(run)
+
+
+def train_to_target(target_accuracy=None, batch_size=None, max_epochs=None, range_test=True,
+                    shards_dir=None, save_path=None, seed=None):
+    """Huấn luyện đến khi val_accuracy đạt target (hoặc hết max_epochs); lưu model và trả về thông tin run"""
+    cfg = FAST_TRAINING_CONFIG
+    target_accuracy = target_accuracy or cfg["target_accuracy"]
+    batch_size = batch_size or cfg["batch_size"]
+    max_epochs = max_epochs or cfg["max_epochs"]
+    save_path = save_path or MODEL_CONFIG["model_file"]
+    evals_per_epoch = cfg["evals_per_epoch"]
+
+    wall_start = time.perf_counter()
+    if shards_dir:
+        train, validation, num_samples = _shard_datasets(shards_dir, batch_size, seed)
+    else:
+        train, validation, num_samples = _mnist_datasets(batch_size, seed)
+
+    range_test_seconds = 0.0
+    if range_test:
+        print("🔎 Running LR range test...")
+        start = time.perf_counter()
+        max_lr, _, _ = lr_range_test(train)
+        range_test_seconds = time.perf_counter() - start
+        print(f"   Suggested max LR {max_lr:.2e} ({range_test_seconds:.1f}s)")
+    else:
+        max_lr = scaled_learning_rate(batch_size)
+        print(f"📐 Linear LR scaling: {cfg['base_learning_rate']:.0e} x {batch_size}/{cfg['base_batch_size']} "
+              f"= {max_lr:.2e}")
+
+    steps_per_epoch = max(1, num_samples // batch_size // evals_per_epoch)
+    total_steps = steps_per_epoch * evals_per_epoch * max_epochs
+    schedule = OneCycleSchedule(max_lr, total_steps, cfg["pct_start"], cfg["div_factor"], cfg["final_div_factor"])
+    model = build_model(learning_rate=schedule)
+    stopper = TargetAccuracyStop(target_accuracy, evals_per_epoch)
+
+    print(f"⏱️ Training to val_accuracy >= {target_accuracy} (batch {batch_size}, "
+          f"at most {max_epochs} epochs, {evals_per_epoch} checks per epoch)...")
+    history = model.fit(
+        train,
+        epochs=max_epochs * evals_per_epoch,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=validation,
+        callbacks=[stopper],
+        verbose=1
+    )
+
+    # Compile lại với LR cố định để file .h5 không phụ thuộc vào OneCycleSchedule khi load_model
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=max_lr / cfg["div_factor"]),
+                  loss="sparse_categorical_crossentropy",
+                  metrics=["accuracy", "sparse_top_k_categorical_accuracy"])
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    model.save(save_path)
+
+    run = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "target_accuracy": target_accuracy,
+        "reached": stopper.time_to_target is not None,
+        "batch_size": batch_size,
+        "max_lr": max_lr,
+        "range_test_seconds": round(range_test_seconds, 2),
+        "time_to_target_seconds": round(stopper.time_to_target, 2) if stopper.time_to_target else None,
+        "epochs_to_target": stopper.epochs_to_target,
+        "epochs_run": len(history.history["loss"]) / evals_per_epoch,
+        "best_val_accuracy": stopper.best_val_accuracy,
+        "total_seconds": round(time.perf_counter() - wall_start, 2)
+    }
+    _log_run(run)
+
+    if run["reached"]:
+        print(f"🎯 Reached {target_accuracy} in {run['time_to_target_seconds']:.1f}s "
+              f"({run['epochs_to_target']:g} epochs), {run['total_seconds']:.1f}s wall-clock including "
+              f"data loading and LR range test")
+    else:
+        print(f"⚠️ Target {target_accuracy} not reached in {max_epochs} epochs "
+              f"(best val_accuracy {run['best_val_accuracy']:.4f})")
+    print(f"✅ Model saved to {save_path}")
+    return model, run
+
+
+def main():
+    """Huấn luyện theo chế độ time-to-accuracy từ command line"""
+    parser = argparse.ArgumentParser(description="Fast-convergence training to a target val_accuracy")
+    parser.add_argument("--target", type=float, default=None, help="Stop at this val_accuracy")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--max-epochs", type=int, default=None)
+    parser.add_argument("--no-range-test", action="store_true", help="Use linear LR scaling instead")
+    parser.add_argument("--shards", default=None, help="Train from ingested shards (DIR/train, optional DIR/test)")
+    args = parser.parse_args()
+
+    train_to_target(args.target, args.batch_size, args.max_epochs, not args.no_range_test, args.shards)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,33 @@
+import time
+_START_TIME = time.perf_counter()  # Mốc đo time-to-first-paint / time-to-ready
+
 import customtkinter as ctk
 import numpy as np
-import tensorflow as tf
 from PIL import Image, ImageDraw, ImageTk
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import os
+import logging
+import threading
 from datetime import datetime
 
+from config import CASCADE_CONFIG, LOGGING_CONFIG
 from preprocess import preprocess_pil_image
+from active_learning import offer_prediction
+
+# TensorFlow chỉ được import trong thread tải model để cửa sổ hiện ra ngay
+
+
+def _startup_logger():
+    """Logger ghi mốc thời gian khởi động vào LOGGING_CONFIG["file"]"""
+    logger = logging.getLogger("gui")
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(LOGGING_CONFIG["file"]) or ".", exist_ok=True)
+        handler = logging.FileHandler(LOGGING_CONFIG["file"], encoding="utf-8")
+        handler.setFormatter(logging.Formatter(LOGGING_CONFIG["format"]))
+        logger.addHandler(handler)
+        logger.setLevel(LOGGING_CONFIG["level"])
+    return logger
 
 # Thiết lập theme
 ctk.set_appearance_mode("dark")
@@ -23,34 +43,101 @@ class HandwritingRecognitionApp(ctk.CTk):
 
         # Biến lưu trữ
         self.model = None
+        self.cascade = None
+        self.predictor = None
         self.canvas_size = 280
         self.prediction_history = []
-        self.model_stats = {}
+        self.model_stats = {'loaded': False, 'loading': True}
+        self.logger = _startup_logger()
+        self._loader = None
+        self._loaded = None
         
-        # Tải mô hình
-        self.load_model()
-        
-        # Tạo giao diện
+        # Tạo giao diện trước, model được tải ở thread nền
         self.create_widgets()
         
         # Khởi tạo canvas vẽ
         self.init_drawing_canvas()
+        
+        self.after(0, self._log_first_paint)
+        self.load_model()
+
+    def _log_first_paint(self):
+        """Ghi time-to-first-paint sau khi Tk đã vẽ xong cửa sổ lần đầu"""
+        self.update_idletasks()
+        elapsed = time.perf_counter() - _START_TIME
+        print(f"🖼️ Time to first paint: {elapsed:.2f}s")
+        self.logger.info("time_to_first_paint_s=%.3f", elapsed)
 
     def load_model(self):
-        """Tải mô hình đã huấn luyện"""
+        """Bắt đầu tải mô hình ở thread nền; nút Recognize bị khóa đến khi model sẵn sàng"""
+        if self._loader is not None and self._loader.is_alive():
+            return
+        self.model_stats = {'loaded': False, 'loading': True}
+        self.recognize_button.configure(state="disabled")
+        self.status_label.configure(text="⏳ Loading model...", text_color="orange")
+        self._loaded = None
+        self._loader = threading.Thread(target=self._load_model_worker, name="model-loader", daemon=True)
+        self._loader.start()
+        self.after(100, self._poll_model_loading)
+
+    def _load_model_worker(self):
+        """Chạy trong thread nền: import TensorFlow, tải và warm-up model; không chạm vào widget"""
+        loaded = {'model': None, 'cascade': None, 'predictor': None}
         try:
             if os.path.exists("handwriting_model.h5"):
-                self.model = tf.keras.models.load_model("handwriting_model.h5")
-                self.model_stats = {
+                import tensorflow as tf
+                from compiled_inference import compile_for_inference
+                
+                model = tf.keras.models.load_model("handwriting_model.h5", compile=False)
+                loaded['model'] = model
+                # Nếu có models/candidate_model.h5, mọi lần nhận dạng cũng được gửi cho shadow (xem shadow.py)
+                if CASCADE_CONFIG["enabled"]:
+                    from cascade import CascadePredictor
+                    loaded['cascade'] = CascadePredictor(large_model=model, shadow=True)
+                    loaded['cascade'].predict_proba(np.zeros((1, 28, 28, 1), dtype=np.float32))
+                    # Batch warm-up không phải traffic thật: không tính vào thống kê shadow
+                    if loaded['cascade'].shadow is not None:
+                        loaded['cascade'].shadow.reset_stats()
+                else:
+                    from shadow import with_shadow
+                    loaded['predictor'] = with_shadow(compile_for_inference(model), "handwriting_model.h5")
+                    # serve() chỉ chạy primary, batch warm-up không được gửi cho shadow
+                    warm_up = getattr(loaded['predictor'], 'serve', loaded['predictor'])
+                    np.asarray(warm_up(np.zeros((1, 28, 28, 1), dtype=np.float32)))
+                loaded['stats'] = {
                     'loaded': True,
-                    'input_shape': self.model.input_shape,
-                    'output_shape': self.model.output_shape,
-                    'total_params': self.model.count_params()
+                    'input_shape': model.input_shape,
+                    'output_shape': model.output_shape,
+                    'total_params': model.count_params()
                 }
             else:
-                self.model_stats = {'loaded': False, 'error': 'Model file not found'}
+                loaded['stats'] = {'loaded': False, 'error': 'Model file not found'}
         except Exception as e:
-            self.model_stats = {'loaded': False, 'error': str(e)}
+            loaded = {'model': None, 'cascade': None, 'predictor': None, 'stats': {'loaded': False, 'error': str(e)}}
+        self._loaded = loaded
+
+    def _poll_model_loading(self):
+        """Chạy trên main thread: chờ thread tải model rồi cập nhật giao diện"""
+        if self._loaded is None:
+            self.after(100, self._poll_model_loading)
+            return
+        
+        loaded, self._loaded = self._loaded, None
+        self.model = loaded['model']
+        self.cascade = loaded['cascade']
+        self.predictor = loaded['predictor']
+        self.model_stats = loaded['stats']
+        elapsed = time.perf_counter() - _START_TIME
+        
+        if self.model_stats['loaded']:
+            self.recognize_button.configure(state="normal")
+            self.status_label.configure(text=f"✅ Model ready ({elapsed:.1f}s)", text_color="green")
+            print(f"✅ Time to ready: {elapsed:.2f}s")
+            self.logger.info("time_to_ready_s=%.3f", elapsed)
+        else:
+            self.status_label.configure(text=f"❌ Model not loaded: {self.model_stats['error']}", text_color="red")
+            self.logger.warning("model_load_failed error=%s", self.model_stats['error'])
+        self.update_model_info()
 
     def create_widgets(self):
         """Tạo các widget cho giao diện"""
@@ -84,6 +171,15 @@ class HandwritingRecognitionApp(ctk.CTk):
             text_color="gray"
         )
         subtitle_label.pack(pady=(0, 10))
+        
+        # Trạng thái tải model
+        self.status_label = ctk.CTkLabel(
+            header_frame,
+            text="⏳ Loading model...",
+            font=ctk.CTkFont(size=12),
+            text_color="orange"
+        )
+        self.status_label.pack(pady=(0, 10))
 
     def create_tabs(self):
         """Tạo tab system"""
@@ -146,7 +242,8 @@ class HandwritingRecognitionApp(ctk.CTk):
             text="🔍 Recognize",
             command=self.recognize_digit,
             font=ctk.CTkFont(size=14, weight="bold"),
-            height=40
+            height=40,
+            state="disabled"
         )
         self.recognize_button.pack(side="left", padx=10)
         
@@ -372,7 +469,8 @@ class HandwritingRecognitionApp(ctk.CTk):
     def recognize_digit(self):
         """Nhận dạng chữ số"""
         if not self.model:
-            self.result_label.configure(text="❌ Model not loaded")
+            loading = self.model_stats.get('loading', False)
+            self.result_label.configure(text="⏳ Model is loading..." if loading else "❌ Model not loaded")
             return
             
         try:
@@ -380,10 +478,16 @@ class HandwritingRecognitionApp(ctk.CTk):
             img = preprocess_pil_image(self.image)
             
             # Dự đoán
-            predictions = self.model.predict(img, verbose=0)
+            if self.cascade:
+                predictions, _ = self.cascade.predict_proba(img)
+            else:
+                predictions = self.predictor(img).numpy()
             predicted_digit = np.argmax(predictions)
             confidence = np.max(predictions) * 100
             
+            # Mẫu khó được đưa vào hàng đợi gán nhãn (active learning)
+            offer_prediction(img, predictions[0])
+            
             # Cập nhật UI
             self.result_label.configure(
                 text=f"{predicted_digit}",
@@ -423,7 +527,12 @@ class HandwritingRecognitionApp(ctk.CTk):
         """Cập nhật thông tin mô hình"""
         self.model_info_text.delete("1.0", "end")
         
-        if self.model_stats.get('loaded', False):
+        if self.model_stats.get('loading', False):
+            info_text = """
+⏳ Model Status: Loading...
+🧠 TensorFlow is being imported and the model warmed up in the background
+            """
+        elif self.model_stats.get('loaded', False):
             info_text = f"""
 ✅ Model Status: Loaded Successfully
 🏗️ Architecture: CNN (Convolutional Neural Network)
@@ -470,6 +579,10 @@ class HandwritingRecognitionApp(ctk.CTk):
             )
             error_label.pack(pady=10)
 
-if __name__ == "__main__":
+def main():
     app = HandwritingRecognitionApp()
     app.mainloop()
+
+if __name__ == "__main__":
+    from profiling import run_profiled
+    run_profiled(main, "gui")
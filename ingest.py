@@ -0,0 +1,236 @@
+"""
+Dataset Ingestion for AI Handwriting Recognition System
+Converts folders of labeled digit crops or CSV manifests into packed uint8
+.npy shards with an index; conversion runs on all cores and only files not
+already in the index are processed on re-run
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from config import INGEST_CONFIG
+
+INDEX_FILE = "index.json"
+INV_255 = np.float32(1.0 / 255.0)
+
+
+def scan_folder(root):
+    """(path, label) cho mọi ảnh nằm trong thư mục con có tên là chữ số (root/7/abc.png)"""
+    extensions = tuple(INGEST_CONFIG["image_extensions"])
+    items = []
+    for label in range(10):
+        class_dir = os.path.join(root, str(label))
+        if not os.path.isdir(class_dir):
+            continue
+        for dirpath, _, filenames in os.walk(class_dir):
+            items += [(os.path.join(dirpath, name), label)
+                      for name in sorted(filenames) if name.lower().endswith(extensions)]
+    return items
+
+
+def read_labeled_manifest(manifest_path):
+    """(path, label) từ CSV có cột 'path' và 'label'; path tương đối tính từ thư mục của CSV"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        return [(os.path.join(base, row["path"]), int(row["label"])) for row in csv.DictReader(f)]
+
+
+def _shard_paths(output_dir, name):
+    return {
+        "x": os.path.join(output_dir, f"{name}_x.npy"),
+        "y": os.path.join(output_dir, f"{name}_y.npy"),
+        "sources": os.path.join(output_dir, f"{name}_sources.txt")
+    }
+
+
+def _read_index(output_dir):
+    path = os.path.join(output_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {"shards": [], "total": 0, "image_shape": [28, 28]}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_index(output_dir, index):
+    """Shard chỉ được tính là xong khi đã có trong index (ghi file tạm rồi rename)"""
+    path = os.path.join(output_dir, INDEX_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def ingested_sources(output_dir, index=None):
+    """Tập đường dẫn nguồn đã nằm trong các shard của index"""
+    index = index or _read_index(output_dir)
+    sources = set()
+    for shard in index["shards"]:
+        with open(_shard_paths(output_dir, shard["name"])["sources"], encoding="utf-8") as f:
+            sources.update(line.rstrip("\n") for line in f)
+    return sources
+
+
+def _init_worker():
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def _convert_shard(output_dir, name, items, mode):
+    """Worker: tiền xử lý một nhóm ảnh thành shard uint8 (N, 28, 28) + nhãn uint8"""
+    from preprocess import preprocess_into
+
+    x = np.empty((len(items), 28, 28), dtype=np.uint8)
+    y = np.empty(len(items), dtype=np.uint8)
+    scratch = np.empty((28, 28), dtype=np.float32)
+    sources, failed, count = [], [], 0
+    for path, label in items:
+        try:
+            preprocess_into(path, scratch, mode)
+        except Exception:
+            failed.append(path)
+            continue
+        # Giá trị sau chuẩn hóa là k/255 nên làm tròn khôi phục đúng k
+        np.rint(scratch * 255.0, out=scratch)
+        x[count] = scratch
+        y[count] = label
+        sources.append(os.path.abspath(path))
+        count += 1
+
+    if count:
+        paths = _shard_paths(output_dir, name)
+        np.save(paths["x"], x[:count])
+        np.save(paths["y"], y[:count])
+        with open(paths["sources"], "w", encoding="utf-8") as f:
+            f.writelines(source + "\n" for source in sources)
+    return name, count, failed
+
+
+def ingest(items, output_dir=None, num_workers=None, shard_size=None, mode=None):
+    """Chuyển các (path, label) chưa có trong index thành shard mới; trả về index đã cập nhật"""
+    cfg = INGEST_CONFIG
+    output_dir = output_dir or cfg["shards_dir"]
+    num_workers = num_workers or cfg["num_workers"] or os.cpu_count() or 1
+    shard_size = shard_size or cfg["shard_size"]
+    mode = mode or cfg["mode"]
+    os.makedirs(output_dir, exist_ok=True)
+
+    index = _read_index(output_dir)
+    done = ingested_sources(output_dir, index)
+    new_items = [(path, label) for path, label in items if os.path.abspath(path) not in done]
+    print(f"📥 {len(items):,} source images, {len(items) - len(new_items):,} already ingested, "
+          f"{len(new_items):,} new")
+    if not new_items:
+        return index
+
+    first_id = max((int(s["name"].split("_")[1]) for s in index["shards"]), default=-1) + 1
+    tasks = [(f"shard_{first_id + i:05d}", new_items[start:start + shard_size])
+             for i, start in enumerate(range(0, len(new_items), shard_size))]
+
+    start_time = time.perf_counter()
+    failed = []
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx, initializer=_init_worker) as pool:
+        futures = [pool.submit(_convert_shard, output_dir, name, shard_items, mode) for name, shard_items in tasks]
+        for future in as_completed(futures):
+            name, count, shard_failed = future.result()
+            failed += shard_failed
+            if count:
+                index["shards"].append({"name": name, "count": count})
+                index["shards"].sort(key=lambda s: s["name"])
+                index["total"] = sum(s["count"] for s in index["shards"])
+                _write_index(output_dir, index)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ {len(new_items) - len(failed):,} images -> {len(tasks)} shards in {elapsed:.1f}s "
+          f"({len(new_items) / max(elapsed, 1e-9):.0f} img/s)")
+    if failed:
+        print(f"⚠️ {len(failed)} images could not be read (will be retried on the next run)")
+    return index
+
+
+class ShardedDataset:
+    """Đọc các shard qua memory map; xáo trộn bằng hoán vị chỉ số thay vì nạp toàn bộ dữ liệu.
+
+    `keep` (mảng bool hoặc file .npy, vd. keep mask của dedup.py) loại bỏ các mẫu khi duyệt.
+    """
+
+    def __init__(self, directory, keep=None):
+        self.directory = directory
+        index = _read_index(directory)
+        if not index["shards"]:
+            raise FileNotFoundError(f"No ingested shards in {directory}")
+        self.x, self.y = [], []
+        for shard in index["shards"]:
+            paths = _shard_paths(directory, shard["name"])
+            self.x.append(np.load(paths["x"], mmap_mode="r"))
+            self.y.append(np.load(paths["y"], mmap_mode="r"))
+        self.offsets = np.cumsum([0] + [len(y) for y in self.y])
+        if isinstance(keep, str):
+            keep = np.load(keep)
+        self.indices = np.arange(self.offsets[-1]) if keep is None else np.flatnonzero(keep)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def take(self, indices):
+        """Ảnh float32 (N, 28, 28, 1) trong [0, 1] và nhãn cho các chỉ số toàn cục, giữ đúng thứ tự"""
+        indices = np.asarray(indices, dtype=np.int64)
+        x = np.empty((len(indices), 28, 28, 1), dtype=np.float32)
+        y = np.empty(len(indices), dtype=np.int64)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        for shard_id in np.unique(shard_ids):
+            positions = np.flatnonzero(shard_ids == shard_id)
+            local = indices[positions] - self.offsets[shard_id]
+            # Đọc theo thứ tự tăng dần trong shard để truy cập đĩa tuần tự hơn
+            order = np.argsort(local)
+            rows = positions[order]
+            x[rows, ..., 0] = self.x[shard_id][local[order]]
+            y[rows] = self.y[shard_id][local[order]]
+        np.multiply(x, INV_255, out=x)
+        return x, y
+
+    def iter_chunks(self, chunk_size=None, shuffle=False, seed=None):
+        """Duyệt (x, y) theo chunk; với shuffle chỉ giữ hoán vị chỉ số trong RAM"""
+        chunk_size = chunk_size or INGEST_CONFIG["chunk_size"]
+        order = np.random.default_rng(seed).permutation(self.indices) if shuffle else self.indices
+        for start in range(0, len(self), chunk_size):
+            yield self.take(order[start:start + chunk_size])
+
+    def as_tf_dataset(self, batch_size=128, shuffle=True, seed=None):
+        """tf.data.Dataset các batch (x, y); mỗi epoch dùng một hoán vị mới"""
+        import tensorflow as tf
+
+        rng = np.random.default_rng(seed)
+
+        def generator():
+            epoch_seed = int(rng.integers(2 ** 31)) if shuffle else None
+            yield from self.iter_chunks(batch_size, shuffle, epoch_seed)
+
+        signature = (tf.TensorSpec((None, 28, 28, 1), tf.float32), tf.TensorSpec((None,), tf.int64))
+        return tf.data.Dataset.from_generator(generator, output_signature=signature).prefetch(tf.data.AUTOTUNE)
+
+
+def main():
+    """Chuyển thư mục ảnh / CSV manifest thành shard từ command line"""
+    parser = argparse.ArgumentParser(description="Ingest labeled digit images into packed .npy shards")
+    parser.add_argument("source", help="Folder with 0-9 class subfolders, or CSV with 'path' and 'label' columns")
+    parser.add_argument("output_dir", nargs="?", default=None, help="Shard directory (e.g. data/shards/train)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=None)
+    parser.add_argument("--mode", choices=["threshold", "plain"], default=None)
+    args = parser.parse_args()
+
+    items = read_labeled_manifest(args.source) if args.source.lower().endswith(".csv") else scan_folder(args.source)
+    index = ingest(items, args.output_dir, args.workers, args.shard_size, args.mode)
+    print(f"📚 {index['total']:,} samples in {len(index['shards'])} shards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""
+Load Testing for AI Handwriting Recognition System
+Replays MNIST test digits or synthetic drawn digits against predict() in
+process, the AsyncPredictor or a local HTTP endpoint, at a fixed arrival rate
+(open loop) or a fixed number of concurrent clients (closed loop); reports
+throughput, latency / queueing-delay percentiles and CPU per time window and
+can ramp the load until a p99 latency SLO is breached
+"""
+
+import os
+import json
+import time
+import base64
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import cv2
+
+from config import LOAD_TEST_CONFIG, ACTIVE_LEARNING_CONFIG, PATHS
+
+
+def mnist_images(count, seed=None):
+    """Ảnh MNIST test dạng nét tối trên nền sáng (giống ảnh người dùng đưa vào predict)"""
+    from dataset_loader import load_mnist_cached
+
+    _, (x_test, _) = load_mnist_cached()
+    indices = np.sort(np.random.default_rng(seed).choice(len(x_test), min(count, len(x_test)), replace=False))
+    return [255 - np.rint(np.asarray(x_test[i]).reshape(28, 28) * 255).astype(np.uint8) for i in indices]
+
+
+def synthetic_images(count, seed=None):
+    """Chữ số vẽ ngẫu nhiên (cỡ chữ, độ dày nét, vị trí, góc nghiêng) như demo.demo_command_line"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        canvas = np.full((28, 28), 255, dtype=np.uint8)
+        scale = rng.uniform(0.6, 0.9)
+        origin = (int(rng.integers(4, 10)), int(rng.integers(20, 25)))
+        cv2.putText(canvas, str(rng.integers(10)), origin, cv2.FONT_HERSHEY_SIMPLEX, scale, 0,
+                    int(rng.integers(1, 3)), cv2.LINE_AA)
+        rotation = cv2.getRotationMatrix2D((14, 14), rng.uniform(-15, 15), 1.0)
+        images.append(cv2.warpAffine(canvas, rotation, (28, 28), borderValue=255))
+    return images
+
+
+class PredictTarget:
+    """predict.predict() trong process trên các file PNG đã ghi sẵn.
+
+    Model dùng chung trong predict.py không an toàn đa luồng nên các request đi qua một lock;
+    thời gian chờ lock được tính là queueing delay.
+    """
+
+    def __init__(self, images, keep_active_learning=False):
+        import predict
+
+        if not keep_active_learning:
+            # Ảnh tải giả lập không được tràn vào hàng đợi gán nhãn
+            ACTIVE_LEARNING_CONFIG["enabled"] = False
+        image_dir = LOAD_TEST_CONFIG["image_dir"]
+        os.makedirs(image_dir, exist_ok=True)
+        self.paths = []
+        for i, image in enumerate(images):
+            path = os.path.join(image_dir, f"load_{i:05d}.png")
+            cv2.imwrite(path, image)
+            self.paths.append(path)
+        self._predict = predict.predict
+        self._lock = threading.Lock()
+        self._predict(self.paths[0])
+
+    def __call__(self, index):
+        with self._lock:
+            service_start = time.perf_counter()
+            self._predict(self.paths[index % len(self.paths)])
+        return service_start
+
+    def close(self):
+        pass
+
+
+class AsyncTarget:
+    """AsyncPredictor chạy trên event loop riêng; các thread client gửi bytes PNG vào đó"""
+
+    def __init__(self, images):
+        from async_predictor import AsyncPredictor
+
+        self.payloads = [cv2.imencode(".png", image)[1].tobytes() for image in images]
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="load-test-loop", daemon=True)
+        self._thread.start()
+        self.predictor = AsyncPredictor()
+        asyncio.run_coroutine_threadsafe(self.predictor.start(), self.loop).result()
+
+    def __call__(self, index):
+        coroutine = self.predictor.predict(self.payloads[index % len(self.payloads)])
+        asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        return None
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.predictor.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class HttpTarget:
+    """POST từng ảnh tới một endpoint cục bộ.
+
+    payload="png": body là bytes PNG (Content-Type: image/png).
+    payload="tfserving": JSON {"instances": [{"b64": ...}]} cho REST API của TF Serving
+    phục vụ SavedModel từ serving_export.py.
+    """
+
+    def __init__(self, url, images, payload="png", timeout=None):
+        self.url = url
+        self.timeout = timeout or LOAD_TEST_CONFIG["timeout_s"]
+        encoded = [cv2.imencode(".png", image)[1].tobytes() for image in images]
+        if payload == "tfserving":
+            self.headers = {"Content-Type": "application/json"}
+            self.bodies = [json.dumps({"instances": [{"b64": base64.b64encode(data).decode()}]}).encode()
+                           for data in encoded]
+        elif payload == "png":
+            self.headers = {"Content-Type": "image/png"}
+            self.bodies = encoded
+        else:
+            raise ValueError(f"Unknown payload format: {payload}")
+
+    def __call__(self, index):
+        from urllib.request import Request, urlopen
+
+        request = Request(self.url, data=self.bodies[index % len(self.bodies)], headers=self.headers, method="POST")
+        # urlopen raise HTTPError với mã >= 400, được tính là lỗi
+        with urlopen(request, timeout=self.timeout) as response:
+            response.read()
+        return None
+
+    def close(self):
+        pass
+
+
+class CpuMonitor:
+    """Lấy mẫu CPU mỗi window: process hiện tại (% tổng số core) và toàn hệ thống (Linux /proc/stat)"""
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _system_times():
+        try:
+            with open("/proc/stat") as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+            return sum(values), values[3] + values[4]
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _run(self):
+        cores = os.cpu_count() or 1
+        wall, process, system = time.perf_counter(), time.process_time(), self._system_times()
+        while not self._stop.wait(self.window):
+            now_wall, now_process, now_system = time.perf_counter(), time.process_time(), self._system_times()
+            sample = {"process_cpu": (now_process - process) / (now_wall - wall) / cores, "system_cpu": None}
+            if system and now_system and now_system[0] > system[0]:
+                busy = (now_system[0] - system[0]) - (now_system[1] - system[1])
+                sample["system_cpu"] = busy / (now_system[0] - system[0])
+            self.samples.append(sample)
+            wall, process, system = now_wall, now_process, now_system
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="load-test-cpu", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _percentiles(values, prefix):
+    if len(values) == 0:
+        return {f"{prefix}_p50_ms": None, f"{prefix}_p90_ms": None, f"{prefix}_p99_ms": None}
+    values = np.asarray(values) * 1000
+    return {f"{prefix}_p50_ms": float(np.percentile(values, 50)),
+            f"{prefix}_p90_ms": float(np.percentile(values, 90)),
+            f"{prefix}_p99_ms": float(np.percentile(values, 99))}
+
+
+class LoadGenerator:
+    """Chạy một bước tải và tổng hợp kết quả.
+
+    Mỗi request ghi (thời điểm đến theo lịch, bắt đầu xử lý, kết thúc, ok). Latency được tính từ
+    thời điểm đến theo lịch nên thời gian xếp hàng không bị che đi khi hệ thống quá tải.
+    """
+
+    def __init__(self, target, window=None, max_workers=None):
+        self.target = target
+        self.window = window or LOAD_TEST_CONFIG["window_s"]
+        self.max_workers = max_workers or LOAD_TEST_CONFIG["max_workers"]
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+
+    def _next_index(self):
+        with self._counter_lock:
+            self._counter += 1
+            return self._counter
+
+    def _send(self, scheduled, records):
+        picked = time.perf_counter()
+        try:
+            service_start = self.target(self._next_index()) or picked
+            ok = True
+        except Exception:
+            service_start, ok = picked, False
+        records.append((scheduled, service_start, time.perf_counter(), ok))
+
+    def run_rate(self, rate, duration, poisson=False, seed=None):
+        """Open loop: request đến với tốc độ cố định (hoặc Poisson) bất kể hệ thống trả lời nhanh hay chậm"""
+        rng = np.random.default_rng(seed)
+        records = []
+        monitor = CpuMonitor(self.window)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="load-client") as pool:
+            monitor.start()
+            start = time.perf_counter()
+            arrival = start
+            while arrival < start + duration:
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, arrival, records)
+                arrival += rng.exponential(1 / rate) if poisson else 1 / rate
+        monitor.stop()
+        return self._summarize(records, start, monitor, offered_rate=rate)
+
+    def run_concurrency(self, concurrency, duration):
+        """Closed loop: `concurrency` client, mỗi client gửi request mới ngay khi nhận được trả lời"""
+        records = []
+        monitor = CpuMonitor(self.window)
+        monitor.start()
+        start = time.perf_counter()
+        deadline = start + duration
+
+        def client():
+            while time.perf_counter() < deadline:
+                self._send(time.perf_counter(), records)
+
+        threads = [threading.Thread(target=client, name=f"load-client-{i}") for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        monitor.stop()
+        return self._summarize(records, start, monitor, concurrency=concurrency)
+
+    def _summarize(self, records, start, monitor, offered_rate=None, concurrency=None):
+        records = np.array(records, dtype=np.float64).reshape(-1, 4)
+        elapsed = max(self.window, records[:, 2].max() - start) if len(records) else self.window
+        ok = records[:, 3].astype(bool)
+        latency = (records[:, 2] - records[:, 0])[ok]
+        queueing = (records[:, 1] - records[:, 0])[ok]
+        service = (records[:, 2] - records[:, 1])[ok]
+
+        timeline = []
+        window_index = ((records[:, 2] - start) // self.window).astype(int)
+        for w in range(int(np.ceil(elapsed / self.window))):
+            done = records[(window_index == w) & ok]
+            window_latency = (done[:, 2] - done[:, 0]) * 1000
+            cpu = monitor.samples[w] if w < len(monitor.samples) else {"process_cpu": None, "system_cpu": None}
+            timeline.append({
+                "t_s": round((w + 1) * self.window, 3),
+                "throughput": len(done) / self.window,
+                "errors": int(((window_index == w) & ~ok).sum()),
+                "latency_p50_ms": float(np.percentile(window_latency, 50)) if len(done) else None,
+                "latency_p99_ms": float(np.percentile(window_latency, 99)) if len(done) else None,
+                "queueing_mean_ms": float((done[:, 1] - done[:, 0]).mean() * 1000) if len(done) else None,
+                **cpu
+            })
+
+        cpu_values = [s["process_cpu"] for s in monitor.samples]
+        system_values = [s["system_cpu"] for s in monitor.samples if s["system_cpu"] is not None]
+        return {
+            "offered_rate": offered_rate,
+            "concurrency": concurrency,
+            "requests": len(records),
+            "errors": int((~ok).sum()),
+            "error_rate": float((~ok).mean()) if len(records) else 0.0,
+            "throughput": float(ok.sum() / elapsed),
+            **_percentiles(latency, "latency"),
+            "latency_max_ms": float(latency.max() * 1000) if len(latency) else None,
+            **_percentiles(queueing, "queueing"),
+            **_percentiles(service, "service"),
+            "process_cpu_mean": float(np.mean(cpu_values)) if cpu_values else None,
+            "system_cpu_mean": float(np.mean(system_values)) if system_values else None,
+            "timeline": timeline
+        }
+
+
+def breaches_slo(result, slo_ms=None, max_error_rate=None):
+    slo_ms = slo_ms or LOAD_TEST_CONFIG["slo_p99_ms"]
+    max_error_rate = LOAD_TEST_CONFIG["max_error_rate"] if max_error_rate is None else max_error_rate
+    p99 = result["latency_p99_ms"]
+    return p99 is None or p99 > slo_ms or result["error_rate"] > max_error_rate
+
+
+def ramp(generator, start, duration, by="rate", slo_ms=None, factor=None, max_steps=None, poisson=False):
+    """Tăng tải theo cấp số nhân (rate hoặc concurrency) đến khi p99 vượt SLO hoặc lỗi quá ngưỡng.
+
+    Trả về (các bước, bước cuối cùng còn đạt SLO hoặc None).
+    """
+    cfg = LOAD_TEST_CONFIG
+    factor = factor or cfg["ramp_factor"]
+    max_steps = max_steps or cfg["ramp_max_steps"]
+    steps, sustained, level = [], None, start
+    for _ in range(max_steps):
+        if by == "rate":
+            result = generator.run_rate(level, duration, poisson)
+        else:
+            result = generator.run_concurrency(int(level), duration)
+        result["slo_breached"] = breaches_slo(result, slo_ms)
+        steps.append(result)
+        _print_step(result)
+        if result["slo_breached"]:
+            break
+        sustained = result
+        level = level * factor if by == "rate" else max(int(level) + 1, int(round(level * factor)))
+    return steps, sustained
+
+
+def _print_step(result):
+    load = f"{result['offered_rate']:.1f} req/s" if result["offered_rate"] else f"{result['concurrency']} clients"
+    cpu = f"{result['process_cpu_mean']:.0%}" if result["process_cpu_mean"] is not None else "n/a"
+    p50, p99 = result["latency_p50_ms"], result["latency_p99_ms"]
+    print(f"{load:>16} {result['throughput']:>10.1f} {p50 if p50 is not None else float('nan'):>9.1f} "
+          f"{p99 if p99 is not None else float('nan'):>9.1f} "
+          f"{result['queueing_p99_ms'] if result['queueing_p99_ms'] is not None else float('nan'):>10.1f} "
+          f"{result['error_rate']:>7.1%} {cpu:>6}" + ("  ⛔ SLO" if result.get("slo_breached") else ""))
+
+
+def _save(results):
+    path = os.path.join(PATHS["logs_dir"], f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def main():
+    """Chạy load test từ command line"""
+    cfg = LOAD_TEST_CONFIG
+    parser = argparse.ArgumentParser(description="Closed/open-loop load generator for the prediction stack")
+    parser.add_argument("--target", choices=["predict", "async", "http"], default="predict")
+    parser.add_argument("--url", default=None, help="Endpoint for --target http")
+    parser.add_argument("--payload", choices=["png", "tfserving"], default="png", help="Request body for http")
+    parser.add_argument("--source", choices=["mnist", "synthetic"], default=cfg["source"])
+    parser.add_argument("--images", type=int, default=cfg["images"])
+    parser.add_argument("--rate", type=float, default=None, help="Fixed arrival rate (req/s), open loop")
+    parser.add_argument("--concurrency", type=int, default=None, help="Concurrent clients, closed loop")
+    parser.add_argument("--poisson", action="store_true", help="Poisson instead of evenly spaced arrivals")
+    parser.add_argument("--duration", type=float, default=cfg["duration_s"], help="Seconds per step")
+    parser.add_argument("--ramp", action="store_true", help="Increase load until the p99 SLO is breached")
+    parser.add_argument("--slo-ms", type=float, default=cfg["slo_p99_ms"])
+    parser.add_argument("--keep-active-learning", action="store_true",
+                        help="Let load-test predictions enter the labeling queue (predict target)")
+    args = parser.parse_args()
+
+    images = (mnist_images if args.source == "mnist" else synthetic_images)(args.images, seed=0)
+    print(f"🖼️ {len(images)} {args.source} images, target: {args.target}")
+    if args.target == "predict":
+        target = PredictTarget(images, args.keep_active_learning)
+    elif args.target == "async":
+        target = AsyncTarget(images)
+    else:
+        if not args.url:
+            parser.error("--target http needs --url")
+        target = HttpTarget(args.url, images, args.payload)
+
+    generator = LoadGenerator(target)
+    print(f"\n{'Load':>16} {'Thru/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'Queue p99':>10} {'Errors':>7} {'CPU':>6}")
+    try:
+        if args.ramp or (args.rate is None and args.concurrency is None):
+            by = "concurrency" if args.concurrency else "rate"
+            start = args.concurrency or args.rate or cfg["ramp_start_rate"]
+            steps, sustained = ramp(generator, start, args.duration, by, args.slo_ms, poisson=args.poisson)
+            results = {"mode": f"ramp_{by}", "slo_p99_ms": args.slo_ms, "steps": steps}
+            if sustained:
+                load = (f"{sustained['offered_rate']:.1f} req/s" if by == "rate"
+                        else f"{sustained['concurrency']} clients")
+                print(f"\n🎯 Max load within p99 <= {args.slo_ms:.0f} ms: {load} "
+                      f"({sustained['throughput']:.1f} req/s achieved)")
+            else:
+                print(f"\n⚠️ SLO p99 <= {args.slo_ms:.0f} ms breached at the first step")
+        elif args.rate:
+            results = {"mode": "rate", "steps": [generator.run_rate(args.rate, args.duration, args.poisson)]}
+            _print_step(results["steps"][0])
+        else:
+            results = {"mode": "concurrency", "steps": [generator.run_concurrency(args.concurrency, args.duration)]}
+            _print_step(results["steps"][0])
+    finally:
+        target.close()
+
+    results.update({"target": args.target, "source": args.source,
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    print(f"📄 Results and per-{generator.window:g}s timeline saved to {_save(results)}")
+
+
+if __name__ == "__main__":
+    from profiling import run_profiled
+    run_profiled(main, "load_test")
@@ -85,39 +85,22 @@ def launch_gui():
     except Exception as e:
         print(f"❌ Failed to launch GUI: {e}")
 
-def generate_reports():
-    """Generate model reports and demo materials"""
+def generate_reports(force=False):
+    """Generate model reports and demo materials (only outputs whose model / dataset changed)"""
     print("\n📊 GENERATING REPORTS")
     print("-" * 30)
     
     try:
-        generator = ReportGenerator()
+        generator = ReportGenerator(load=False)
+        rebuilt = generator.build(force=force)
         
-        print("Generating comprehensive reports...")
-        report = generator.generate_model_report()
-        
-        # Save JSON report
-        import json
-        with open("model_report.json", "w") as f:
-            json.dump(report, f, indent=2, default=str)
-        
-        # Generate visualizations
-        generator.create_confusion_matrix()
-        generator.create_sample_predictions()
-        
-        # Generate HTML report
-        generator.generate_html_report()
-        
-        # Generate demo script
-        generator.generate_demo_script()
-        
-        print("\n✅ Reports generated successfully!")
-        print("\n📁 Generated files:")
-        print("  - model_report.json")
-        print("  - model_report.html") 
-        print("  - confusion_matrix.png")
-        print("  - sample_predictions.png")
-        print("  - demo_script.md")
+        if rebuilt:
+            print("\n✅ Reports generated successfully!")
+            print("\n📁 Generated files:")
+            for path in rebuilt:
+                print(f"  - {path}")
+        else:
+            print("\n✅ Reports are up to date, nothing to regenerate")
         
     except Exception as e:
         print(f"❌ Report generation failed: {e}")
@@ -183,4 +166,5 @@ def main():
         input("\nPress Enter to continue...")
 
 if __name__ == "__main__":
-    main()
+    from profiling import run_profiled
+    run_profiled(main, "main")
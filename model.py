@@ -3,7 +3,7 @@ from tensorflow.keras import layers, models
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 
-def build_model():
+def build_model(dense_units=(512, 256), conv_dropout=0.25, dense_dropout=0.5, learning_rate=0.001):
     """Xây dựng mô hình CNN nâng cao cho nhận dạng chữ viết tay"""
     model = models.Sequential([
         # Convolutional Block 1
@@ -11,35 +11,35 @@ def build_model():
         layers.BatchNormalization(),
         layers.Conv2D(32, (3, 3), activation='relu'),
         layers.MaxPooling2D((2, 2)),
-        layers.Dropout(0.25),
+        layers.Dropout(conv_dropout),
         
         # Convolutional Block 2
         layers.Conv2D(64, (3, 3), activation='relu'),
         layers.BatchNormalization(),
         layers.Conv2D(64, (3, 3), activation='relu'),
         layers.MaxPooling2D((2, 2)),
-        layers.Dropout(0.25),
+        layers.Dropout(conv_dropout),
         
         # Convolutional Block 3
         layers.Conv2D(128, (3, 3), activation='relu'),
         layers.BatchNormalization(),
-        layers.Dropout(0.25),
+        layers.Dropout(conv_dropout),
         
         # Dense Layers
         layers.Flatten(),
-        layers.Dense(512, activation='relu'),
+        layers.Dense(dense_units[0], activation='relu'),
         layers.BatchNormalization(),
-        layers.Dropout(0.5),
-        layers.Dense(256, activation='relu'),
-        layers.Dropout(0.5),
+        layers.Dropout(dense_dropout),
+        layers.Dense(dense_units[1], activation='relu'),
+        layers.Dropout(dense_dropout),
         layers.Dense(10, activation='softmax')
     ])
     
     # Compile với optimizer tối ưu
     model.compile(
-        optimizer=Adam(learning_rate=0.001),
+        optimizer=Adam(learning_rate=learning_rate),
         loss='sparse_categorical_crossentropy',
-        metrics=['accuracy', 'top_k_categorical_accuracy']
+        metrics=['accuracy', 'sparse_top_k_categorical_accuracy']
     )
     
     return model
@@ -60,6 +60,95 @@ def build_simple_model():
     model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
     return model
 
+# Các kiến trúc student cho distillation (xem distill.py)
+STUDENT_ARCHITECTURES = {
+    "ds_tiny": {"filters": (16, 32, 64), "separable": True},
+    "ds_small": {"filters": (24, 48, 96), "separable": True},
+    "conv_gap": {"filters": (16, 32, 48), "separable": False}
+}
+
+def build_student_model(filters=(16, 32, 64), separable=True):
+    """Mô hình student nhỏ: depthwise-separable conv + GlobalAveragePooling thay cho Flatten+Dense"""
+    conv = layers.SeparableConv2D if separable else layers.Conv2D
+    stack = [
+        # Lớp đầu chỉ có 1 kênh vào nên dùng Conv2D thường
+        layers.Conv2D(filters[0], (3, 3), padding='same', use_bias=False, input_shape=(28, 28, 1)),
+        layers.BatchNormalization(),
+        layers.ReLU(),
+        layers.MaxPooling2D((2, 2))
+    ]
+    for i, f in enumerate(filters[1:]):
+        stack += [
+            conv(f, (3, 3), padding='same', use_bias=False),
+            layers.BatchNormalization(),
+            layers.ReLU()
+        ]
+        if i < len(filters) - 2:
+            stack.append(layers.MaxPooling2D((2, 2)))
+    stack += [
+        layers.GlobalAveragePooling2D(),
+        layers.Dense(10, name='logits'),
+        layers.Activation('softmax')
+    ]
+    model = models.Sequential(stack)
+
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+def build_early_exit_model(dense_units=(512, 256), conv_dropout=0.25, dense_dropout=0.5,
+                           learning_rate=0.001, loss_weights=(0.3, 0.3, 1.0)):
+    """build_model chia thành 3 stage, thêm classifier head nhẹ sau conv block 1 và 2 (xem early_exit.py).
+
+    Mỗi stage là một sub-model tên stage_1/2/3 để khi suy luận có thể dừng sau bất kỳ stage nào.
+    """
+    # Stage 1: Convolutional Block 1 + exit head
+    inputs = layers.Input((28, 28, 1))
+    x = layers.Conv2D(32, (3, 3), activation='relu')(inputs)
+    x = layers.BatchNormalization()(x)
+    x = layers.Conv2D(32, (3, 3), activation='relu')(x)
+    x = layers.MaxPooling2D((2, 2))(x)
+    features_1 = layers.Dropout(conv_dropout)(x)
+    head = layers.MaxPooling2D((2, 2))(features_1)
+    exit_1 = layers.Dense(10, activation='softmax')(layers.Flatten()(head))
+    stage_1 = models.Model(inputs, [features_1, exit_1], name='stage_1')
+
+    # Stage 2: Convolutional Block 2 + exit head
+    stage_2_inputs = layers.Input(features_1.shape[1:])
+    x = layers.Conv2D(64, (3, 3), activation='relu')(stage_2_inputs)
+    x = layers.BatchNormalization()(x)
+    x = layers.Conv2D(64, (3, 3), activation='relu')(x)
+    x = layers.MaxPooling2D((2, 2))(x)
+    features_2 = layers.Dropout(conv_dropout)(x)
+    exit_2 = layers.Dense(10, activation='softmax')(layers.Flatten()(features_2))
+    stage_2 = models.Model(stage_2_inputs, [features_2, exit_2], name='stage_2')
+
+    # Stage 3: Convolutional Block 3 + Dense Layers (giống build_model)
+    stage_3 = models.Sequential([
+        layers.Conv2D(128, (3, 3), activation='relu', input_shape=features_2.shape[1:]),
+        layers.BatchNormalization(),
+        layers.Dropout(conv_dropout),
+        layers.Flatten(),
+        layers.Dense(dense_units[0], activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(dense_dropout),
+        layers.Dense(dense_units[1], activation='relu'),
+        layers.Dropout(dense_dropout),
+        layers.Dense(10, activation='softmax')
+    ], name='stage_3')
+
+    # Huấn luyện chung cả ba đầu ra
+    f1, p1 = stage_1(inputs)
+    f2, p2 = stage_2(f1)
+    p3 = stage_3(f2)
+    model = models.Model(inputs, [p1, p2, p3], name='early_exit_cnn')
+    model.compile(
+        optimizer=Adam(learning_rate=learning_rate),
+        loss=['sparse_categorical_crossentropy'] * 3,
+        loss_weights=list(loss_weights),
+        metrics={name: ['accuracy'] for name in ('stage_1', 'stage_2', 'stage_3')}
+    )
+    return model
+
 def get_callbacks():
     """Trả về các callback để tối ưu hóa training"""
     callbacks = [
@@ -1,13 +1,59 @@
 import tensorflow as tf
 import numpy as np
+from config import CASCADE_CONFIG, MODEL_CONFIG
 from preprocess import preprocess_image
+from active_learning import offer_prediction
+
+_cascade = None
+_model = None
+
+def get_cascade():
+    """Cascade dùng chung giữa các lần gọi predict (chỉ tải model một lần); mọi batch cũng được gửi cho shadow"""
+    global _cascade
+    if _cascade is None:
+        from cascade import CascadePredictor
+        _cascade = CascadePredictor(shadow=True)
+    return _cascade
+
+def get_model():
+    """Model đã trace sẵn theo bucket batch size (xem compiled_inference.py), tải một lần"""
+    global _model
+    if _model is None:
+        from artifacts import load_inference_model
+        from compiled_inference import compile_for_inference
+        from shadow import with_shadow
+        # Nếu có models/candidate_model.h5, model đó chạy shadow trên bản sao của các batch (xem shadow.py)
+        model_file = MODEL_CONFIG["model_file"]
+        _model = with_shadow(compile_for_inference(load_inference_model(model_file)), model_file)
+    return _model
 
 def predict(image_path):
-    model = tf.keras.models.load_model("handwriting_model.h5")
     img = preprocess_image(image_path)
-    prediction = np.argmax(model.predict(img))
-    return prediction
+    if CASCADE_CONFIG["enabled"]:
+        # Model nhỏ trước, chỉ chuyển sang model lớn khi không chắc chắn
+        probs, _ = get_cascade().predict_proba(img)
+    else:
+        probs = np.asarray(get_model()(img, training=False))
+    # Confidence của lần dự đoán gần nhất (main.py in ra), có ở cả hai nhánh
+    predict.last_confidence = float(np.max(probs))
+    offer_prediction(img, probs[0])
+    return np.argmax(probs)
+
+def main():
+    import argparse
+    from profiling import PROFILE_MODES
+    parser = argparse.ArgumentParser(description="Predict the digit in an image")
+    parser.add_argument("image", nargs="?", default=None, help="Image file (default: test_image.png)")
+    parser.add_argument("--profile", nargs="?", const="sample", default=None,
+                        help="Profile the run (sample, cprofile or pyinstrument); output goes to logs/")
+    args = parser.parse_args()
+
+    image_path = args.image
+    if image_path is None and args.profile not in (None, *PROFILE_MODES):
+        # `--profile anh.png`: argparse gán đường dẫn ảnh cho --profile, profiling.requested_mode dùng mode mặc định
+        image_path = args.profile
+    print(f"Kết quả dự đoán: {predict(image_path or 'test_image.png')}")
 
 if __name__ == "__main__":
-    image_path = "test_image.png"
-    print(f"Kết quả dự đoán: {predict(image_path)}")
+    from profiling import run_profiled
+    run_profiled(main, "predict")
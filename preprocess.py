@@ -1,32 +1,127 @@
+import threading
 import cv2
 import numpy as np
 from PIL import Image
 
+# Hai chế độ tiền xử lý:
+#   "threshold": blur + threshold nhị phân (ảnh scan / file, như preprocess_image)
+#   "plain": chỉ đảo màu (ảnh vẽ trên canvas GUI, như preprocess_pil_image)
+INV_255 = np.float32(1.0 / 255.0)
+
+_scratch = threading.local()
+
+def _scratch_buffer(name, shape):
+    """Buffer tạm riêng cho từng thread, chỉ cấp phát lại khi kích thước ảnh thay đổi"""
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    buf = buffers.get(name)
+    if buf is None or buf.shape != shape:
+        buf = buffers[name] = np.empty(shape, dtype=np.uint8)
+    return buf
+
+def _to_uint8(img):
+    """Đổi mảng không phải uint8 sang uint8: float trong [0, 1] được nhân 255, float [0, 255] được làm tròn.
+
+    Không ép kiểu thẳng vì astype(np.uint8) cắt phần thập phân, biến ảnh [0, 1] thành gần như toàn số 0.
+    """
+    if img.dtype == np.bool_:
+        return img.astype(np.uint8) * np.uint8(255)
+    if np.issubdtype(img.dtype, np.floating):
+        if img.size and not np.isfinite(img).all():
+            raise ValueError("Image contains NaN or infinite values")
+        if img.size and img.max() <= 1.0:
+            img = img * 255.0
+        return np.clip(np.rint(img), 0, 255).astype(np.uint8)
+    if np.issubdtype(img.dtype, np.integer):
+        if img.size and (img.min() < 0 or img.max() > 255):
+            raise ValueError(f"Integer image values must be in [0, 255], got dtype {img.dtype} "
+                             f"with range [{img.min()}, {img.max()}]")
+        return img.astype(np.uint8)
+    raise ValueError(f"Unsupported image dtype: {img.dtype}")
+
+def as_gray_array(image, shape=None):
+    """Chuyển bytes / memoryview / NumPy array / PIL Image / file path thành mảng grayscale uint8.
+
+    - bytes, bytearray, memoryview: nếu có `shape` thì coi là pixel thô (view, không copy),
+      ngược lại là ảnh mã hóa (PNG/JPEG...) và được decode thẳng từ buffer bằng cv2.imdecode.
+    - np.ndarray uint8 2D được dùng trực tiếp; ảnh BGR/BGRA được chuyển sang gray vào buffer tạm.
+      Mảng float [0, 1] được nhân 255, float [0, 255] và số nguyên trong [0, 255] được đổi sang uint8.
+    - PIL Image luôn bị PIL copy khi xuất pixel; nên truyền thẳng NumPy array nếu có thể.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        buffer = np.frombuffer(image, dtype=np.uint8)
+        if shape is not None:
+            return buffer.reshape(shape)
+        img = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError("Cannot decode image bytes")
+        return img
+    if isinstance(image, str):
+        img = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Cannot read image: {image}")
+        return img
+    if isinstance(image, Image.Image):
+        if image.mode != "L":
+            image = image.convert("L")
+        return np.asarray(image)
+
+    img = np.asarray(image)
+    if img.dtype != np.uint8:
+        img = _to_uint8(img)
+    if img.ndim == 3 and img.shape[2] == 1:
+        img = img[..., 0]
+    elif img.ndim == 3:
+        code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        img = cv2.cvtColor(img, code, dst=_scratch_buffer("gray", img.shape[:2]))
+    return img
+
+def preprocess_into(image, out, mode="threshold", shape=None):
+    """Tiền xử lý một ảnh và ghi kết quả float32 [0, 1] vào `out` (vd. một slot batch[i]).
+
+    Mọi bước trung gian dùng buffer tạm của thread hiện tại nên gần như không cấp phát mới.
+    """
+    img = as_gray_array(image, shape)
+    small = _scratch_buffer("small", (28, 28))
+
+    if mode == "threshold":
+        full = _scratch_buffer("full", img.shape)
+        cv2.GaussianBlur(img, (5, 5), 0, dst=full)
+        cv2.threshold(full, 128, 255, cv2.THRESH_BINARY_INV, dst=full)
+        cv2.resize(full, (28, 28), dst=small)
+    elif mode == "plain":
+        # Resize trước rồi mới đảo màu: đảo màu là phép tuyến tính nên kết quả tương đương, rẻ hơn
+        cv2.resize(img, (28, 28), dst=small)
+        cv2.bitwise_not(small, dst=small)
+    else:
+        raise ValueError(f"Unknown preprocessing mode: {mode}")
+
+    target = out[..., 0] if out.ndim == 3 else out
+    np.copyto(target, small)
+    np.multiply(target, INV_255, out=target)
+    return out
+
+def preprocess_batch(images, out=None, mode="threshold"):
+    """Tiền xử lý nhiều ảnh vào một tensor (N, 28, 28, 1) float32 (có thể truyền sẵn `out`)"""
+    if out is None:
+        out = np.empty((len(images), 28, 28, 1), dtype=np.float32)
+    for i, image in enumerate(images):
+        preprocess_into(image, out[i], mode)
+    return out
+
 def preprocess_image(image_path):
     """Tiền xử lý ảnh từ file path"""
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    img = cv2.GaussianBlur(img, (5, 5), 0)
-    _, img = cv2.threshold(img, 128, 255, cv2.THRESH_BINARY_INV)
-    img = cv2.resize(img, (28, 28))
-    img = img / 255.0
-    img = np.expand_dims(img, axis=(0, -1))
-    return img
+    return preprocess_batch([image_path])
+
+def preprocess_image_bytes(data):
+    """Tiền xử lý ảnh đã mã hóa (PNG/JPEG...) trực tiếp từ bytes, không cần file tạm"""
+    return preprocess_batch([data])
+
+def preprocess_gray(img):
+    """Blur + threshold + resize cho ảnh grayscale uint8 (chữ tối trên nền sáng)"""
+    return preprocess_batch([img])
 
 def preprocess_pil_image(pil_image):
     """Tiền xử lý ảnh từ PIL Image object"""
-    # Convert PIL image to numpy array
-    img_array = np.array(pil_image)
-    
-    # Invert colors (black digits on white background -> white digits on black background)
-    img_array = 255 - img_array
-    
-    # Resize to 28x28
-    img_resized = cv2.resize(img_array, (28, 28))
-    
-    # Normalize to [0, 1]
-    img_normalized = img_resized / 255.0
-    
-    # Add batch and channel dimensions
-    img_final = np.expand_dims(img_normalized, axis=(0, -1))
-    
-    return img_final
+    return preprocess_batch([pil_image], mode="plain")
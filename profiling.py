@@ -0,0 +1,196 @@
+"""
+Profiling Hooks for AI Handwriting Recognition System
+Wraps an entry point in a profiler when `--profile[=MODE]` is on the command
+line or HANDWRITING_PROFILE is set, and writes collapsed stacks, a speedscope
+profile and a top-N hot-function summary to PATHS["logs_dir"]
+
+Modes: sample (built-in stack sampler), cprofile (deterministic + sampler for
+the flamegraph), pyinstrument (if installed). Without the flag / env var the
+entry point is called directly.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime
+
+from config import PROFILING_CONFIG, PATHS
+
+PROFILE_MODES = ("sample", "cprofile", "pyinstrument")
+
+
+def requested_mode(argv=None):
+    """Mode profiling được yêu cầu qua --profile[=MODE] / --profile MODE hoặc biến môi trường; None nếu tắt"""
+    argv = sys.argv[1:] if argv is None else argv
+    default = PROFILING_CONFIG["default_mode"]
+    for i, arg in enumerate(argv):
+        if arg == "--profile":
+            following = argv[i + 1] if i + 1 < len(argv) else None
+            return following if following in PROFILE_MODES else default
+        if arg.startswith("--profile="):
+            return arg.split("=", 1)[1] or default
+
+    value = os.environ.get(PROFILING_CONFIG["env_var"], "").strip().lower()
+    if value in ("", "0", "false", "off"):
+        return None
+    return value if value in PROFILE_MODES else default
+
+
+class StackSampler:
+    """Profiler lấy mẫu: thread nền đọc sys._current_frames() mỗi interval và đếm các stack giống nhau"""
+
+    def __init__(self, interval=None):
+        self.interval = (interval or PROFILING_CONFIG["interval_ms"]) / 1000
+        self.counts = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            self.counts[(names.get(thread_id, str(thread_id)), tuple(reversed(stack)))] += 1
+        self.samples += 1
+
+    def _run(self):
+        start = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            self._sample()
+        self.duration = time.perf_counter() - start
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """Dòng "thread;frame;...;frame count" cho flamegraph.pl / speedscope / inferno"""
+        lines = []
+        for (thread, stack), count in self.counts.most_common():
+            frames = [thread] + [f"{name} ({os.path.basename(path)}:{line})" for name, path, line in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name):
+        """Profile dạng "sampled" theo định dạng file của speedscope, mỗi thread một profile"""
+        frames, frame_index, profiles = [], {}, {}
+        for (thread, stack), count in self.counts.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            profile = profiles.setdefault(thread, {"type": "sampled", "name": thread, "unit": "seconds",
+                                                   "startValue": 0, "endValue": 0, "samples": [], "weights": []})
+            profile["samples"].append(indices)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "handwriting-recognition profiling.py",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values())
+        }
+
+    def top(self, n=None):
+        """Bảng top-N hàm theo số mẫu tự thân (self) và tích lũy (total)"""
+        n = n or PROFILING_CONFIG["top_n"]
+        own, total = Counter(), Counter()
+        for (_, stack), count in self.counts.items():
+            if not stack:
+                continue
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+
+        samples = max(1, sum(self.counts.values()))
+        lines = [f"{self.samples} samples every {self.interval * 1000:.1f} ms over {self.duration:.2f}s",
+                 "", f"{'self %':>7} {'total %':>8}  function"]
+        for frame, count in own.most_common(n):
+            name, path, line = frame
+            lines.append(f"{count / samples:>7.1%} {total[frame] / samples:>8.1%}  {name} ({path}:{line})")
+        return "\n".join(lines) + "\n"
+
+
+def _write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def run_profiled(func, name, *args, **kwargs):
+    """Gọi func(*args, **kwargs); nếu profiling được bật thì bọc trong profiler và ghi kết quả ra logs"""
+    mode = requested_mode()
+    if mode is None:
+        return func(*args, **kwargs)
+
+    if mode == "pyinstrument":
+        try:
+            import pyinstrument
+        except ImportError:
+            print("⚠️ pyinstrument is not installed, falling back to the built-in sampler")
+            mode = "sample"
+
+    logs_dir = PATHS["logs_dir"]
+    os.makedirs(logs_dir, exist_ok=True)
+    prefix = os.path.join(logs_dir, f"profile_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    print(f"🔬 Profiling {name} ({mode})...")
+
+    if mode == "pyinstrument":
+        from pyinstrument.renderers import SpeedscopeRenderer
+        profiler = pyinstrument.Profiler(interval=PROFILING_CONFIG["interval_ms"] / 1000)
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            _write(prefix + ".speedscope.json", profiler.output(SpeedscopeRenderer()))
+            _write(prefix + "_top.txt", profiler.output_text(unicode=True))
+            print(f"🔥 Profile written to {prefix}.speedscope.json / _top.txt")
+
+    sampler = StackSampler()
+    profile = None
+    if mode == "cprofile":
+        import cProfile
+        profile = cProfile.Profile()
+
+    sampler.start()
+    if profile is not None:
+        profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if profile is not None:
+            profile.disable()
+        sampler.stop()
+
+        _write(prefix + ".collapsed", sampler.collapsed())
+        with open(prefix + ".speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(sampler.speedscope(name), f)
+        summary = sampler.top()
+        if profile is not None:
+            import io
+            import pstats
+            profile.dump_stats(prefix + ".prof")
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(PROFILING_CONFIG["top_n"])
+            summary += "\n\ncProfile (main thread, sorted by cumulative time)\n" + stream.getvalue()
+        _write(prefix + "_top.txt", summary)
+        print(f"🔥 Profile written to {prefix}.collapsed / .speedscope.json / _top.txt"
+              + (" / .prof" if profile is not None else ""))
@@ -1,26 +1,104 @@
 """
 Report Generator for AI Handwriting Recognition System
-Generates professional reports and demo materials for presentations
+Generates professional reports and demo materials for presentations;
+build() only regenerates outputs whose model hash / dataset version changed
+and renders independent figures in parallel worker processes
 """
 
 import os
+import sys
 import json
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import hashlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import tensorflow as tf
-from PIL import Image, ImageDraw
-import pandas as pd
+
+import numpy as np
+
+from config import REPORT_CONFIG, MODEL_CONFIG
+
+REPORT_OUTPUTS = {
+    "report_json": "model_report.json",
+    "confusion_matrix": "confusion_matrix.png",
+    "sample_predictions": "sample_predictions.png",
+    "html": "model_report.html",
+    "demo_script": "demo_script.md"
+}
+
+
+def _pyplot():
+    """pyplot với backend Agg (không cần màn hình, an toàn trong worker process).
+
+    Nếu pyplot đã được import (vd. main.py qua train.py) thì giữ backend hiện tại.
+    """
+    import matplotlib
+    if "matplotlib.pyplot" not in sys.modules:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def render_confusion_matrix(cm, save_path="confusion_matrix.png", dpi=300):
+    """Vẽ confusion matrix (mảng 10x10) ra file; chạy được trong worker process"""
+    import seaborn as sns
+
+    plt = _pyplot()
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(np.asarray(cm), annot=True, fmt='d', cmap='Blues',
+                xticklabels=range(10), yticklabels=range(10))
+    plt.title('Confusion Matrix - Handwriting Recognition Model')
+    plt.xlabel('Predicted Label')
+    plt.ylabel('True Label')
+    plt.tight_layout()
+    plt.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+    return save_path
+
+
+def render_sample_predictions(images, labels, predicted, confidences, save_path="sample_predictions.png", dpi=300):
+    """Vẽ lưới ảnh mẫu kèm nhãn thật / dự đoán / độ tự tin; chạy được trong worker process"""
+    plt = _pyplot()
+    fig, axes = plt.subplots(2, 5, figsize=(12, 6))
+    axes = axes.ravel()
+
+    for i in range(min(len(images), len(axes))):
+        axes[i].imshow(np.asarray(images[i]).reshape(28, 28), cmap='gray')
+        axes[i].set_title(f'True: {labels[i]}, Pred: {predicted[i]}\nConf: {confidences[i]:.3f}')
+        axes[i].axis('off')
+
+    plt.suptitle('Sample Predictions - Handwriting Recognition Model')
+    plt.tight_layout()
+    plt.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+    return save_path
+
+
+def dataset_version(cache_dir="data/mnist_cache"):
+    """Phiên bản tập test theo kích thước + mtime của file cache .npy (không đọc nội dung)"""
+    paths = [os.path.join(cache_dir, f"{name}.npy") for name in ("x_test", "y_test")]
+    if not all(os.path.exists(p) for p in paths):
+        from dataset_loader import cache_mnist
+        cache_mnist(cache_dir)
+    stats = [(os.path.basename(p), os.path.getsize(p), os.stat(p).st_mtime_ns) for p in paths]
+    return hashlib.blake2b(json.dumps(stats).encode(), digest_size=8).hexdigest()
+
+
+def _node_key(*parts):
+    return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=8).hexdigest()
+
 
 class ReportGenerator:
-    def __init__(self):
+    def __init__(self, load=True):
         self.report_data = {}
         self.model = None
-        self.load_model()
+        self.metrics = None
+        if load:
+            self.load_model()
         
     def load_model(self):
         """Load the trained model"""
+        import tensorflow as tf
+        
         try:
             if os.path.exists("handwriting_model.h5"):
                 self.model = tf.keras.models.load_model("handwriting_model.h5")
@@ -48,6 +126,8 @@ class ReportGenerator:
     
     def get_model_info(self):
         """Get basic model information"""
+        import tensorflow as tf
+        
         return {
             "input_shape": self.model.input_shape,
             "output_shape": self.model.output_shape,
@@ -71,24 +151,11 @@ class ReportGenerator:
     def evaluate_model_performance(self):
         """Evaluate model performance on test set"""
         try:
-            from dataset_loader import load_mnist
-            (x_train, y_train), (x_test, y_test) = load_mnist()
-            
-            # Evaluate on test set
-            test_loss, test_accuracy, test_top_k = self.model.evaluate(x_test, y_test, verbose=0)
-            
-            # Get predictions for confusion matrix
-            predictions = self.model.predict(x_test, verbose=0)
-            predicted_classes = np.argmax(predictions, axis=1)
+            from streaming_eval import evaluate_mnist
             
-            return {
-                "test_accuracy": float(test_accuracy),
-                "test_loss": float(test_loss),
-                "top_k_accuracy": float(test_top_k),
-                "total_test_samples": len(x_test),
-                "correct_predictions": int(np.sum(predicted_classes == y_test)),
-                "incorrect_predictions": int(np.sum(predicted_classes != y_test))
-            }
+            # Đếm tích lũy theo chunk trên memmap: bộ nhớ không phụ thuộc kích thước tập test
+            self.metrics = evaluate_mnist(self.model)
+            return self.metrics.result()
         except Exception as e:
             return {"error": str(e)}
     
@@ -107,65 +174,39 @@ class ReportGenerator:
             "metrics": ["accuracy", "top_k_categorical_accuracy"]
         }
     
-    def create_confusion_matrix(self, save_path="confusion_matrix.png"):
+    def create_confusion_matrix(self, save_path="confusion_matrix.png", dpi=None):
         """Create and save confusion matrix visualization"""
         try:
-            from dataset_loader import load_mnist
-            from sklearn.metrics import confusion_matrix
+            from streaming_eval import evaluate_mnist
             
-            (x_train, y_train), (x_test, y_test) = load_mnist()
-            predictions = self.model.predict(x_test, verbose=0)
-            predicted_classes = np.argmax(predictions, axis=1)
-            
-            cm = confusion_matrix(y_test, predicted_classes)
-            
-            plt.figure(figsize=(10, 8))
-            sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', 
-                       xticklabels=range(10), yticklabels=range(10))
-            plt.title('Confusion Matrix - Handwriting Recognition Model')
-            plt.xlabel('Predicted Label')
-            plt.ylabel('True Label')
-            plt.tight_layout()
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            
-            return save_path
+            if self.metrics is None:
+                self.metrics = evaluate_mnist(self.model)
+            return render_confusion_matrix(self.metrics.confusion, save_path, dpi or REPORT_CONFIG["dpi"])
         except Exception as e:
             print(f"Error creating confusion matrix: {e}")
             return None
     
-    def create_sample_predictions(self, num_samples=10, save_path="sample_predictions.png"):
+    def sample_predictions(self, num_samples=None, seed=None):
+        """(images, labels, predicted, confidences) cho các mẫu test chọn theo seed cố định"""
+        from dataset_loader import load_mnist_cached
+        
+        num_samples = num_samples or REPORT_CONFIG["num_samples"]
+        seed = REPORT_CONFIG["sample_seed"] if seed is None else seed
+        _, (x_test, y_test) = load_mnist_cached()
+        
+        # Seed cố định: cùng model + dữ liệu thì cùng hình, nên hình đã cache vẫn đúng
+        indices = np.sort(np.random.default_rng(seed).choice(len(y_test), num_samples, replace=False))
+        sample_images = np.asarray(x_test[indices], dtype=np.float32)
+        sample_labels = np.asarray(y_test[indices])
+        
+        predictions = np.asarray(self.model(sample_images, training=False))
+        return sample_images, sample_labels, np.argmax(predictions, axis=1), np.max(predictions, axis=1)
+    
+    def create_sample_predictions(self, num_samples=10, save_path="sample_predictions.png", dpi=None):
         """Create sample predictions visualization"""
         try:
-            from dataset_loader import load_mnist
-            
-            (x_train, y_train), (x_test, y_test) = load_mnist()
-            
-            # Get random samples
-            indices = np.random.choice(len(x_test), num_samples, replace=False)
-            sample_images = x_test[indices]
-            sample_labels = y_test[indices]
-            
-            # Get predictions
-            predictions = self.model.predict(sample_images, verbose=0)
-            predicted_classes = np.argmax(predictions, axis=1)
-            confidence_scores = np.max(predictions, axis=1)
-            
-            # Create visualization
-            fig, axes = plt.subplots(2, 5, figsize=(12, 6))
-            axes = axes.ravel()
-            
-            for i in range(num_samples):
-                axes[i].imshow(sample_images[i].reshape(28, 28), cmap='gray')
-                axes[i].set_title(f'True: {sample_labels[i]}, Pred: {predicted_classes[i]}\nConf: {confidence_scores[i]:.3f}')
-                axes[i].axis('off')
-            
-            plt.suptitle('Sample Predictions - Handwriting Recognition Model')
-            plt.tight_layout()
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            
-            return save_path
+            return render_sample_predictions(*self.sample_predictions(num_samples), save_path,
+                                             dpi or REPORT_CONFIG["dpi"])
         except Exception as e:
             print(f"Error creating sample predictions: {e}")
             return None
@@ -349,41 +390,159 @@ python gui.py
             f.write(script)
         
         return output_path
-
-def main():
-    """Generate all reports and demo materials"""
-    print("🚀 Generating AI Handwriting Recognition Reports...")
     
-    generator = ReportGenerator()
-    
-    # Generate model report
-    print("📊 Generating model report...")
-    report = generator.generate_model_report()
+    def _read_cache(self):
+        try:
+            with open(REPORT_CONFIG["cache_file"], encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
     
-    # Save as JSON
-    with open("model_report.json", "w") as f:
-        json.dump(report, f, indent=2, default=str)
+    def _write_cache(self, cache):
+        path = REPORT_CONFIG["cache_file"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(path + ".tmp", path)
     
-    # Generate visualizations
-    print("📈 Creating visualizations...")
-    generator.create_confusion_matrix()
-    generator.create_sample_predictions()
+    def build(self, force=False, workers=None):
+        """Dựng lại các output đã cũ theo đồ thị phụ thuộc; trả về danh sách file đã tạo lại.
+        
+        model_report.json, confusion_matrix.png, sample_predictions.png phụ thuộc (hash model,
+        phiên bản dataset); model_report.html phụ thuộc model_report.json; demo_script.md chỉ tạo
+        khi chưa có. Các hình độc lập được vẽ song song trong worker process.
+        """
+        from artifacts import file_sha256
+        
+        cfg = REPORT_CONFIG
+        model_file = MODEL_CONFIG["model_file"]
+        if not os.path.exists(model_file):
+            print("⚠️ Model not found. Please train the model first.")
+            return []
+        
+        inputs = {"model": file_sha256(model_file), "dataset": dataset_version()}
+        keys = {
+            "report_json": _node_key(inputs),
+            "confusion_matrix": _node_key(inputs, cfg["dpi"]),
+            "sample_predictions": _node_key(inputs, cfg["dpi"], cfg["num_samples"], cfg["sample_seed"]),
+            "demo_script": _node_key("demo_script")
+        }
+        keys["html"] = _node_key(keys["report_json"])
+        
+        cache = {} if force else self._read_cache()
+        built_keys = cache.get("keys", {})
+        # Confusion matrix đã cache chỉ dùng được khi tính từ đúng model + dataset hiện tại
+        if cache.get("confusion_key") != keys["report_json"]:
+            cache.pop("confusion", None)
+        stale = [name for name, path in REPORT_OUTPUTS.items()
+                 if force or built_keys.get(name) != keys[name] or not os.path.exists(path)]
+        if not stale:
+            print(f"✅ All reports up to date (model {inputs['model'][:12]}, dataset {inputs['dataset']})")
+            return []
+        
+        needs_model = {"report_json", "sample_predictions"} & set(stale) or (
+            "confusion_matrix" in stale and "confusion" not in cache)
+        if needs_model and self.model is None:
+            self.load_model()
+        if needs_model and self.model is None:
+            return []
+        
+        # Output lỗi không được ghi key nên sẽ được dựng lại ở lần chạy sau
+        failed = set()
+        if "report_json" in stale:
+            print("📊 Generating model report...")
+            report = self.generate_model_report()
+            with open(REPORT_OUTPUTS["report_json"], "w") as f:
+                json.dump(report, f, indent=2, default=str)
+            if self.metrics is None:
+                # Đánh giá lỗi: report thiếu phần performance nên không dựng HTML từ nó
+                failed.update({"report_json", "html"})
+            else:
+                cache["confusion"] = self.metrics.confusion.tolist()
+                cache["confusion_key"] = keys["report_json"]
+        elif "html" in stale:
+            with open(REPORT_OUTPUTS["report_json"], encoding="utf-8") as f:
+                self.report_data = json.load(f)
+        
+        renders = []
+        if "confusion_matrix" in stale:
+            if "confusion" not in cache and self.metrics is None and "report_json" not in failed:
+                self.evaluate_model_performance()
+            if "confusion" not in cache and self.metrics is not None:
+                cache["confusion"] = self.metrics.confusion.tolist()
+                cache["confusion_key"] = keys["report_json"]
+            if "confusion" in cache:
+                renders.append(("confusion_matrix", render_confusion_matrix,
+                                (cache["confusion"], REPORT_OUTPUTS["confusion_matrix"], cfg["dpi"])))
+            else:
+                print(f"⚠️ Skipping {REPORT_OUTPUTS['confusion_matrix']}: model evaluation failed")
+                failed.add("confusion_matrix")
+        if "sample_predictions" in stale:
+            renders.append(("sample_predictions", render_sample_predictions,
+                            self.sample_predictions() + (REPORT_OUTPUTS["sample_predictions"], cfg["dpi"])))
+        
+        if renders:
+            print(f"📈 Rendering {len(renders)} figure(s)...")
+        workers = min(len(renders), workers or cfg["workers"])
+        done = set()
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+                futures = {name: pool.submit(fn, *args) for name, fn, args in renders}
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                        done.add(name)
+                    except Exception as e:
+                        print(f"❌ Error rendering {REPORT_OUTPUTS[name]}: {e}")
+        else:
+            for name, fn, args in renders:
+                try:
+                    fn(*args)
+                    done.add(name)
+                except Exception as e:
+                    print(f"❌ Error rendering {REPORT_OUTPUTS[name]}: {e}")
+        
+        if "html" in failed:
+            print(f"⚠️ Skipping {REPORT_OUTPUTS['html']}: model evaluation failed")
+        elif "html" in stale:
+            print("🌐 Generating HTML report...")
+            self.generate_html_report(REPORT_OUTPUTS["html"])
+        if "demo_script" in stale:
+            print("📝 Generating demo script...")
+            self.generate_demo_script(REPORT_OUTPUTS["demo_script"])
+        
+        # Chỉ ghi key cho output đã tạo thành công; output lỗi sẽ được thử lại ở lần chạy sau
+        rendered = {name for name, _, _ in renders}
+        rebuilt = [name for name in stale if (name not in rendered or name in done) and name not in failed]
+        cache["keys"] = {**built_keys, **{name: keys[name] for name in rebuilt}}
+        cache["inputs"] = inputs
+        self._write_cache(cache)
+        return [REPORT_OUTPUTS[name] for name in rebuilt]
+
+
+def main():
+    """Generate all reports and demo materials"""
+    import argparse
+    import time
     
-    # Generate HTML report
-    print("🌐 Generating HTML report...")
-    generator.generate_html_report()
+    parser = argparse.ArgumentParser(description="Generate model reports and demo materials")
+    parser.add_argument("--force", action="store_true", help="Rebuild every output, ignoring the cache")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for rendering figures")
+    parser.add_argument("--profile", nargs="?", const="sample", default=None,
+                        help="Profile the run (sample, cprofile or pyinstrument); output goes to logs/")
+    args = parser.parse_args()
     
-    # Generate demo script
-    print("📝 Generating demo script...")
-    generator.generate_demo_script()
+    print("🚀 Generating AI Handwriting Recognition Reports...")
+    start = time.perf_counter()
+    rebuilt = ReportGenerator(load=False).build(force=args.force, workers=args.workers)
     
-    print("✅ All reports generated successfully!")
-    print("\n📁 Generated files:")
-    print("- model_report.json")
-    print("- model_report.html")
-    print("- confusion_matrix.png")
-    print("- sample_predictions.png")
-    print("- demo_script.md")
+    if rebuilt:
+        print(f"✅ {len(rebuilt)} report file(s) generated in {time.perf_counter() - start:.1f}s:")
+        for path in rebuilt:
+            print(f"- {path}")
+    else:
+        print(f"⏱️ Nothing to rebuild ({time.perf_counter() - start:.2f}s)")
 
 if __name__ == "__main__":
-    main()
+    from profiling import run_profiled
+    run_profiled(main, "report_generator")
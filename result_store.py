@@ -0,0 +1,211 @@
+"""
+Columnar Result Store for AI Handwriting Recognition System
+Prediction results for millions of images are appended column by column to
+flat binary files and read back through memory maps, so writers keep bounded
+memory and readers get random access without loading the whole run
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+
+from config import RESULT_STORE_CONFIG
+
+NUM_CLASSES = 10
+META_FILE = "meta.json"
+
+
+def _columns(num_classes):
+    """Tên cột -> (dtype, shape của một hàng)"""
+    return {
+        "ids": (np.dtype(np.int64), ()),
+        "labels": (np.dtype(np.int8), ()),
+        "confidences": (np.dtype(np.float32), ()),
+        "probabilities": (np.dtype(np.float16), (num_classes,)),
+    }
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_meta(directory, meta):
+    """Ghi meta.json qua file tạm + rename: số hàng trong meta là số hàng đã commit"""
+    path = os.path.join(directory, META_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def labels_and_confidences(probabilities):
+    """Nhãn và confidence từ xác suất; hàng lỗi (NaN) có nhãn -1 và confidence 0"""
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    failed = np.isnan(probabilities).any(axis=1)
+    safe = np.where(failed[:, None], 0.0, probabilities)
+    labels = np.argmax(safe, axis=1)
+    labels[failed] = -1
+    return labels, safe.max(axis=1)
+
+
+class ResultWriter:
+    """Ghi kết quả theo luồng:
+
+        with ResultWriter("exports/run_01") as writer:
+            for ids, probs in batches:
+                writer.append(ids, probs)
+
+    Mở lại một store đã có sẽ ghi tiếp sau hàng đã commit cuối cùng (trừ khi overwrite=True).
+    """
+
+    def __init__(self, directory, num_classes=NUM_CLASSES, flush_rows=None, overwrite=False):
+        self.directory = directory
+        self.flush_rows = flush_rows or RESULT_STORE_CONFIG["flush_rows"]
+        os.makedirs(directory, exist_ok=True)
+
+        if not overwrite and os.path.exists(os.path.join(directory, META_FILE)):
+            meta = _read_meta(directory)
+            num_classes = meta["num_classes"]
+            self.rows = meta["rows"]
+        else:
+            self.rows = 0
+        self.num_classes = num_classes
+        self.columns = _columns(num_classes)
+
+        # Bỏ phần đuôi chưa commit (vd. tiến trình trước bị dừng giữa lần flush)
+        self._files = {}
+        for name, (dtype, shape) in self.columns.items():
+            path = os.path.join(directory, f"{name}.bin")
+            f = open(path, "r+b" if os.path.exists(path) else "w+b")
+            f.truncate(self.rows * dtype.itemsize * int(np.prod(shape, dtype=np.int64)))
+            f.seek(0, os.SEEK_END)
+            self._files[name] = f
+
+        self._buffers = {name: np.empty((self.flush_rows,) + shape, dtype=dtype)
+                         for name, (dtype, shape) in self.columns.items()}
+        self._buffered = 0
+        self._write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, ids, probabilities, labels=None, confidences=None):
+        """Thêm một batch kết quả; labels/confidences được suy ra từ probabilities nếu không truyền"""
+        probabilities = np.asarray(probabilities)
+        if labels is None or confidences is None:
+            labels, confidences = labels_and_confidences(probabilities)
+        batch = {"ids": np.asarray(ids), "labels": np.asarray(labels),
+                 "confidences": np.asarray(confidences), "probabilities": probabilities}
+
+        start, n = 0, len(probabilities)
+        while start < n:
+            take = min(n - start, self.flush_rows - self._buffered)
+            for name, values in batch.items():
+                self._buffers[name][self._buffered:self._buffered + take] = values[start:start + take]
+            self._buffered += take
+            start += take
+            if self._buffered == self.flush_rows:
+                self.flush()
+
+    def flush(self):
+        """Ghi buffer xuống đĩa rồi mới cập nhật số hàng đã commit"""
+        if self._buffered:
+            for name, f in self._files.items():
+                self._buffers[name][:self._buffered].tofile(f)
+                f.flush()
+            self.rows += self._buffered
+            self._buffered = 0
+        self._write_meta()
+
+    def close(self):
+        if self._files:
+            self.flush()
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+    def _write_meta(self):
+        _write_meta(self.directory, {
+            "rows": self.rows,
+            "num_classes": self.num_classes,
+            "columns": {name: {"dtype": dtype.str, "shape": list(shape)}
+                        for name, (dtype, shape) in self.columns.items()}
+        })
+
+
+class ResultStore:
+    """Đọc store qua memory map: truy cập ngẫu nhiên theo hàng, duyệt theo block"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        meta = _read_meta(directory)
+        self.rows = meta["rows"]
+        self.num_classes = meta["num_classes"]
+        self.columns = {}
+        for name, (dtype, shape) in _columns(self.num_classes).items():
+            if self.rows == 0:
+                self.columns[name] = np.empty((0,) + shape, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype,
+                                               mode="r", shape=(self.rows,) + shape)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        """Các hàng tại index (int, slice hoặc mảng chỉ số) dưới dạng dict các cột"""
+        return {name: np.asarray(column[index]) for name, column in self.columns.items()}
+
+    def iter_blocks(self, block_rows=None):
+        """Duyệt (start, dict cột) theo từng block, bộ nhớ chỉ tỉ lệ với block_rows"""
+        block_rows = block_rows or RESULT_STORE_CONFIG["query_block_rows"]
+        for start in range(0, self.rows, block_rows):
+            yield start, self[start:start + block_rows]
+
+    def low_confidence(self, threshold=None, limit=None, block_rows=None):
+        """Các hàng có confidence < threshold (gồm cả ảnh lỗi), sắp xếp từ thấp nhất.
+
+        Chỉ cột confidences được quét; với `limit` chỉ giữ lại `limit` ứng viên tốt nhất.
+        """
+        threshold = RESULT_STORE_CONFIG["review_threshold"] if threshold is None else threshold
+        block_rows = block_rows or RESULT_STORE_CONFIG["query_block_rows"]
+        confidences = self.columns["confidences"]
+
+        indices = np.empty(0, dtype=np.int64)
+        values = np.empty(0, dtype=np.float32)
+        for start in range(0, self.rows, block_rows):
+            block = np.asarray(confidences[start:start + block_rows])
+            hits = np.flatnonzero(block < threshold)
+            indices = np.concatenate([indices, hits + start])
+            values = np.concatenate([values, block[hits]])
+            if limit is not None and len(indices) > limit:
+                keep = np.argpartition(values, limit - 1)[:limit]
+                indices, values = indices[keep], values[keep]
+
+        order = np.argsort(values, kind="stable")
+        return self[indices[order]]
+
+
+def main():
+    """Xem tóm tắt store hoặc xuất các hàng cần review"""
+    parser = argparse.ArgumentParser(description="Inspect a columnar prediction result store")
+    parser.add_argument("store", help="Result store directory")
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    print(f"🗄️ {len(store):,} rows, {store.num_classes} classes")
+    rows = store.low_confidence(args.threshold, args.limit)
+    print(f"\n{'Id':>12} {'Digit':>6} {'Confidence':>11}")
+    for id_, label, confidence in zip(rows["ids"], rows["labels"], rows["confidences"]):
+        print(f"{id_:>12} {label:>6} {confidence:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
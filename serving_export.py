@@ -0,0 +1,168 @@
+"""
+Serving Export for AI Handwriting Recognition System
+Wraps handwriting_model.h5 into a SavedModel whose signatures take raw encoded
+image bytes or uint8 pixel batches; decode, grayscale, blur + threshold (or
+invert), resize and normalize all run as batched TF ops inside the graph
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+import tensorflow as tf
+
+from config import SERVING_CONFIG, MODEL_CONFIG
+
+
+def _gaussian_kernel(ksize=5):
+    """Kernel 1D giống cv2.GaussianBlur với sigma=0 (sigma suy ra từ ksize)"""
+    sigma = 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+    x = np.arange(ksize, dtype=np.float64) - (ksize - 1) / 2
+    kernel = np.exp(-x ** 2 / (2 * sigma ** 2))
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+class ServingModule(tf.Module):
+    """Model + tiền xử lý trong graph.
+
+    mode="threshold": blur 5x5 + threshold nhị phân đảo màu + resize (như preprocess_image).
+    mode="plain": resize + đảo màu (như preprocess_pil_image cho canvas GUI).
+    """
+
+    def __init__(self, model, mode="threshold"):
+        super().__init__()
+        if mode not in ("threshold", "plain"):
+            raise ValueError(f"Unknown preprocessing mode: {mode}")
+        self.model = model
+        self.mode = mode
+        kernel = _gaussian_kernel()
+        self._kernel_x = tf.constant(kernel.reshape(1, 5, 1, 1))
+        self._kernel_y = tf.constant(kernel.reshape(5, 1, 1, 1))
+
+    def _normalize(self, gray):
+        """(N, H, W, 1) float trong [0, 255] -> (N, 28, 28, 1) float32 trong [0, 1]"""
+        if self.mode == "threshold":
+            # REFLECT của TF tương ứng BORDER_REFLECT_101 (mặc định của OpenCV)
+            padded = tf.pad(gray, [[0, 0], [2, 2], [2, 2], [0, 0]], mode="REFLECT")
+            blurred = tf.nn.conv2d(tf.nn.conv2d(padded, self._kernel_x, 1, "VALID"), self._kernel_y, 1, "VALID")
+            binary = tf.where(tf.round(blurred) > 128.0, 0.0, 255.0)
+            small = tf.image.resize(binary, (28, 28), method="bilinear")
+        else:
+            small = 255.0 - tf.image.resize(gray, (28, 28), method="bilinear")
+        # cv2.resize trên uint8 làm tròn kết quả; làm tròn tương tự để khớp đường xử lý Python
+        return tf.round(small) / 255.0
+
+    @tf.function(input_signature=[tf.TensorSpec([None], tf.string)])
+    def preprocess_bytes(self, images):
+        def decode_one(data):
+            gray = tf.cast(tf.io.decode_image(data, channels=1, expand_animations=False), tf.float32)
+            return self._normalize(gray[None])[0]
+        return tf.map_fn(decode_one, images, fn_output_signature=tf.TensorSpec([28, 28, 1], tf.float32))
+
+    @tf.function(input_signature=[tf.TensorSpec([None, None, None, None], tf.uint8)])
+    def preprocess_pixels(self, images):
+        """Batch uint8 (N, H, W, C) cùng kích thước; C=3/4 được coi là RGB(A)"""
+        pixels = tf.cast(images, tf.float32)
+        gray = tf.cond(tf.shape(pixels)[-1] == 1,
+                       lambda: pixels[..., :1],
+                       lambda: tf.image.rgb_to_grayscale(pixels[..., :3]))
+        return self._normalize(gray)
+
+    def _outputs(self, x):
+        probs = self.model(x, training=False)
+        return {
+            "probabilities": probs,
+            "digit": tf.argmax(probs, axis=1),
+            "confidence": tf.reduce_max(probs, axis=1)
+        }
+
+    @tf.function(input_signature=[tf.TensorSpec([None], tf.string, name="images")])
+    def serve_bytes(self, images):
+        return self._outputs(self.preprocess_bytes(images))
+
+    @tf.function(input_signature=[tf.TensorSpec([None, None, None, None], tf.uint8, name="pixels")])
+    def serve_pixels(self, pixels):
+        return self._outputs(self.preprocess_pixels(pixels))
+
+
+def export(model_path=None, export_dir=None, mode=None):
+    """Xuất SavedModel: chữ ký mặc định nhận bytes ảnh, 'serve_pixels' nhận mảng uint8"""
+    model_path = model_path or MODEL_CONFIG["model_file"]
+    export_dir = export_dir or SERVING_CONFIG["export_dir"]
+    mode = mode or SERVING_CONFIG["mode"]
+
+    model = tf.keras.models.load_model(model_path, compile=False)
+    module = ServingModule(model, mode)
+    tf.saved_model.save(module, export_dir, signatures={
+        "serving_default": module.serve_bytes,
+        "serve_pixels": module.serve_pixels
+    })
+    with open(os.path.join(export_dir, "serving_metadata.json"), "w") as f:
+        json.dump({"source_model": model_path, "mode": mode,
+                   "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, f, indent=2)
+    return export_dir
+
+
+class ServingPredictor:
+    """Client trong process cho artifact đã xuất"""
+
+    def __init__(self, export_dir=None):
+        self.loaded = tf.saved_model.load(export_dir or SERVING_CONFIG["export_dir"])
+        self._serve_bytes = self.loaded.signatures["serving_default"]
+        self._serve_pixels = self.loaded.signatures["serve_pixels"]
+
+    def predict_bytes(self, images):
+        """images: list bytes ảnh đã mã hóa (PNG/JPEG/BMP/GIF) -> dict các mảng numpy"""
+        outputs = self._serve_bytes(images=tf.constant(list(images)))
+        return {k: v.numpy() for k, v in outputs.items()}
+
+    def predict_pixels(self, pixels):
+        pixels = np.asarray(pixels, dtype=np.uint8)
+        if pixels.ndim == 3:
+            pixels = pixels[..., None]
+        outputs = self._serve_pixels(pixels=tf.constant(pixels))
+        return {k: v.numpy() for k, v in outputs.items()}
+
+
+def verify(export_dir, image_paths, mode=None):
+    """So sánh tiền xử lý trong graph với preprocess.py trên cùng các ảnh"""
+    from preprocess import preprocess_batch
+
+    mode = mode or SERVING_CONFIG["mode"]
+    predictor = ServingPredictor(export_dir)
+    data = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            data.append(f.read())
+    in_graph = predictor.loaded.preprocess_bytes(tf.constant(data)).numpy()
+    reference = preprocess_batch(image_paths, mode=mode)
+    outputs = predictor.predict_bytes(data)
+    return {
+        "images": len(image_paths),
+        "max_abs_diff": float(np.abs(in_graph - reference).max()),
+        "mean_abs_diff": float(np.abs(in_graph - reference).mean()),
+        "digits": outputs["digit"].tolist()
+    }
+
+
+def main():
+    """Xuất (và tùy chọn kiểm tra) artifact serving từ command line"""
+    parser = argparse.ArgumentParser(description="Export a SavedModel with in-graph preprocessing")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--export-dir", default=None)
+    parser.add_argument("--mode", choices=["threshold", "plain"], default=None)
+    parser.add_argument("--verify", nargs="*", metavar="IMAGE", help="Compare against preprocess.py on these images")
+    args = parser.parse_args()
+
+    export_dir = export(args.model, args.export_dir, args.mode)
+    print(f"📦 SavedModel exported to {export_dir}")
+    if args.verify:
+        result = verify(export_dir, args.verify, args.mode)
+        print(f"🔍 {result['images']} images: max |diff| vs preprocess.py = {result['max_abs_diff']:.4f}, "
+              f"mean = {result['mean_abs_diff']:.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Shadow Evaluation for AI Handwriting Recognition System
+Serves the primary model as usual while a candidate model receives a copy of
+production batches on a background thread, within a CPU budget (batches are
+sampled out when it is exceeded); keeps streaming agreement, confidence-delta
+and latency statistics, writes them to a report file periodically and
+promotes the candidate with an atomic swap
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import shutil
+import argparse
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from config import SHADOW_CONFIG, MODEL_CONFIG, ARTIFACTS_CONFIG
+
+NUM_CLASSES = 10
+
+
+class LatencyHistogram:
+    """Histogram latency (ms) với bin theo thang log: ước lượng percentile mà không lưu từng mẫu"""
+
+    def __init__(self, low_ms=0.01, high_ms=10000.0, bins=240):
+        self.edges = np.geomspace(low_ms, high_ms, bins + 1)
+        self.counts = np.zeros(bins + 2, dtype=np.int64)
+
+    def record(self, ms):
+        self.counts[np.searchsorted(self.edges, ms)] += 1
+
+    def percentile(self, q):
+        total = self.counts.sum()
+        if total == 0:
+            return None
+        index = int(np.searchsorted(np.cumsum(self.counts), q / 100 * total))
+        if index == 0:
+            return float(self.edges[0])
+        if index > len(self.edges) - 1:
+            return float(self.edges[-1])
+        return float(np.sqrt(self.edges[index - 1] * self.edges[index]))
+
+    def summary(self):
+        return {"count": int(self.counts.sum()), "p50_ms": self.percentile(50),
+                "p95_ms": self.percentile(95), "p99_ms": self.percentile(99)}
+
+
+class _Slot:
+    """Một model và hai bản đã compile: `serve` cho luồng request, `shadow` cho thread shadow.
+
+    BucketedPredictor dùng lại buffer padding nên mỗi vai cần một bản riêng.
+    """
+
+    def __init__(self, model, name, path=None):
+        from compiled_inference import compile_for_inference
+
+        self.model = getattr(model, "model", model)
+        self.name = name
+        self.path = path
+        self.serve = model if model is not self.model else compile_for_inference(self.model)
+        self.shadow = None
+
+    def shadow_predictor(self):
+        if self.shadow is None:
+            from compiled_inference import compile_for_inference
+            # BucketedPredictor mới với buffer riêng, hoặc chính model Keras (gọi song song được) khi bucket bị tắt
+            self.shadow = compile_for_inference(self.model)
+        return self.shadow
+
+
+class ShadowedPredictor:
+    """Gọi như model Keras: predictor(images, training=False) trả về kết quả của primary.
+
+    Mỗi batch được sao chép vào hàng đợi có giới hạn cho candidate; việc đưa vào hàng đợi không bao giờ
+    chặn. Ngân sách CPU là tỉ lệ thời gian (giây chạy candidate / giây thực) thread shadow được dùng,
+    quản lý bằng token bucket; batch không đủ token bị bỏ qua (lấy mẫu khi quá tải).
+    """
+
+    def __init__(self, primary, candidate, primary_path=None, candidate_path=None, cpu_budget=None,
+                 max_queue_batches=None):
+        cfg = SHADOW_CONFIG
+        self.cpu_budget = cfg["cpu_budget"] if cpu_budget is None else cpu_budget
+        self.burst = cfg["burst_seconds"] * self.cpu_budget
+        self._slots = (_Slot(primary, "primary", primary_path), _Slot(candidate, "candidate", candidate_path))
+        # Cả hai model đều có sẵn bản cho vai shadow để promote() không phải trace / warm-up gì thêm
+        self._slots[0].shadow_predictor()
+        self.input_shape = getattr(self._slots[0].model, "input_shape", None)
+
+        self._queue = queue.Queue(maxsize=max_queue_batches or cfg["max_queue_batches"])
+        self._lock = threading.Lock()
+        # Tăng mỗi lần promote: batch xếp hàng trước đó mang output của primary cũ và bị bỏ qua
+        self._generation = 0
+        self._tokens = self.burst
+        self._last_refill = time.perf_counter()
+        self._cost_per_image = self._estimate_cost()
+        self._reset_stats()
+
+        self._unsaved_batches = 0
+        self._saved_at = time.monotonic()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._shadow_loop, name="shadow-evaluator", daemon=True)
+        self._worker.start()
+        # Process thoát mà không gọi close() (GUI, CLI) vẫn ghi lại thống kê cuối cùng
+        atexit.register(self.close)
+
+    def _estimate_cost(self, batch_size=32):
+        """Thời gian chạy candidate cho mỗi ảnh, đo trên một batch thử để token bucket có ước lượng ngay từ đầu"""
+        candidate = self._slots[1]
+        probe = np.zeros((batch_size,) + tuple(candidate.model.input_shape[1:]), dtype=np.float32)
+        predictor = candidate.shadow_predictor()
+        np.asarray(predictor(probe, training=False))
+        start = time.perf_counter()
+        np.asarray(predictor(probe, training=False))
+        return (time.perf_counter() - start) / batch_size
+
+    def _reset_stats(self):
+        self.stats = {
+            "since": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "batches": 0,
+            "shadowed_batches": 0,
+            "skipped_budget": 0,
+            "dropped_queue": 0,
+            "images": 0,
+            "shadowed_images": 0,
+            "agreements": 0,
+            "confidence_delta_sum": 0.0,
+            "confidence_delta_abs_sum": 0.0,
+            "agreement_matrix": np.zeros((NUM_CLASSES, NUM_CLASSES), dtype=np.int64),
+            "confidence_delta_hist": np.zeros(20, dtype=np.int64)
+        }
+        self.primary_latency = LatencyHistogram()
+        self.candidate_latency = LatencyHistogram()
+
+    def reset_stats(self):
+        """Xóa thống kê (vd. sau batch warm-up); batch đang xếp hàng cho shadow cũng bị bỏ qua"""
+        with self._lock:
+            self._generation += 1
+            self._reset_stats()
+
+    @property
+    def primary(self):
+        return self._slots[0]
+
+    @property
+    def candidate(self):
+        return self._slots[1]
+
+    def __call__(self, images, training=False):
+        start = time.perf_counter()
+        outputs = self.serve(images)
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.observe(images, outputs, latency_ms)
+        return outputs
+
+    def serve(self, images, training=False):
+        """Chỉ chạy primary, không gửi bản sao cho shadow (caller tự gọi observe với output cuối cùng)"""
+        return self._slots[0].serve(images, training=False)
+
+    def observe(self, images, outputs, latency_ms):
+        """Gửi một batch production và output đã trả cho người dùng sang shadow.
+
+        Dùng khi output không chỉ do primary tạo ra (vd. cascade: ảnh dễ do model nhỏ trả lời),
+        để candidate vẫn nhận bản sao của mọi batch và được so với kết quả thực sự đã phục vụ.
+        """
+        self._offer(images, outputs, latency_ms)
+
+    def predict_proba(self, images):
+        return np.asarray(self(images))
+
+    def _admit(self, n):
+        """Token bucket: refill cpu_budget giây mỗi giây thực, mỗi batch tốn ước lượng thời gian chạy candidate"""
+        now = time.perf_counter()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.cpu_budget)
+        self._last_refill = now
+        cost = self._cost_per_image * n
+        if self._tokens < cost:
+            return False
+        self._tokens -= cost
+        return True
+
+    def _offer(self, images, outputs, latency_ms):
+        n = len(images)
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["images"] += n
+            self.primary_latency.record(latency_ms)
+            if not self._admit(n):
+                self.stats["skipped_budget"] += 1
+                return
+            generation = self._generation
+        try:
+            # Sao chép: caller có thể dùng lại buffer batch (vd. AsyncPredictor) hoặc sửa mảng output
+            self._queue.put_nowait((generation, np.array(images, dtype=np.float32),
+                                    np.array(outputs, dtype=np.float32)))
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped_queue"] += 1
+
+    def _shadow_loop(self):
+        while not self._stop.is_set():
+            try:
+                generation, images, primary_outputs = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                self._maybe_save_report()
+                continue
+            if generation != self._generation:
+                self._queue.task_done()
+                continue
+            candidate = self._slots[1]
+            start = time.perf_counter()
+            try:
+                candidate_probs = np.asarray(candidate.shadow_predictor()(images, training=False))
+                self._record(generation, primary_outputs, candidate_probs, time.perf_counter() - start,
+                             len(images))
+            except Exception as e:
+                print(f"⚠️ Shadow model failed on a batch: {e}")
+            finally:
+                self._queue.task_done()
+            self._maybe_save_report()
+
+    def _maybe_save_report(self):
+        """Ghi report khi đủ report_every_batches batch shadow mới hoặc đã quá report_interval_s giây"""
+        cfg = SHADOW_CONFIG
+        if not self._unsaved_batches:
+            return
+        if (self._unsaved_batches < cfg["report_every_batches"]
+                and time.monotonic() - self._saved_at < cfg["report_interval_s"]):
+            return
+        try:
+            self.save_report()
+        except OSError as e:
+            print(f"⚠️ Could not save shadow report: {e}")
+        self._unsaved_batches = 0
+        self._saved_at = time.monotonic()
+
+    def _record(self, generation, primary_probs, candidate_probs, elapsed, n):
+        primary_labels = np.argmax(primary_probs, axis=1)
+        candidate_labels = np.argmax(candidate_probs, axis=1)
+        delta = candidate_probs.max(axis=1) - primary_probs.max(axis=1)
+        with self._lock:
+            if generation != self._generation:
+                # promote() xảy ra trong lúc candidate đang chạy batch này
+                return
+            # EWMA chi phí mỗi ảnh cho token bucket
+            per_image = elapsed / n
+            self._cost_per_image = 0.9 * self._cost_per_image + 0.1 * per_image
+            stats = self.stats
+            stats["shadowed_batches"] += 1
+            stats["shadowed_images"] += n
+            stats["agreements"] += int((primary_labels == candidate_labels).sum())
+            stats["confidence_delta_sum"] += float(delta.sum())
+            stats["confidence_delta_abs_sum"] += float(np.abs(delta).sum())
+            np.add.at(stats["agreement_matrix"], (primary_labels, candidate_labels), 1)
+            stats["confidence_delta_hist"] += np.histogram(delta, bins=20, range=(-1.0, 1.0))[0]
+            self.candidate_latency.record(elapsed * 1000)
+        self._unsaved_batches += 1
+
+    def report(self):
+        """Ảnh chụp thống kê hiện tại dạng dict (an toàn khi gọi từ thread khác)"""
+        with self._lock:
+            stats = {k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in self.stats.items()}
+            primary_latency, candidate_latency = self.primary_latency.summary(), self.candidate_latency.summary()
+        shadowed = max(1, stats["shadowed_images"])
+        matrix = stats["agreement_matrix"]
+        return {
+            "primary": self.primary.name if self.primary.path is None else self.primary.path,
+            "candidate": self.candidate.name if self.candidate.path is None else self.candidate.path,
+            "since": stats["since"],
+            "batches": stats["batches"],
+            "shadowed_batches": stats["shadowed_batches"],
+            "sampled_fraction": stats["shadowed_batches"] / max(1, stats["batches"]),
+            "skipped_budget": stats["skipped_budget"],
+            "dropped_queue": stats["dropped_queue"],
+            "shadowed_images": stats["shadowed_images"],
+            "agreement_rate": stats["agreements"] / shadowed,
+            "per_class_agreement": {str(c): float(matrix[c, c] / matrix[c].sum())
+                                    for c in range(NUM_CLASSES) if matrix[c].sum()},
+            "confidence_delta_mean": stats["confidence_delta_sum"] / shadowed,
+            "confidence_delta_abs_mean": stats["confidence_delta_abs_sum"] / shadowed,
+            "confidence_delta_hist": stats["confidence_delta_hist"].tolist(),
+            "primary_latency": primary_latency,
+            "candidate_latency": candidate_latency
+        }
+
+    def save_report(self, path=None):
+        path = path or SHADOW_CONFIG["report_file"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def promote(self, persist=False):
+        """Đổi vai primary / candidate bằng một phép gán tuple.
+
+        Candidate đã được tải và warm-up từ trước nên không có khoảng dừng; request đang chạy vẫn dùng
+        model cũ, request sau đó dùng model mới. Model cũ trở thành shadow (gọi promote lần nữa để rollback).
+        Batch đã xếp hàng trước khi đổi vai bị bỏ qua để thống kê mới không so model với chính nó.
+
+        Với persist=True, file model đang phục vụ được sao lưu vào archive_dir rồi file của model mới
+        được chuyển (os.replace) vào MODEL_CONFIG["model_file"]; file candidate không còn nằm lại nên
+        lần khởi động sau không shadow model với bản sao của chính nó.
+        """
+        old_primary, new_primary = self._slots
+        with self._lock:
+            self._slots = (new_primary, old_primary)
+            new_primary.name, old_primary.name = "primary", "candidate"
+            self._generation += 1
+            self._reset_stats()
+
+        if persist and new_primary.path:
+            self._persist(old_primary, new_primary)
+        return new_primary
+
+    @staticmethod
+    def _persist(old_primary, new_primary):
+        target = MODEL_CONFIG["model_file"]
+        archive_dir = SHADOW_CONFIG["archive_dir"]
+        os.makedirs(archive_dir, exist_ok=True)
+        if os.path.exists(target):
+            # Giữ lại model cũ để promote lần nữa (rollback) vẫn persist được
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            previous = os.path.join(archive_dir, f"{stamp}_{os.path.basename(target)}")
+            shutil.copyfile(target, previous)
+            old_primary.path = previous
+        try:
+            os.replace(new_primary.path, target)
+        except OSError:
+            # Khác ổ đĩa: sao chép vào file tạm cạnh target rồi rename
+            tmp_path = target + ".tmp.h5"
+            shutil.copyfile(new_primary.path, tmp_path)
+            os.replace(tmp_path, target)
+            os.remove(new_primary.path)
+        new_primary.path = target
+
+        # Artifact suy luận được xuất từ model cũ: xóa manifest để load_inference_model đọc file .h5 mới
+        from artifacts import MANIFEST_FILE
+        manifest = os.path.join(ARTIFACTS_CONFIG["artifacts_dir"], MANIFEST_FILE)
+        if os.path.exists(manifest):
+            os.remove(manifest)
+            print(f"🗑️ Invalidated {manifest}; re-run artifacts.py to export the promoted model")
+
+    def flush(self):
+        """Chờ thread shadow xử lý hết các batch đang xếp hàng"""
+        self._queue.join()
+
+    def close(self):
+        """Dừng thread shadow và ghi report cuối cùng (gọi nhiều lần không sao)"""
+        if self._stop.is_set():
+            return
+        atexit.unregister(self.close)
+        self._stop.set()
+        self._worker.join()
+        if self.stats["batches"]:
+            try:
+                self.save_report()
+            except OSError as e:
+                print(f"⚠️ Could not save shadow report: {e}")
+
+
+def with_shadow(primary, primary_path=None):
+    """Bọc model đang phục vụ bằng ShadowedPredictor nếu được bật và có file candidate"""
+    cfg = SHADOW_CONFIG
+    if not cfg["enabled"] or isinstance(primary, ShadowedPredictor) or not os.path.exists(cfg["candidate_model"]):
+        return primary
+    import tensorflow as tf
+
+    candidate = tf.keras.models.load_model(cfg["candidate_model"], compile=False)
+    print(f"👥 Shadowing {cfg['candidate_model']} (CPU budget {cfg['cpu_budget']:.0%})")
+    return ShadowedPredictor(primary, candidate, primary_path, cfg["candidate_model"])
+
+
+def main():
+    """Phát lại MNIST test theo batch qua primary + shadow và in thống kê so sánh"""
+    import tensorflow as tf
+    from dataset_loader import load_mnist_cached
+    from compiled_inference import compile_for_inference
+
+    parser = argparse.ArgumentParser(description="Shadow-evaluate a candidate model against the primary")
+    parser.add_argument("--primary", default=MODEL_CONFIG["model_file"])
+    parser.add_argument("--candidate", default=SHADOW_CONFIG["candidate_model"])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--cpu-budget", type=float, default=None, help="Fraction of wall time for the shadow")
+    parser.add_argument("--promote", action="store_true",
+                        help="Promote and persist the candidate if agreement >= --min-agreement")
+    parser.add_argument("--min-agreement", type=float, default=SHADOW_CONFIG["min_agreement"])
+    args = parser.parse_args()
+
+    primary = compile_for_inference(tf.keras.models.load_model(args.primary, compile=False))
+    candidate = tf.keras.models.load_model(args.candidate, compile=False)
+    shadowed = ShadowedPredictor(primary, candidate, args.primary, args.candidate, cpu_budget=args.cpu_budget)
+
+    _, (x_test, _) = load_mnist_cached()
+    start = time.perf_counter()
+    for i in range(0, len(x_test), args.batch_size):
+        shadowed(np.asarray(x_test[i:i + args.batch_size]))
+    elapsed = time.perf_counter() - start
+    shadowed.flush()
+
+    report = shadowed.report()
+    print(f"⚡ {len(x_test)} images served in {elapsed:.2f}s, {report['sampled_fraction']:.0%} of batches shadowed "
+          f"({report['skipped_budget']} over budget, {report['dropped_queue']} dropped)")
+    print(f"🤝 Agreement {report['agreement_rate']:.2%} on {report['shadowed_images']} images, "
+          f"confidence delta {report['confidence_delta_mean']:+.4f} (|Δ| {report['confidence_delta_abs_mean']:.4f})")
+    for role in ("primary", "candidate"):
+        latency = report[f"{role}_latency"]
+        if latency["count"]:
+            print(f"⏱️ {role:<9} p50 {latency['p50_ms']:.2f} ms  p95 {latency['p95_ms']:.2f} ms  "
+                  f"p99 {latency['p99_ms']:.2f} ms per batch")
+    print(f"📄 Report saved to {shadowed.save_report()}")
+
+    if args.promote:
+        if report["agreement_rate"] >= args.min_agreement:
+            shadowed.promote(persist=True)
+            print(f"🚀 Promoted {args.candidate} -> {MODEL_CONFIG['model_file']}")
+        else:
+            print(f"⛔ Agreement below {args.min_agreement:.2%}, not promoting")
+    shadowed.close()
+
+
+if __name__ == "__main__":
+    main()
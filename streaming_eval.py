@@ -0,0 +1,171 @@
+"""
+Streaming Evaluation for AI Handwriting Recognition System
+Consumes (images, labels) chunks from a generator or tf.data pipeline and keeps
+running integer counts for the confusion matrix, per-class accuracy, top-k and
+calibration bins, so memory stays constant regardless of dataset size
+"""
+
+import time
+import argparse
+import numpy as np
+
+from config import EVALUATION_CONFIG, MODEL_CONFIG
+
+NUM_CLASSES = 10
+
+
+class StreamingMetrics:
+    """Bộ đếm tích lũy; cập nhật theo từng chunk cho kết quả giống hệt khi tính trên toàn bộ mảng"""
+
+    def __init__(self, num_classes=NUM_CLASSES, top_k=None, num_bins=None):
+        self.num_classes = num_classes
+        self.top_k = top_k or EVALUATION_CONFIG["top_k"]
+        self.num_bins = num_bins or EVALUATION_CONFIG["calibration_bins"]
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.top_k_correct = 0
+        self.loss_sum = 0.0
+        self.bin_counts = np.zeros(self.num_bins, dtype=np.int64)
+        self.bin_correct = np.zeros(self.num_bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(self.num_bins, dtype=np.float64)
+
+    def update(self, labels, probs):
+        """Cộng dồn một chunk: labels (N,) int, probs (N, num_classes)"""
+        labels = np.asarray(labels).astype(np.int64).reshape(-1)
+        probs = np.asarray(probs, dtype=np.float32)
+        predicted = np.argmax(probs, axis=1)
+        correct = predicted == labels
+
+        self.confusion += np.bincount(labels * self.num_classes + predicted,
+                                      minlength=self.num_classes ** 2).reshape(self.num_classes, self.num_classes)
+
+        # Giống tf.math.in_top_k: nhãn đúng nằm trong top-k nếu ít hơn k lớp có xác suất lớn hơn hẳn
+        label_probs = probs[np.arange(len(labels)), labels]
+        self.top_k_correct += int(np.sum((probs > label_probs[:, None]).sum(axis=1) < self.top_k))
+        self.loss_sum += float(-np.log(np.clip(label_probs.astype(np.float64), 1e-7, 1.0)).sum())
+
+        confidences = probs.max(axis=1)
+        bins = np.minimum((confidences * self.num_bins).astype(np.int64), self.num_bins - 1)
+        self.bin_counts += np.bincount(bins, minlength=self.num_bins)
+        self.bin_correct += np.bincount(bins, weights=correct, minlength=self.num_bins).astype(np.int64)
+        self.bin_confidence += np.bincount(bins, weights=confidences.astype(np.float64), minlength=self.num_bins)
+        return self
+
+    def merge(self, other):
+        """Gộp bộ đếm của một worker / shard khác"""
+        self.confusion += other.confusion
+        self.top_k_correct += other.top_k_correct
+        self.loss_sum += other.loss_sum
+        self.bin_counts += other.bin_counts
+        self.bin_correct += other.bin_correct
+        self.bin_confidence += other.bin_confidence
+        return self
+
+    @property
+    def total(self):
+        return int(self.confusion.sum())
+
+    @property
+    def correct(self):
+        return int(np.trace(self.confusion))
+
+    def per_class_accuracy(self):
+        support = self.confusion.sum(axis=1)
+        return {str(c): float(self.confusion[c, c] / support[c]) if support[c] else None
+                for c in range(self.num_classes)}
+
+    def calibration(self):
+        """Độ tin cậy trung bình vs accuracy trong từng bin confidence"""
+        rows = []
+        for b in range(self.num_bins):
+            count = int(self.bin_counts[b])
+            rows.append({
+                "bin_low": b / self.num_bins,
+                "bin_high": (b + 1) / self.num_bins,
+                "count": count,
+                "accuracy": float(self.bin_correct[b] / count) if count else None,
+                "mean_confidence": float(self.bin_confidence[b] / count) if count else None
+            })
+        return rows
+
+    def expected_calibration_error(self):
+        total = max(1, self.total)
+        gaps = np.abs(self.bin_correct - self.bin_confidence)
+        return float(gaps.sum() / total)
+
+    def result(self):
+        """Cùng các khóa với ReportGenerator.evaluate_model_performance, thêm per-class và calibration"""
+        total = max(1, self.total)
+        return {
+            "test_accuracy": self.correct / total,
+            "test_loss": self.loss_sum / total,
+            "top_k_accuracy": self.top_k_correct / total,
+            "total_test_samples": self.total,
+            "correct_predictions": self.correct,
+            "incorrect_predictions": self.total - self.correct,
+            "per_class_accuracy": self.per_class_accuracy(),
+            "expected_calibration_error": self.expected_calibration_error(),
+            "calibration": self.calibration()
+        }
+
+
+def iter_array_chunks(x, y, chunk_size=None):
+    """Chia mảng (kể cả np.memmap) thành các chunk; chỉ chunk hiện tại được đọc vào RAM"""
+    chunk_size = chunk_size or EVALUATION_CONFIG["chunk_size"]
+    for start in range(0, len(y), chunk_size):
+        yield np.asarray(x[start:start + chunk_size]), np.asarray(y[start:start + chunk_size])
+
+
+def evaluate_stream(model, stream, metrics=None, batch_size=None):
+    """Chạy model trên một luồng (images, labels) và trả về StreamingMetrics.
+
+    `stream` có thể là generator / iterable các cặp mảng hoặc một tf.data.Dataset đã batch.
+    """
+    batch_size = batch_size or EVALUATION_CONFIG["batch_size"]
+    metrics = metrics or StreamingMetrics()
+    if hasattr(stream, "as_numpy_iterator"):
+        stream = stream.as_numpy_iterator()
+
+    for images, labels in stream:
+        images = np.asarray(images, dtype=np.float32)
+        for start in range(0, len(images), batch_size):
+            probs = model(images[start:start + batch_size], training=False).numpy()
+            metrics.update(labels[start:start + batch_size], probs)
+    return metrics
+
+
+def evaluate_mnist(model, chunk_size=None):
+    """Đánh giá trên tập test MNIST đọc qua memory map"""
+    from dataset_loader import load_mnist_cached
+    _, (x_test, y_test) = load_mnist_cached()
+    return evaluate_stream(model, iter_array_chunks(x_test, y_test, chunk_size))
+
+
+def main():
+    """Đánh giá streaming từ command line"""
+    import tensorflow as tf
+
+    parser = argparse.ArgumentParser(description="Constant-memory model evaluation")
+    parser.add_argument("--model", default=MODEL_CONFIG["model_file"])
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--shards", default=None, help="Evaluate on an ingested shard directory instead of MNIST")
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    start = time.perf_counter()
+    if args.shards:
+        from ingest import ShardedDataset
+        metrics = evaluate_stream(model, ShardedDataset(args.shards).iter_chunks(args.chunk_size))
+    else:
+        metrics = evaluate_mnist(model, args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    result = metrics.result()
+    print(f"📊 {result['total_test_samples']:,} samples in {elapsed:.1f}s")
+    print(f"   Accuracy: {result['test_accuracy']:.4f}  Top-{metrics.top_k}: {result['top_k_accuracy']:.4f}  "
+          f"Loss: {result['test_loss']:.4f}  ECE: {result['expected_calibration_error']:.4f}")
+    for digit, accuracy in result["per_class_accuracy"].items():
+        print(f"   {digit}: {accuracy:.4f}" if accuracy is not None else f"   {digit}: -")
+
+
+if __name__ == "__main__":
+    main()
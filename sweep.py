@@ -0,0 +1,330 @@
+"""
+Hyperparameter Sweep Runner for AI Handwriting Recognition System
+Runs grid, random or successive-halving searches over build_model and
+augmentation settings in a process pool sharing one memory-mapped dataset
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from config import SWEEP_CONFIG, PATHS
+
+# Dữ liệu dùng chung trong mỗi worker (mmap, không copy)
+_DATA = None
+
+
+def grid_trials(search_space):
+    """Sinh toàn bộ tổ hợp của không gian tìm kiếm"""
+    keys = sorted(search_space)
+    combos = itertools.product(*(search_space[k] for k in keys))
+    return [{"trial_id": i, "params": dict(zip(keys, values))} for i, values in enumerate(combos)]
+
+
+def random_trials(search_space, num_trials, seed=None):
+    """Lấy mẫu ngẫu nhiên các tổ hợp (không trùng lặp) từ không gian tìm kiếm"""
+    trials = grid_trials(search_space)
+    rng = random.Random(seed)
+    rng.shuffle(trials)
+    trials = trials[:num_trials]
+    for i, trial in enumerate(trials):
+        trial["trial_id"] = i
+    return trials
+
+
+def _init_worker(threads, cache_dir):
+    """Giới hạn số thread của TensorFlow/BLAS trước khi import để các worker không tranh nhau core"""
+    global _DATA
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    from dataset_loader import load_mnist_cached
+    _DATA = load_mnist_cached(cache_dir, mmap=True)
+
+
+def _make_monitor(target_accuracy, reference_curve, min_epochs, start_time):
+    """Callback ghi lại đường val_accuracy, dừng khi đạt target hoặc tụt dưới median của các trial trước"""
+    import tensorflow as tf
+
+    class TrialMonitor(tf.keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.curve = []
+            self.time_to_target = None
+            self.stop_reason = "budget"
+
+        def on_epoch_end(self, epoch, logs=None):
+            val_accuracy = float((logs or {}).get("val_accuracy", 0.0))
+            self.curve.append(val_accuracy)
+
+            if val_accuracy >= target_accuracy:
+                self.time_to_target = time.perf_counter() - start_time
+                self.stop_reason = "target"
+                self.model.stop_training = True
+            elif (reference_curve is not None and epoch + 1 >= min_epochs
+                  and epoch < len(reference_curve) and val_accuracy < reference_curve[epoch]):
+                self.stop_reason = "median"
+                self.model.stop_training = True
+
+    return TrialMonitor()
+
+
+def _measure_latency(model, runs=50):
+    """Đo latency một ảnh (ms, median) qua forward pass trực tiếp"""
+    sample = np.asarray(_DATA[1][0][:1], dtype=np.float32)
+    model(sample, training=False)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model(sample, training=False)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def run_trial(trial, epochs, initial_epoch=0, reference_curve=None, checkpoint=None):
+    """Huấn luyện một trial trong worker và trả về kết quả dạng dict"""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    from model import build_model
+
+    cfg = SWEEP_CONFIG
+    params = trial["params"]
+    (x_train, y_train), (x_test, y_test) = _DATA
+
+    model = build_model(
+        dense_units=tuple(params["dense_units"]),
+        conv_dropout=params["conv_dropout"],
+        dense_dropout=params["dense_dropout"],
+        learning_rate=params["learning_rate"]
+    )
+    if initial_epoch and checkpoint and os.path.exists(checkpoint):
+        model.load_weights(checkpoint)
+
+    # ImageDataGenerator.flow chỉ đọc từng batch từ mmap, không nạp cả tập vào RAM
+    datagen = ImageDataGenerator(
+        rotation_range=params["rotation_range"],
+        width_shift_range=params["shift_range"],
+        height_shift_range=params["shift_range"],
+        zoom_range=params["zoom_range"],
+        fill_mode="nearest"
+    )
+    train_flow = datagen.flow(x_train, y_train, batch_size=128, seed=cfg["seed"])
+    val_flow = ImageDataGenerator().flow(x_test, y_test, batch_size=512, shuffle=False)
+
+    start = time.perf_counter()
+    monitor = _make_monitor(cfg["target_accuracy"], reference_curve, cfg["min_epochs"], start)
+    model.fit(
+        train_flow,
+        epochs=epochs,
+        initial_epoch=initial_epoch,
+        validation_data=val_flow,
+        callbacks=[monitor],
+        verbose=0
+    )
+    train_time = time.perf_counter() - start
+
+    if checkpoint:
+        model.save_weights(checkpoint)
+
+    return {
+        "trial_id": trial["trial_id"],
+        "params": params,
+        "curve": monitor.curve,
+        "best_val_accuracy": max(monitor.curve) if monitor.curve else 0.0,
+        "epochs_run": initial_epoch + len(monitor.curve),
+        "train_time_s": train_time,
+        "time_to_target_s": monitor.time_to_target,
+        "stop_reason": monitor.stop_reason,
+        "total_params": model.count_params(),
+        "latency_ms": _measure_latency(model),
+        "checkpoint": checkpoint
+    }
+
+
+def _median_curve(curves):
+    """Median theo từng epoch của các đường val_accuracy đã hoàn thành"""
+    if len(curves) < 3:
+        return None
+    length = max(len(c) for c in curves)
+    medians = []
+    for epoch in range(length):
+        values = [c[epoch] for c in curves if len(c) > epoch]
+        medians.append(float(np.median(values)))
+    return medians
+
+
+class SweepRunner:
+    def __init__(self, strategy=None, num_workers=None, threads_per_worker=None):
+        cfg = SWEEP_CONFIG
+        self.strategy = strategy or cfg["strategy"]
+        self.num_workers = num_workers or cfg["num_workers"]
+        self.threads_per_worker = threads_per_worker or cfg["threads_per_worker"]
+        self.checkpoint_dir = os.path.join(PATHS["models_dir"], "sweep")
+        self.results = []
+
+    def _executor(self):
+        # spawn để mỗi worker khởi tạo TensorFlow sạch với số thread đã cố định
+        return ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, SWEEP_CONFIG["cache_dir"])
+        )
+
+    def _checkpoint(self, trial):
+        return os.path.join(self.checkpoint_dir, f"trial_{trial['trial_id']}.weights.h5")
+
+    def build_trials(self):
+        cfg = SWEEP_CONFIG
+        if self.strategy == "grid":
+            return grid_trials(cfg["search_space"])
+        return random_trials(cfg["search_space"], cfg["num_trials"], cfg["seed"])
+
+    def run(self):
+        """Chạy sweep theo chiến lược đã chọn"""
+        from dataset_loader import cache_mnist
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        cache_mnist(SWEEP_CONFIG["cache_dir"])
+        trials = self.build_trials()
+        print(f"🔬 Running {len(trials)} trials ({self.strategy}) on {self.num_workers} workers "
+              f"x {self.threads_per_worker} threads")
+
+        if self.strategy == "halving":
+            self.results = self._run_halving(trials)
+        else:
+            self.results = self._run_median_stopping(trials)
+        return self.results
+
+    def _run_median_stopping(self, trials):
+        """Grid/random: trial mới nhận median curve của các trial đã xong để dừng sớm nếu tụt lại"""
+        results = []
+        pending = list(trials)
+        with self._executor() as executor:
+            running = set()
+            while pending or running:
+                while pending and len(running) < self.num_workers:
+                    trial = pending.pop(0)
+                    reference = _median_curve([r["curve"] for r in results])
+                    running.add(executor.submit(
+                        run_trial, trial, SWEEP_CONFIG["max_epochs"], 0, reference, self._checkpoint(trial)))
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results.append(result)
+                    print(f"  ✅ Trial {result['trial_id']}: val_acc={result['best_val_accuracy']:.4f} "
+                          f"({result['stop_reason']}, {result['epochs_run']} epochs)")
+        return results
+
+    def _run_halving(self, trials):
+        """Successive halving: mỗi rung chỉ giữ 1/eta trial tốt nhất và tăng số epoch"""
+        cfg = SWEEP_CONFIG
+        eta = cfg["halving_rate"]
+        num_rungs = max(1, int(np.log(len(trials)) / np.log(eta)) + 1)
+        budgets = [max(1, int(round(cfg["max_epochs"] / eta ** (num_rungs - 1 - i)))) for i in range(num_rungs)]
+
+        final = {}
+        survivors = list(trials)
+        epochs_done = {t["trial_id"]: 0 for t in trials}
+        with self._executor() as executor:
+            for rung, budget in enumerate(budgets):
+                futures = [
+                    executor.submit(run_trial, t, budget, epochs_done[t["trial_id"]], None, self._checkpoint(t))
+                    for t in survivors
+                ]
+                rung_results = [f.result() for f in futures]
+                for result in rung_results:
+                    previous = final.get(result["trial_id"])
+                    if previous:
+                        result["curve"] = previous["curve"] + result["curve"]
+                        result["best_val_accuracy"] = max(result["curve"])
+                        result["train_time_s"] += previous["train_time_s"]
+                    final[result["trial_id"]] = result
+                    epochs_done[result["trial_id"]] = result["epochs_run"]
+                print(f"  🪜 Rung {rung}: {len(survivors)} trials @ {budget} epochs")
+
+                if rung == len(budgets) - 1:
+                    break
+                # Trial đã đạt target thì không cần train tiếp
+                ranked = sorted(rung_results, key=lambda r: r["best_val_accuracy"], reverse=True)
+                keep = max(1, len(ranked) // eta)
+                kept_ids = {r["trial_id"] for r in ranked[:keep] if r["stop_reason"] != "target"}
+                for r in ranked[keep:]:
+                    final[r["trial_id"]]["stop_reason"] = "halved"
+                survivors = [t for t in survivors if t["trial_id"] in kept_ids]
+                if not survivors:
+                    break
+        return list(final.values())
+
+    def results_table(self, sort_by="best_val_accuracy", ascending=False):
+        """Bảng kết quả (pandas DataFrame) sắp xếp theo cột bất kỳ"""
+        import pandas as pd
+
+        rows = []
+        for r in self.results:
+            row = {k: v for k, v in r.items() if k not in ("params", "curve")}
+            row.update({k: str(v) if isinstance(v, (list, tuple)) else v for k, v in r["params"].items()})
+            rows.append(row)
+        return pd.DataFrame(rows).sort_values(sort_by, ascending=ascending).reset_index(drop=True)
+
+    def fastest_reaching_target(self, target_accuracy=None):
+        """Trial có latency thấp nhất trong số các trial đạt target accuracy"""
+        target = target_accuracy if target_accuracy is not None else SWEEP_CONFIG["target_accuracy"]
+        qualified = [r for r in self.results if r["best_val_accuracy"] >= target]
+        if not qualified:
+            return None
+        return min(qualified, key=lambda r: r["latency_ms"])
+
+    def save(self, output_dir=None):
+        """Lưu bảng CSV và kết quả JSON đầy đủ"""
+        output_dir = output_dir or PATHS["reports_dir"]
+        os.makedirs(output_dir, exist_ok=True)
+        csv_path = os.path.join(output_dir, "sweep_results.csv")
+        json_path = os.path.join(output_dir, "sweep_results.json")
+        self.results_table().to_csv(csv_path, index=False)
+        with open(json_path, "w") as f:
+            json.dump(self.results, f, indent=2, default=str)
+        return csv_path, json_path
+
+
+def main():
+    """Chạy sweep từ command line"""
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep")
+    parser.add_argument("--strategy", choices=["grid", "random", "halving"], default=SWEEP_CONFIG["strategy"])
+    parser.add_argument("--workers", type=int, default=SWEEP_CONFIG["num_workers"])
+    parser.add_argument("--threads", type=int, default=SWEEP_CONFIG["threads_per_worker"])
+    parser.add_argument("--sort-by", default="best_val_accuracy")
+    args = parser.parse_args()
+
+    runner = SweepRunner(args.strategy, args.workers, args.threads)
+    runner.run()
+
+    ascending = args.sort_by in ("latency_ms", "train_time_s", "time_to_target_s", "total_params")
+    print("\n📋 Sweep Results:")
+    print(runner.results_table(args.sort_by, ascending).to_string())
+
+    best = runner.fastest_reaching_target()
+    if best:
+        print(f"\n🏆 Fastest model reaching {SWEEP_CONFIG['target_accuracy']:.2%}: trial {best['trial_id']} "
+              f"({best['latency_ms']:.2f} ms, val_acc={best['best_val_accuracy']:.4f}) -> {best['checkpoint']}")
+    else:
+        print(f"\n⚠️ No trial reached {SWEEP_CONFIG['target_accuracy']:.2%}")
+
+    csv_path, _ = runner.save()
+    print(f"📁 Results saved to {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,13 @@ import matplotlib.pyplot as plt
 from dataset_loader import load_mnist
 from model import build_model, get_callbacks
 
-def train():
+def train(shards_dir=None):
     """Huấn luyện mô hình với các tính năng nâng cao"""
     print("🚀 Starting model training...")
     
+    if shards_dir:
+        return train_from_shards(shards_dir)
+    
     # Load data
     print("📊 Loading MNIST dataset...")
     (x_train, y_train), (x_test, y_test) = load_mnist()
@@ -52,6 +55,39 @@ def train():
     
     return model, history
 
+def train_from_shards(shards_dir, epochs=50, batch_size=128):
+    """Huấn luyện trực tiếp từ shard đã ingest (shards_dir/train, tùy chọn shards_dir/test).
+
+    Dữ liệu được đọc theo batch qua memory map và xáo trộn bằng chỉ số, không nạp hết vào RAM.
+    """
+    import os
+    from ingest import ShardedDataset
+    
+    print(f"📊 Streaming shards from {shards_dir}...")
+    train_data = ShardedDataset(os.path.join(shards_dir, "train"))
+    test_dir = os.path.join(shards_dir, "test")
+    if os.path.isdir(test_dir):
+        test_data = ShardedDataset(test_dir)
+        validation = test_data.as_tf_dataset(batch_size, shuffle=False)
+    else:
+        _, (x_test, y_test) = load_mnist()
+        validation = (x_test, y_test)
+    print(f"   {len(train_data):,} training samples")
+    
+    model = build_model()
+    history = model.fit(
+        train_data.as_tf_dataset(batch_size),
+        epochs=epochs,
+        validation_data=validation,
+        callbacks=get_callbacks(),
+        verbose=1
+    )
+    
+    model.save("handwriting_model.h5")
+    print("✅ Model saved successfully!")
+    plot_training_history(history)
+    return model, history
+
 def augment_data(x_train, y_train):
     """Data augmentation để cải thiện hiệu suất mô hình"""
     from tensorflow.keras.preprocessing.image import ImageDataGenerator
@@ -113,5 +149,45 @@ def plot_training_history(history):
     
     print("📊 Training history plot saved as 'training_history.png'")
 
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the handwriting recognition model")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of local data-parallel worker processes (see distributed_train.py)")
+    parser.add_argument("--scaling-report", action="store_true",
+                        help="With --workers N: also run a 1-worker baseline and print scaling efficiency")
+    parser.add_argument("--shards", default=None,
+                        help="Train from ingested shards (DIR/train, optional DIR/test) instead of MNIST")
+    parser.add_argument("--fine-tune", action="store_true",
+                        help="Fine-tune handwriting_model.h5 on relabeled active-learning samples + replay buffer")
+    parser.add_argument("--fast", action="store_true",
+                        help="Time-to-accuracy mode: LR range test, one-cycle schedule, stop at --target (see fast_train.py)")
+    parser.add_argument("--target", type=float, default=None,
+                        help="Target val_accuracy for --fast (default from FAST_TRAINING_CONFIG)")
+    parser.add_argument("--profile", nargs="?", const="sample", default=None,
+                        help="Profile the run (sample, cprofile or pyinstrument); output goes to logs/")
+    args = parser.parse_args()
+
+    if args.fine_tune:
+        from active_learning import fine_tune
+        fine_tune()
+    elif args.fast:
+        from fast_train import train_to_target
+        train_to_target(args.target, shards_dir=args.shards)
+    elif args.workers > 1:
+        from config import MODEL_CONFIG
+        from distributed_train import launch, add_scaling_metrics, print_scaling_report
+        epochs = MODEL_CONFIG["epochs"]
+        results = [launch(args.workers, epochs, save_path=MODEL_CONFIG["model_file"])]
+        if args.scaling_report:
+            # Baseline 1 worker chỉ chạy khi được yêu cầu: nó huấn luyện thêm một lượt đầy đủ
+            print("⏱️ Running 1-worker baseline for scaling efficiency...")
+            results.insert(0, launch(1, epochs))
+            results = add_scaling_metrics(results)
+        print_scaling_report(results)
+    else:
+        train(args.shards)
+
 if __name__ == "__main__":
-    train()
+    from profiling import run_profiled
+    run_profiled(main, "train")